@@ -0,0 +1 @@
+"""Нагрузочные замеры планировщика уведомлений."""
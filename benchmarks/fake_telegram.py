@@ -0,0 +1,104 @@
+"""
+Поддельный сервер Bot API для нагрузочных тестов.
+
+Отвечает на методы бота успешными ответами (с настраиваемой задержкой)
+и считает вызовы. Бот направляется на него через TELEGRAM_API_URL:
+
+    python -m benchmarks.fake_telegram --port 8081
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+        WEBHOOK_URL=http://127.0.0.1:8080 python main.py
+
+Статистика вызовов: GET /stats, сброс: POST /stats/reset.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+# Методы, возвращающие отправленное/измененное сообщение
+MESSAGE_METHODS = {'sendmessage', 'editmessagetext', 'editmessagereplymarkup'}
+
+
+class FakeTelegram:
+    """Состояние поддельного сервера: счетчики вызовов и идентификаторы сообщений."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.started = time.monotonic()
+        self._message_ids = itertools.count(1)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await self.read_params(request)
+        self.calls[method] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        return web.json_response({'ok': True, 'result': self.result(method.lower(), params)})
+
+    @staticmethod
+    async def read_params(request: web.Request) -> Dict[str, Any]:
+        # aiogram отправляет параметры как multipart/form-data, вложенные объекты - в JSON
+        if request.content_type == 'application/json':
+            return await request.json()
+        return dict(await request.post())
+
+    def result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getme':
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get('chat_id', 0))
+            return {
+                'message_id': int(params.get('message_id') or next(self._message_ids)),
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': params.get('text', ''),
+            }
+        return True
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'uptime': time.monotonic() - self.started,
+            'calls': dict(self.calls),
+        })
+
+    async def reset(self, request: web.Request) -> web.Response:
+        self.calls.clear()
+        self.started = time.monotonic()
+        return web.json_response({'ok': True})
+
+
+def create_app(latency: float = 0.0) -> web.Application:
+    fake = FakeTelegram(latency)
+    app = web.Application()
+    app.router.add_get('/stats', fake.stats)
+    app.router.add_post('/stats/reset', fake.reset)
+    app.router.add_route('*', '/bot{token}/{method}', fake.handle)
+    return app
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Поддельный сервер Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Задержка ответа на каждый вызов, секунды")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    web.run_app(create_app(args.latency), host=args.host, port=args.port, access_log=None)
@@ -0,0 +1,164 @@
+"""
+Нагрузочный тест приема апдейтов в режиме webhook.
+
+Отправляет сгенерированные апдейты (команды от множества пользователей)
+на webhook бота с заданной конкурентностью и сохраняет пропускную
+способность, перцентили задержки ответа и количество вызовов Bot API
+(по статистике benchmarks.fake_telegram):
+
+    python -m benchmarks.webhook_load --webhook-url http://127.0.0.1:8080/webhook \\
+        --api-url http://127.0.0.1:8081 --updates 10000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Команды и их доли среди апдейтов
+COMMANDS = [
+    ('/start', 10),
+    ('/list_medications', 30),
+    ('/schedule', 30),
+    ('/quick_schedule', 30),
+]
+
+# Базовый идентификатор пользователей теста, чтобы не пересекаться с настоящими
+USER_ID_BASE = 9_000_000_000
+
+
+def build_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    """Апдейт с текстовым сообщением-командой от пользователя."""
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'Load {user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': user,
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text)}],
+        },
+    }
+
+
+def generate_updates(count: int, users: int, rng: random.Random) -> List[Dict[str, Any]]:
+    commands = [command for command, _ in COMMANDS]
+    weights = [weight for _, weight in COMMANDS]
+    return [
+        build_update(update_id, USER_ID_BASE + rng.randrange(users), rng.choices(commands, weights)[0])
+        for update_id in range(1, count + 1)
+    ]
+
+
+def percentile(sorted_values: List[float], share: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+async def fetch_api_stats(session: aiohttp.ClientSession, api_url: Optional[str]) -> Dict[str, int]:
+    if not api_url:
+        return {}
+    async with session.get(api_url.rstrip('/') + '/stats') as response:
+        return (await response.json())['calls']
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    updates = generate_updates(args.updates, args.users, random.Random(args.seed))
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret} if args.secret else {}
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    queue = iter(updates)
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        calls_before = await fetch_api_stats(session, args.api_url)
+
+        async def sender():
+            # Как Telegram: каждое соединение ждет ответа перед следующим апдейтом
+            for update in queue:
+                started = time.perf_counter()
+                try:
+                    async with session.post(args.webhook_url, json=update, headers=headers) as response:
+                        await response.read()
+                        statuses[str(response.status)] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(sender() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        # Даем воркерам завершить вызовы Bot API, начатые после ответа
+        await asyncio.sleep(args.settle)
+        calls_after = await fetch_api_stats(session, args.api_url)
+
+    latencies.sort()
+    return {
+        'updates': len(updates),
+        'elapsed_seconds': elapsed,
+        'updates_per_second': len(updates) / elapsed if elapsed else 0.0,
+        'statuses': dict(statuses),
+        'latency_seconds': {
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+        'api_calls': {
+            method: calls_after.get(method, 0) - calls_before.get(method, 0)
+            for method in set(calls_before) | set(calls_after)
+        },
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    report = {
+        'started_at': datetime.now(pytz.UTC).isoformat(),
+        'python': platform.python_version(),
+        'parameters': vars(args),
+        'result': await run(args),
+    }
+    with open(args.output, 'w', encoding='utf-8') as output:
+        json.dump(report, output, ensure_ascii=False, indent=2)
+
+    result = report['result']
+    print(
+        f"✅ {result['updates']} апдейтов за {result['elapsed_seconds']:.1f} с "
+        f"({result['updates_per_second']:.0f}/с), p95 {result['latency_seconds']['p95'] * 1000:.0f} мс. "
+        f"Результаты сохранены в {args.output}"
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook бота")
+    parser.add_argument('--webhook-url', required=True, help="Адрес webhook бота, включая путь")
+    parser.add_argument('--secret', default='', help="WEBHOOK_SECRET бота")
+    parser.add_argument('--api-url', default='', help="Адрес benchmarks.fake_telegram для подсчета вызовов Bot API")
+    parser.add_argument('--updates', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000, help="Количество разных пользователей")
+    parser.add_argument('--concurrency', type=int, default=100,
+                        help="Одновременных соединений (как max_connections у Telegram)")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Пауза перед чтением статистики Bot API, секунды")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='webhook_load.json')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,52 @@
+"""Создание бота и диспетчера (общие для polling, webhook-воркеров и планировщика)."""
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import config
+from bot.middlewares.user_middleware import UserMiddleware
+from bot.middlewares.error_middleware import ErrorMiddleware
+from bot.middlewares.metrics_middleware import MetricsMiddleware
+from bot.middlewares.fsm_flush_middleware import FSMFlushMiddleware
+from bot.handlers import start, medication, schedule, edit_and_settings, simple_stats
+from bot.storage.database_storage import DatabaseStorage
+
+
+def create_bot() -> Bot:
+    """
+    Создать бота.
+    
+    Если задан TELEGRAM_API_URL, запросы идут на него вместо api.telegram.org
+    (локальный Bot API сервер или поддельный сервер для нагрузочных тестов).
+    """
+    if config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+        return Bot(token=config.BOT_TOKEN, session=session)
+    return Bot(token=config.BOT_TOKEN)
+
+
+def create_dispatcher() -> Dispatcher:
+    """Создать диспетчер с middleware и роутерами."""
+    # Состояния FSM хранятся в БД: переживают перезапуск и доступны всем процессам
+    dp = Dispatcher(storage=DatabaseStorage())
+    # Состояние сохраняется до ответа на апдейт: следующий может принять другой воркер webhook
+    dp.update.outer_middleware(FSMFlushMiddleware())
+    
+    # Регистрация middleware (порядок важен - последний добавленный выполняется первым)
+    dp.message.middleware(ErrorMiddleware())
+    dp.callback_query.middleware(ErrorMiddleware())
+    dp.message.middleware(UserMiddleware())
+    dp.callback_query.middleware(UserMiddleware())
+    
+    # Счетчики апдейтов по обработчикам (внутренний middleware: обработчик уже выбран)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(MetricsMiddleware())
+    
+    # Регистрация роутеров
+    dp.include_router(start.router)
+    dp.include_router(medication.router)
+    dp.include_router(schedule.router)
+    dp.include_router(edit_and_settings.router)
+    dp.include_router(simple_stats.router)
+    
+    return dp
@@ -15,7 +15,8 @@ from bot.keyboards.inline import (
     get_settings_keyboard,
     get_timezone_keyboard,
     get_cancel_keyboard,
-    get_frequency_keyboard
+    get_frequency_keyboard,
+    parse_page_callback
 )
 from bot.keyboards.reply import get_main_menu_keyboard
 from bot.utils.validators import validate_time, validate_dose, validate_interval
@@ -32,9 +33,9 @@ async def cmd_edit_medication(message: Message, state: FSMContext):
     """Начать процесс редактирования лекарства."""
     async with async_session_maker() as session:
         service = MedicationService(session)
-        medications = await service.get_user_medications(message.from_user.id)
+        page = await service.get_medications_page(message.from_user.id)
         
-        if not medications:
+        if not page.items:
             await message.answer(
                 "📋 У вас нет добавленных лекарств.\n\n"
                 "Сначала добавьте лекарство командой /add_medication",
@@ -45,10 +46,33 @@ async def cmd_edit_medication(message: Message, state: FSMContext):
         await state.set_state(EditMedicationStates.choosing_medication)
         await message.answer(
             "💊 Выберите лекарство для редактирования:",
-            reply_markup=get_medications_list_keyboard(medications, "edit")
+            reply_markup=get_medications_list_keyboard(page.items, "edit", page)
         )
 
 
+@router.callback_query(F.data.startswith("edit_page:"), EditMedicationStates.choosing_medication)
+async def paginate_medications_to_edit(callback: CallbackQuery):
+    """Показать соседнюю страницу лекарств для редактирования."""
+    try:
+        direction, cursor, _ = parse_page_callback(callback.data)
+        
+        async with async_session_maker() as session:
+            service = MedicationService(session)
+            page = await service.get_medications_page(callback.from_user.id, direction, cursor)
+        
+        if not page.items:
+            await callback.answer("Список изменился, начните заново: /edit_medication", show_alert=True)
+            return
+        
+        await callback.message.edit_reply_markup(
+            reply_markup=get_medications_list_keyboard(page.items, "edit", page)
+        )
+        await callback.answer()
+    
+    except Exception as e:
+        await callback.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
+
+
 @router.callback_query(F.data.startswith("edit_med:"), EditMedicationStates.choosing_medication)
 async def choose_medication_to_edit(callback: CallbackQuery, state: FSMContext):
     """Обработка выбора лекарства для редактирования."""
@@ -66,8 +90,7 @@ async def choose_medication_to_edit(callback: CallbackQuery, state: FSMContext):
         # Сохраняем ID лекарства в состоянии
         await state.update_data(medication_id=medication_id, medication_data={
             'name': medication.name,
-            'description': medication.description,
-            'schedules': medication.schedules
+            'description': medication.description
         })
         
         await state.set_state(EditMedicationStates.choosing_field)
@@ -299,8 +322,11 @@ async def confirm_edit(callback: CallbackQuery, state: FSMContext):
                             schedule.interval_days = None
                     elif field == "end_date":
                         schedule.end_date = new_value
+                    
+                    # Время приема или периодичность могли измениться
+                    await service.refresh_fire_times(medication)
 
-            await session.commit()
+            await service.save_medication(medication)
             
             await state.clear()
             await callback.message.edit_text(
@@ -402,8 +428,8 @@ async def save_timezone(user_id: int, timezone: str) -> bool:
     """Сохранение часового пояса пользователя."""
     try:
         async with async_session_maker() as session:
-            user_repo = UserRepository(session)
-            return await user_repo.update_timezone(user_id, timezone)
+            service = MedicationService(session)
+            return await service.update_timezone(user_id, timezone)
     except Exception:
         return False
 
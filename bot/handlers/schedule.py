@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 """Обработчики для управления лекарствами."""
+from datetime import date, datetime, timedelta
+import pytz
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -7,56 +9,69 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.keyboards.inline import (
     get_medications_list_keyboard,
-    get_delete_confirmation_keyboard
+    get_medications_page_keyboard,
+    get_delete_confirmation_keyboard,
+    parse_page_callback
 )
+from bot.utils.messages import answer_long, split_message
 from database.base import async_session_maker
+from database.repository import Page
 from services.medication_service import MedicationService
+from services.occurrences import expand
+from config import config
 
 router = Router()
 
 
+def format_medications_page(page: Page, offset: int) -> str:
+    """Текст страницы списка лекарств (нумерация продолжается с offset + 1)."""
+    text = "📋 Ваши лекарства:\n\n"
+    
+    for idx, medication in enumerate(page.items, offset + 1):
+        text += f"{idx}. 💊 {medication.name}\n"
+        
+        if medication.description:
+            text += f"   📝 {medication.description}\n"
+        
+        # Показываем расписания
+        if medication.schedules:
+            for schedule in medication.schedules:
+                time_str = schedule.time.strftime("%H:%M")
+                frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через каждые {schedule.interval_days} дней"
+                
+                text += f"   ⏰ {time_str} - {schedule.dose} препарата\n"
+                text += f"   📅 {frequency_text}\n"
+                
+                # Добавляем дату окончания приема
+                if schedule.end_date:
+                    text += f"   📅 Дата окончания приема: {schedule.end_date.strftime('%d.%m.%Y')}\n"
+                else:
+                    text += f"   📅 Дата окончания приема: бессрочно\n"
+        
+        text += "\n"
+    
+    return text
+
+
 @router.message(Command("list_medications"))
 @router.message(F.text == "📋 Список лекарств")
 async def cmd_list_medications(message: Message, db_user):
-    """Показать список всех лекарств пользователя."""
+    """Показать первую страницу списка лекарств пользователя."""
     try:
         async with async_session_maker() as session:
             service = MedicationService(session)
-            medications = await service.get_user_medications(db_user.id, active_only=True)
+            snapshot = await service.get_user_snapshot(db_user.id)
         
-        if not medications:
+        page = snapshot.page(config.MEDICATIONS_PAGE_SIZE)
+        if not page.items:
             await message.answer(
                 "📋 У вас пока нет добавленных лекарств.\n\n"
                 "Используйте /add_medication, чтобы добавить первое лекарство."
             )
             return
         
-        text = "📋 Ваши лекарства:\n\n"
-        
-        for idx, medication in enumerate(medications, 1):
-            text += f"{idx}. 💊 {medication.name}\n"
-            
-            if medication.description:
-                text += f"   📝 {medication.description}\n"
-            
-            # Показываем расписания
-            if medication.schedules:
-                for schedule in medication.schedules:
-                    time_str = schedule.time.strftime("%H:%M")
-                    frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через каждые {schedule.interval_days} дней"
-                    
-                    text += f"   ⏰ {time_str} - {schedule.dose} препарата\n"
-                    text += f"   📅 {frequency_text}\n"
-                    
-                    # Добавляем дату окончания приема
-                    if schedule.end_date:
-                        text += f"   📅 Дата окончания приема: {schedule.end_date.strftime('%d.%m.%Y')}\n"
-                    else:
-                        text += f"   📅 Дата окончания приема: бессрочно\n"
-            
-            text += "\n"
-        
-        await message.answer(text)
+        text = snapshot.render(('list', page.items[0].id, 0), lambda: format_medications_page(page, 0))
+        await answer_long(message, text, get_medications_page_keyboard(page, 0))
     
     except Exception as e:
         await message.answer(
@@ -65,6 +80,35 @@ async def cmd_list_medications(message: Message, db_user):
         )
 
 
+@router.callback_query(F.data.startswith("list_page:"))
+async def paginate_medications_list(callback: CallbackQuery, db_user):
+    """Показать соседнюю страницу списка лекарств."""
+    try:
+        direction, cursor, offset = parse_page_callback(callback.data)
+        
+        async with async_session_maker() as session:
+            service = MedicationService(session)
+            snapshot = await service.get_user_snapshot(db_user.id)
+        
+        page = snapshot.page(config.MEDICATIONS_PAGE_SIZE, direction, cursor)
+        if not page.items:
+            await callback.answer("Список изменился, откройте его заново: /list_medications", show_alert=True)
+            return
+        
+        text = snapshot.render(('list', page.items[0].id, offset), lambda: format_medications_page(page, offset))
+        reply_markup = get_medications_page_keyboard(page, offset)
+        if len(split_message(text)) == 1:
+            await callback.message.edit_text(text, reply_markup=reply_markup)
+        else:
+            # Страница не помещается в одно сообщение: отправляем ее частями
+            await callback.message.edit_reply_markup(reply_markup=None)
+            await answer_long(callback.message, text, reply_markup)
+        await callback.answer()
+    
+    except Exception as e:
+        await callback.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
+
+
 @router.message(Command("delete_medication"))
 @router.message(F.text == "🗑 Удалить лекарство")
 async def cmd_delete_medication(message: Message, db_user):
@@ -72,9 +116,9 @@ async def cmd_delete_medication(message: Message, db_user):
     try:
         async with async_session_maker() as session:
             service = MedicationService(session)
-            medications = await service.get_user_medications(db_user.id, active_only=True)
+            page = await service.get_medications_page(db_user.id)
         
-        if not medications:
+        if not page.items:
             await message.answer(
                 "📋 У вас нет лекарств для удаления.\n\n"
                 "Используйте /add_medication, чтобы добавить лекарство."
@@ -83,7 +127,7 @@ async def cmd_delete_medication(message: Message, db_user):
         
         await message.answer(
             "🗑 Выберите лекарство для удаления:",
-            reply_markup=get_medications_list_keyboard(medications)
+            reply_markup=get_medications_list_keyboard(page.items, page=page)
         )
     
     except Exception as e:
@@ -93,6 +137,29 @@ async def cmd_delete_medication(message: Message, db_user):
         )
 
 
+@router.callback_query(F.data.startswith("delete_page:"))
+async def paginate_medications_to_delete(callback: CallbackQuery, db_user):
+    """Показать соседнюю страницу лекарств для удаления."""
+    try:
+        direction, cursor, _ = parse_page_callback(callback.data)
+        
+        async with async_session_maker() as session:
+            service = MedicationService(session)
+            page = await service.get_medications_page(db_user.id, direction, cursor)
+        
+        if not page.items:
+            await callback.answer("Список изменился, начните заново: /delete_medication", show_alert=True)
+            return
+        
+        await callback.message.edit_reply_markup(
+            reply_markup=get_medications_list_keyboard(page.items, page=page)
+        )
+        await callback.answer()
+    
+    except Exception as e:
+        await callback.answer(f"❌ Ошибка: {str(e)}", show_alert=True)
+
+
 @router.callback_query(F.data.startswith("delete_med:"))
 async def select_medication_to_delete(callback: CallbackQuery):
     """Обработка выбора лекарства для удаления."""
@@ -172,6 +239,37 @@ async def cancel_delete(callback: CallbackQuery):
     await callback.answer("Отменено")
 
 
+def build_week_plan(medications: list, today: date) -> str:
+    """Текст плана приема на 7 дней начиная с today (без заголовка)."""
+    text = ""
+    
+    # Все приемы вычисляются одним развертыванием
+    entries = [(medication, schedule) for medication in medications for schedule in medication.schedules]
+    plan = expand([schedule for _, schedule in entries], today, 7).by_day()
+    
+    for days_ahead, day_indexes in enumerate(plan):
+        check_date = today + timedelta(days=days_ahead)
+        date_str = check_date.strftime("%d.%m.%Y")
+        day_name = ["Сегодня", "Завтра", "Послезавтра"][min(days_ahead, 2)] if days_ahead < 3 else ""
+        
+        if day_name:
+            text += f"🗓️ {day_name} ({date_str}):\n"
+        else:
+            text += f"🗓️ {date_str}:\n"
+        
+        for index in day_indexes:
+            medication, schedule = entries[index]
+            time_str = schedule.time.strftime("%H:%M")
+            text += f"   💊 {time_str} - {medication.name} ({schedule.dose} препарата)\n"
+        
+        if not day_indexes:
+            text += "   ✅ Нет приемов\n"
+        
+        text += "\n"
+    
+    return text
+
+
 @router.message(Command("schedule"))
 @router.message(F.text == "📅 План приема")
 async def cmd_schedule(message: Message, db_user):
@@ -179,78 +277,25 @@ async def cmd_schedule(message: Message, db_user):
     try:
         async with async_session_maker() as session:
             service = MedicationService(session)
-            medications = await service.get_user_medications(db_user.id, active_only=True)
+            snapshot = await service.get_user_snapshot(db_user.id)
         
-        if not medications:
+        if not snapshot.medications:
             await message.answer(
                 "📋 У вас пока нет добавленных лекарств.\n\n"
                 "Используйте /add_medication, чтобы добавить первое лекарство."
             )
             return
         
-        from datetime import date, datetime, timedelta
-        import pytz
-        
         # Получаем текущую дату в часовом поясе пользователя
         user_tz = pytz.timezone(db_user.timezone)
-        now_utc = datetime.now(pytz.UTC)
-        now_user_tz = now_utc.astimezone(user_tz)
-        today = now_user_tz.date()
+        today = datetime.now(pytz.UTC).astimezone(user_tz).date()
         
-        text = f"📅 План приема лекарств (часовой пояс: {db_user.timezone}):\n\n"
-        
-        # Показываем план на 7 дней вперед
-        for days_ahead in range(7):
-            check_date = today + timedelta(days=days_ahead)
-            date_str = check_date.strftime("%d.%m.%Y")
-            day_name = ["Сегодня", "Завтра", "Послезавтра"][min(days_ahead, 2)] if days_ahead < 3 else ""
-            
-            if day_name:
-                text += f"🗓️ {day_name} ({date_str}):\n"
-            else:
-                text += f"🗓️ {date_str}:\n"
-            
-            has_medications = False
-            
-            for medication in medications:
-                for schedule in medication.schedules:
-                    # Проверяем нужно ли принимать лекарство в этот день
-                    if _should_take_medication(schedule, check_date):
-                        time_str = schedule.time.strftime("%H:%M")
-                        text += f"   💊 {time_str} - {medication.name} ({schedule.dose} препарата)\n"
-                        has_medications = True
-            
-            if not has_medications:
-                text += "   ✅ Нет приемов\n"
-            
-            text += "\n"
-        
-        await message.answer(text)
+        # План зависит только от лекарств и даты: повторный просмотр не перестраивает его
+        plan = snapshot.render(('week_plan', today), lambda: build_week_plan(snapshot.medications, today))
+        await answer_long(message, f"📅 План приема лекарств (часовой пояс: {db_user.timezone}):\n\n{plan}")
     
     except Exception as e:
         await message.answer(
             f"❌ Произошла ошибка при получении плана: {str(e)}\n\n"
             "Попробуйте позже или обратитесь в поддержку."
         )
-
-
-def _should_take_medication(schedule, check_date):
-    """Проверить нужно ли принимать лекарство в указанную дату."""
-    # Проверяем дату окончания
-    if schedule.end_date and check_date > schedule.end_date:
-        return False
-    
-    # Проверяем дату начала
-    if check_date < schedule.start_date:
-        return False
-    
-    # Проверяем периодичность
-    if schedule.frequency_type == 'daily':
-        return True
-    
-    if schedule.frequency_type == 'interval' and schedule.interval_days:
-        days_since_start = (check_date - schedule.start_date).days
-        return days_since_start >= 0 and days_since_start % schedule.interval_days == 0
-    
-    return False
-
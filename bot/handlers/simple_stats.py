@@ -1,36 +1,34 @@
 # -*- coding: utf-8 -*-
 """Простые утилиты."""
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pytz
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
 
 from database.base import async_session_maker
+from bot.utils.messages import answer_long
+from services.adherence_service import AdherenceService
 from services.medication_service import MedicationService
+from services.occurrences import expand
 
 router = Router()
 
 
-def _should_take_today(schedule, target_date):
-    """Проверить нужно ли принимать лекарство в указанную дату."""
-    # Проверяем дату окончания
-    if schedule.end_date and target_date > schedule.end_date:
-        return False
-
-    # Проверяем дату начала
-    if target_date < schedule.start_date:
-        return False
-
-    # Проверяем периодичность
-    if schedule.frequency_type == 'daily':
-        return True
-
-    if schedule.frequency_type == 'interval' and schedule.interval_days:
-        days_since_start = (target_date - schedule.start_date).days
-        return days_since_start >= 0 and days_since_start % schedule.interval_days == 0
-
-    return False
+def build_today_plan(medications: list, today: date) -> str:
+    """Приемы на today (пустая строка - приемов нет)."""
+    entries = [(medication, schedule) for medication in medications for schedule in medication.schedules]
+    today_indexes = expand([schedule for _, schedule in entries], today, 1).by_day()[0]
+    
+    today_meds = []
+    for index in today_indexes:
+        medication, schedule = entries[index]
+        time_str = schedule.time.strftime("%H:%M")
+        frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через {schedule.interval_days} дня"
+        
+        today_meds.append(f"💊 {medication.name}\n⏰ {time_str} - {schedule.dose} препарата\n📅 {frequency_text}")
+    
+    return "\n\n".join(today_meds)
 
 
 @router.message(Command("quick_schedule"))
@@ -40,9 +38,9 @@ async def cmd_quick_schedule(message: Message, db_user):
     try:
         async with async_session_maker() as session:
             service = MedicationService(session)
-            medications = await service.get_user_medications(db_user.id, active_only=True)
+            snapshot = await service.get_user_snapshot(db_user.id)
         
-        if not medications:
+        if not snapshot.medications:
             await message.answer(
                 "📋 У вас нет добавленных лекарств.\n\n"
                 "Используйте /add_medication, чтобы добавить первое лекарство."
@@ -54,28 +52,60 @@ async def cmd_quick_schedule(message: Message, db_user):
         now_user_tz = now_utc.astimezone(user_tz)
         today = now_user_tz.date()
         
-        text = f"📅 План приема лекарств на {today.strftime('%d.%m.%Y')}:\n\n"
-        
-        today_meds = []
-        for medication in medications:
-            for schedule in medication.schedules:
-                if _should_take_today(schedule, today):
-                    time_str = schedule.time.strftime("%H:%M")
-                    frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через {schedule.interval_days} дня"
-                    
-                    today_meds.append(f"💊 {medication.name}\n⏰ {time_str} - {schedule.dose} препарата\n📅 {frequency_text}")
-        
-        if not today_meds:
+        plan = snapshot.render(('today_plan', today), lambda: build_today_plan(snapshot.medications, today))
+        if not plan:
             await message.answer(
                 f"✅ На {today.strftime('%d.%m.%Y')} нет запланированных приемов лекарств!\n"
                 "Отличная работа! 🎉"
             )
             return
         
-        text += "\n\n".join(today_meds)
+        text = f"📅 План приема лекарств на {today.strftime('%d.%m.%Y')}:\n\n{plan}"
         text += f"\n\n⏰ Текущее время: {now_user_tz.strftime('%H:%M')}"
         
-        await message.answer(text)
+        await answer_long(message, text)
+    
+    except Exception as e:
+        await message.answer(f"❌ Ошибка: {str(e)}")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, db_user):
+    """Статистика уведомлений за 7 и 30 дней."""
+    try:
+        today = datetime.now(pytz.UTC).astimezone(pytz.timezone(db_user.timezone)).date()
+        
+        async with async_session_maker() as session:
+            service = AdherenceService(session)
+            periods = [
+                (days, await service.get_summary(db_user.id, today, days))
+                for days in (7, 30)
+            ]
+        
+        if not periods[-1][1]:
+            await message.answer("📊 За последние 30 дней уведомлений не было.")
+            return
+        
+        text = "📊 Статистика уведомлений\n"
+        for days, summary in periods:
+            text += f"\n🗓 За {days} дней:\n"
+            if not summary:
+                text += "Уведомлений не было.\n"
+                continue
+            for item in summary:
+                text += (
+                    f"💊 {item.name}: отправлено {item.sent} из {item.scheduled} "
+                    f"({item.sent_percent:.0f}%)"
+                )
+                if item.failed:
+                    text += f", не доставлено {item.failed}"
+                if item.retried:
+                    text += f", с повторными попытками {item.retried}"
+                if item.sent:
+                    text += f", средняя задержка {item.average_lag_seconds:.0f} с"
+                text += "\n"
+        
+        await answer_long(message, text)
     
     except Exception as e:
         await message.answer(f"❌ Ошибка: {str(e)}")
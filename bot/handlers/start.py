@@ -16,6 +16,7 @@ async def cmd_start(message: Message):
         "• /list_medications - список ваших лекарств\n"
         "• /schedule - план приема на 7 дней\n"
         "• /quick_schedule - быстрый план на сегодня\n"
+        "• /stats - статистика уведомлений\n"
         "• /edit_medication - редактировать лекарство\n"
         "• /delete_medication - удалить лекарство\n"
         "• /settings - настройки часового пояса\n"
@@ -48,6 +49,7 @@ async def cmd_help(message: Message):
         "• /delete_medication - удалить лекарство\n"
         "• /schedule - план приема на 7 дней\n"
         "• /quick_schedule - быстрый план на сегодня\n"
+        "• /stats - статистика уведомлений\n"
         "• /settings - настройки часового пояса\n\n"
         "🔹 Уведомления:\n"
         "Бот проверяет расписание каждый час и отправляет уведомления "
@@ -1,7 +1,11 @@
 """Inline клавиатуры для бота."""
+from typing import Optional, Tuple
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from database.repository import Page
+from config import config
+
 
 def get_frequency_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора периодичности приема."""
@@ -34,8 +38,38 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return builder.as_markup()
 
 
-def get_medications_list_keyboard(medications: list, action: str = "delete") -> InlineKeyboardMarkup:
-    """Клавиатура со списком лекарств для удаления или редактирования."""
+def add_page_navigation(builder: InlineKeyboardBuilder, prefix: str, page: Page, offset: int = 0) -> None:
+    """
+    Добавить ряд кнопок «Назад»/«Далее» для страницы.
+    
+    Callback: <prefix>:<prev|next>:<ID лекарства на границе>:<номер первого
+    элемента нужной страницы>, поэтому обработчик загружает только ее.
+    """
+    if not page.items:
+        return
+    buttons = []
+    if page.has_prev:
+        buttons.append(InlineKeyboardButton(
+            text="◀️ Назад",
+            callback_data=f"{prefix}:prev:{page.items[0].id}:{max(offset - config.MEDICATIONS_PAGE_SIZE, 0)}"
+        ))
+    if page.has_next:
+        buttons.append(InlineKeyboardButton(
+            text="Далее ▶️",
+            callback_data=f"{prefix}:next:{page.items[-1].id}:{offset + len(page.items)}"
+        ))
+    if buttons:
+        builder.row(*buttons)
+
+
+def parse_page_callback(data: str) -> Tuple[str, int, int]:
+    """Разобрать callback кнопки страницы: (направление, курсор, номер первого элемента)."""
+    _, direction, cursor, offset = data.split(":")
+    return direction, int(cursor), int(offset)
+
+
+def get_medications_list_keyboard(medications: list, action: str = "delete", page: Optional[Page] = None) -> InlineKeyboardMarkup:
+    """Клавиатура со списком лекарств для удаления или редактирования (с кнопками страниц)."""
     builder = InlineKeyboardBuilder()
     for medication in medications:
         callback_data = f"{action}_med:{medication.id}"
@@ -46,10 +80,19 @@ def get_medications_list_keyboard(medications: list, action: str = "delete") ->
             )
         )
     builder.adjust(1)
+    if page is not None:
+        add_page_navigation(builder, f"{action}_page", page)
     builder.add(InlineKeyboardButton(text="❌ Отменить", callback_data="cancel"))
     return builder.as_markup()
 
 
+def get_medications_page_keyboard(page: Page, offset: int) -> Optional[InlineKeyboardMarkup]:
+    """Кнопки страниц списка лекарств (None - страница единственная)."""
+    builder = InlineKeyboardBuilder()
+    add_page_navigation(builder, "list_page", page, offset)
+    return builder.as_markup() if list(builder.buttons) else None
+
+
 def get_delete_confirmation_keyboard(medication_id: int) -> InlineKeyboardMarkup:
     """Клавиатура для подтверждения удаления лекарства."""
     builder = InlineKeyboardBuilder()
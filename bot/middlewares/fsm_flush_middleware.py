@@ -0,0 +1,31 @@
+"""Middleware для сохранения состояния FSM до ответа на апдейт."""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.storage.database_storage import DatabaseStorage
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """
+    Middleware, сохраняющий накопленные записи FSM апдейта в БД.
+    
+    Регистрируется на update после FSMContextMiddleware: запись
+    сохраняется под его блокировкой, до ответа Telegram, поэтому
+    следующий апдейт диалога видит ее в любом процессе.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Обработка события с сохранением состояния FSM."""
+        try:
+            return await handler(event, data)
+        finally:
+            storage = data.get("fsm_storage")
+            state = data.get("state")
+            if isinstance(storage, DatabaseStorage) and state is not None:
+                await storage.flush(state.key)
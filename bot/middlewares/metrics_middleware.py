@@ -0,0 +1,30 @@
+"""Middleware для подсчета апдейтов по обработчикам."""
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from monitoring.metrics import BOT_UPDATES_TOTAL
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """Middleware, считающий обработанные апдейты и ошибки для каждого обработчика."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Обработка события с подсчетом результата."""
+        # Внутренний middleware вызывается после выбора обработчика
+        handler_object = data.get("handler")
+        name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        
+        try:
+            result = await handler(event, data)
+        except Exception:
+            BOT_UPDATES_TOTAL.inc(handler=name, status='error')
+            raise
+        
+        BOT_UPDATES_TOTAL.inc(handler=name, status='ok')
+        return result
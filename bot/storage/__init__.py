@@ -0,0 +1 @@
+"""Bot FSM storage package."""
@@ -0,0 +1,294 @@
+"""Хранилище состояний FSM в PostgreSQL."""
+import asyncio
+import logging
+from datetime import datetime, date, time, timedelta
+from typing import Any, Collection, Dict, Mapping, Optional
+import pytz
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import case, literal, select, delete
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.dialects.postgresql import insert
+
+from database.base import async_session_maker
+from database.models import FSMState
+from database.repository import Fence, holds_lease
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value: Any) -> Any:
+    """Привести данные FSM к JSON, сохранив типы дат, времени и кортежей."""
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, time):
+        return {'__time__': value.isoformat()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    return value
+
+
+def _decode(value: Any) -> Any:
+    """Восстановить данные FSM, сохраненные через _encode."""
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            tag, payload = next(iter(value.items()))
+            if tag == '__datetime__':
+                return datetime.fromisoformat(payload)
+            if tag == '__date__':
+                return date.fromisoformat(payload)
+            if tag == '__time__':
+                return time.fromisoformat(payload)
+            if tag == '__tuple__':
+                return tuple(_decode(item) for item in payload)
+        return {key: _decode(item) for key, item in value.items()}
+    return value
+
+
+class DatabaseStorage(BaseStorage):
+    """
+    Хранилище FSM поверх таблицы fsm_states.
+
+    - Каждая запись живет ttl с момента последнего изменения, брошенные
+      диалоги удаляет purge_expired_states.
+    - Записи копятся в памяти, поэтому set_state + update_data внутри
+      одного шага стоят одну транзакцию. FSMFlushMiddleware сохраняет ключ
+      апдейта до ответа на апдейт: следующий апдейт диалога может принять
+      другой процесс (воркеры webhook). Записи вне апдейтов сбрасываются
+      раз в flush_interval. Несброшенные записи видны чтениям этого процесса.
+    - update_data сохраняет только переданные поля (слияние JSONB в upsert),
+      так что параллельные записи разных полей не затирают друг друга;
+      set_data заменяет данные целиком.
+    """
+
+    def __init__(
+        self,
+        ttl: timedelta = timedelta(hours=config.FSM_STATE_TTL_HOURS),
+        flush_interval: float = config.FSM_FLUSH_INTERVAL,
+        key_builder: Optional[KeyBuilder] = None
+    ):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._pending: Dict[str, Dict[str, Any]] = {}  # Ключ -> изменения: 'state', 'data' (замена) или 'patch' (слияние)
+        self._flushing: Dict[str, Dict[str, Any]] = {}  # Записи, которые сейчас сбрасываются в БД
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def _local(self, key: str, field: str) -> tuple[bool, Any]:
+        """Найти еще не сохраненное значение поля."""
+        for buffer in (self._pending, self._flushing):
+            record = buffer.get(key)
+            if record is not None and field in record:
+                return True, record[field]
+        return False, None
+
+    def _patches(self, key: str) -> list:
+        """Несохраненные частичные изменения данных, от старых к новым."""
+        patches = []
+        for buffer in (self._pending, self._flushing):
+            record = buffer.get(key)
+            if record is None:
+                continue
+            if 'patch' in record:
+                patches.insert(0, record['patch'])
+            if 'data' in record:
+                break
+        return patches
+
+    async def _read(self, key: str, field: str) -> Any:
+        if field == 'data':
+            # Данные - последняя замена (или строка БД) плюс накопленные слияния
+            patches = self._patches(key)
+            found, value = self._local(key, 'data')
+            if not found:
+                value = await self._load(key, 'data')
+            data = dict(value)
+            for patch in patches:
+                data.update(patch)
+            return data
+
+        found, value = self._local(key, field)
+        if found:
+            return value
+        return await self._load(key, field)
+
+    async def _load(self, key: str, field: str) -> Any:
+        column = FSMState.state if field == 'state' else FSMState.data
+        async with async_session_maker() as session:
+            result = await session.execute(
+                select(column).where(
+                    FSMState.key == key,
+                    FSMState.expires_at > datetime.now(pytz.UTC)
+                )
+            )
+            value = result.scalar_one_or_none()
+
+        if field == 'data':
+            return _decode(value) if value else {}
+        return value
+
+    def _write(self, key: str, field: str, value: Any) -> None:
+        record = self._pending.setdefault(key, {})
+        if field == 'patch':
+            if 'data' in record:
+                record['data'] = {**record['data'], **value}
+                return self._schedule_flush()
+            value = {**record.get('patch', {}), **value}
+        elif field == 'data':
+            record.pop('patch', None)
+        record[field] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self.flush_interval <= 0:
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self, key: Optional[StorageKey] = None) -> None:
+        """
+        Сохранить накопленные изменения одной транзакцией.
+
+        Args:
+            key: Сохранить только изменения этого ключа (None - все)
+        """
+        async with self._flush_lock:
+            await self._flush_pending(None if key is None else [self.key_builder.build(key)])
+
+    async def _flush_pending(self, keys: Optional[Collection[str]] = None) -> None:
+        if keys is None:
+            self._flushing, self._pending = self._pending, {}
+        else:
+            self._flushing = {key: self._pending.pop(key) for key in keys if key in self._pending}
+        if not self._flushing:
+            return
+
+        now = datetime.now(pytz.UTC)
+        expires_at = now + self.ttl
+
+        # Группируем по набору измененных полей: одна вставка на группу
+        groups: Dict[frozenset, list] = {}
+        cleared = []
+        for key, record in self._flushing.items():
+            if record.get('state', ...) is None and record.get('data', ...) == {}:
+                cleared.append(key)
+                continue
+            row = {'key': key, 'expires_at': expires_at}
+            if 'state' in record:
+                row['state'] = record['state']
+            if 'data' in record:
+                row['data'] = _encode(record['data'])
+            elif 'patch' in record:
+                row['patch'] = _encode(record['patch'])
+            groups.setdefault(frozenset(row), []).append(row)
+
+        try:
+            async with async_session_maker() as session:
+                if cleared:
+                    await session.execute(delete(FSMState).where(FSMState.key.in_(cleared)))
+
+                for fields, rows in groups.items():
+                    if 'patch' in fields:
+                        rows = [
+                            {('data' if field == 'patch' else field): value for field, value in row.items()}
+                            for row in rows
+                        ]
+                    statement = insert(FSMState).values(rows)
+                    set_ = {field: statement.excluded[field] for field in fields if field not in ('key', 'patch')}
+                    if 'patch' in fields:
+                        # Слияние с сохраненными данными, если запись еще не истекла
+                        set_['data'] = case(
+                            (FSMState.expires_at > now, FSMState.data.op('||')(statement.excluded.data)),
+                            else_=statement.excluded.data
+                        )
+                    # Истекшая, но еще не удаленная запись не должна воскрешать старые поля
+                    for column, empty in ((FSMState.state, None), (FSMState.data, literal({}, JSONB))):
+                        if column.key not in set_:
+                            set_[column.key] = case((FSMState.expires_at > now, column), else_=empty)
+                    await session.execute(
+                        statement.on_conflict_do_update(index_elements=['key'], set_=set_)
+                    )
+
+                await session.commit()
+
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+            # Возвращаем записи в очередь, не затирая более свежие изменения
+            for key, record in self._flushing.items():
+                newer = self._pending.pop(key, {})
+                self._pending[key] = record
+                for field, value in newer.items():
+                    self._write(key, field, value)
+            if self.flush_interval > 0:
+                self._flush_task = asyncio.create_task(self._delayed_flush())
+
+        finally:
+            self._flushing = {}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._write(
+            self.key_builder.build(key),
+            'state',
+            state.state if isinstance(state, State) else state
+        )
+        if self.flush_interval <= 0:
+            await self.flush(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(self.key_builder.build(key), 'state')
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        self._write(self.key_builder.build(key), 'data', dict(data))
+        if self.flush_interval <= 0:
+            await self.flush(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self._read(self.key_builder.build(key), 'data')
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        storage_key = self.key_builder.build(key)
+        self._write(storage_key, 'patch', dict(data))
+        if self.flush_interval <= 0:
+            await self.flush(key)
+        return await self._read(storage_key, 'data')
+
+    async def close(self) -> None:
+        if self._flush_task and not self._flush_task.done():
+            await self._flush_task
+        await self.flush()
+
+
+async def purge_expired_states(fence: Optional[Fence] = None) -> int:
+    """
+    Удалить брошенные диалоги с истекшим временем жизни.
+
+    Args:
+        fence: Fencing token лидера (ничего не удаляется, если лидерство потеряно)
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    conditions = [FSMState.expires_at <= datetime.now(pytz.UTC)]
+    if fence:
+        conditions.append(holds_lease(fence))
+
+    async with async_session_maker() as session:
+        result = await session.execute(
+            delete(FSMState).where(*conditions)
+        )
+        await session.commit()
+        return result.rowcount
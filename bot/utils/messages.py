@@ -0,0 +1,62 @@
+"""Отправка длинных сообщений."""
+from typing import List, Optional
+
+from aiogram.types import InlineKeyboardMarkup, Message
+
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбить текст на части не длиннее limit символов.
+
+    Текст режется по пустым строкам (между лекарствами, днями плана),
+    слишком длинный блок - по строкам, а слишком длинная строка - по limit.
+    Порядок частей совпадает с порядком текста.
+    """
+    chunks: List[str] = []
+    current = ""
+
+    def append(piece: str) -> None:
+        nonlocal current
+        if len(current) + len(piece) <= limit:
+            current += piece
+            return
+        if current:
+            chunks.append(current)
+            current = ""
+        while len(piece) > limit:
+            chunks.append(piece[:limit])
+            piece = piece[limit:]
+        current = piece
+
+    for block in text.split("\n\n"):
+        block += "\n\n"
+        if len(block) <= limit:
+            append(block)
+        else:
+            for line in block.splitlines(keepends=True):
+                append(line)
+
+    chunks.append(current)
+    chunks = [chunk.strip("\n") for chunk in chunks]
+    return [chunk for chunk in chunks if chunk] or [""]
+
+
+async def answer_long(
+    message: Message,
+    text: str,
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+) -> Message:
+    """
+    Ответить текстом любой длины: части отправляются по порядку,
+    клавиатура прикрепляется к последней.
+
+    Returns:
+        Message: Последнее отправленное сообщение
+    """
+    chunks = split_message(text)
+    for chunk in chunks[:-1]:
+        await message.answer(chunk)
+    return await message.answer(chunks[-1], reply_markup=reply_markup)
@@ -0,0 +1,175 @@
+"""
+Режим webhook: прием апдейтов несколькими процессами на одном порту.
+
+Главный процесс регистрирует webhook и запускает WEBHOOK_WORKERS
+процессов-воркеров. Каждый воркер поднимает свое aiohttp-приложение
+на WEBHOOK_HOST:WEBHOOK_PORT с SO_REUSEPORT, и ядро распределяет входящие
+соединения между ними. Планировщик в воркерах не запускается: он работает
+в главном процессе (RUN_SCHEDULER) или в отдельных scheduler.worker.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from typing import List
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import config
+from monitoring.metrics import WEBHOOK_IN_FLIGHT, WEBHOOK_REJECTED_TOTAL
+from monitoring.server import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# Пауза между проверками воркеров главным процессом, секунды
+SUPERVISE_INTERVAL = 1.0
+
+
+def concurrency_limit(limit: int, queue_timeout: float):
+    """
+    Middleware aiohttp: не больше limit апдейтов в обработке одновременно.
+    
+    Апдейт обрабатывается до ответа Telegram, поэтому ожидание в очереди
+    сдерживает и сам Telegram (он не шлет больше max_connections запросов
+    без ответа). Не дождавшийся очереди запрос получает 503 и будет
+    доставлен повторно.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    in_flight = 0
+    
+    @web.middleware
+    async def middleware(request: web.Request, handler):
+        nonlocal in_flight
+        try:
+            await asyncio.wait_for(semaphore.acquire(), queue_timeout)
+        except asyncio.TimeoutError:
+            WEBHOOK_REJECTED_TOTAL.inc()
+            return web.Response(status=503, text='Overloaded')
+        
+        in_flight += 1
+        WEBHOOK_IN_FLIGHT.set(in_flight)
+        try:
+            return await handler(request)
+        finally:
+            in_flight -= 1
+            WEBHOOK_IN_FLIGHT.set(in_flight)
+            semaphore.release()
+    
+    return middleware
+
+
+async def serve_worker(index: int) -> None:
+    """Принимать апдейты в процессе-воркере до сигнала остановки."""
+    # Импорт здесь: воркер создается методом spawn и собирает бота заново
+    from bot.app import create_bot, create_dispatcher
+    from database.change_feed import change_listener
+    
+    bot = create_bot()
+    dp = create_dispatcher()
+    
+    # Кэши воркера сбрасываются по изменениям, сделанным другими воркерами
+    change_listener.start(listen=config.CHANGE_FEED_ENABLED)
+    
+    app = web.Application(middlewares=[
+        concurrency_limit(config.WEBHOOK_MAX_CONCURRENCY, config.WEBHOOK_QUEUE_TIMEOUT)
+    ])
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=config.WEBHOOK_SECRET or None,
+        # Отвечаем Telegram после обработки: очередь ограничена семафором
+        handle_in_background=False
+    ).register(app, path=config.WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT, reuse_port=True).start()
+    
+    # У каждого воркера свой сервер метрик: METRICS_PORT занят главным процессом
+    metrics_runner = None
+    if config.METRICS_ENABLED:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT + 1 + index)
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    
+    logger.info(f"🚀 Воркер webhook {index} принимает апдейты на {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await change_listener.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await dp.storage.close()
+        await bot.session.close()
+
+
+def run_worker(index: int) -> None:
+    """Точка входа процесса-воркера."""
+    # force: при spawn повторно импортируется main.py, который уже настроил логирование
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - worker-{index} - %(name)s - %(levelname)s - %(message)s',
+        force=True
+    )
+    asyncio.run(serve_worker(index))
+
+
+def start_worker(index: int) -> multiprocessing.Process:
+    """Запустить процесс-воркер."""
+    # spawn, а не fork: воркер не должен наследовать event loop и соединения главного процесса
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_worker, args=(index,), name=f'webhook-worker-{index}'
+    )
+    process.start()
+    return process
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Зарегистрировать webhook и держать запущенными процессы-воркеры.
+    
+    Упавший воркер перезапускается. Работает до отмены или SIGTERM,
+    после чего воркеры останавливаются.
+    """
+    if not config.WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL не установлен для режима webhook")
+    
+    await bot.set_webhook(
+        url=config.WEBHOOK_URL.rstrip('/') + config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET or None,
+        max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=dp.resolve_used_update_types()
+    )
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGTERM, stop.set)
+    
+    workers: List[multiprocessing.Process] = [start_worker(index) for index in range(config.WEBHOOK_WORKERS)]
+    logger.info(f"🚀 Бот запущен в режиме webhook, воркеров: {len(workers)}")
+    
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), SUPERVISE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            
+            for index, process in enumerate(workers):
+                if not process.is_alive() and not stop.is_set():
+                    logger.error(f"Воркер webhook {index} завершился с кодом {process.exitcode}, перезапуск")
+                    workers[index] = start_worker(index)
+    finally:
+        loop.remove_signal_handler(signal.SIGTERM)
+        for process in workers:
+            if process.is_alive():
+                process.terminate()
+        for process in workers:
+            await asyncio.to_thread(process.join)
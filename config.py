@@ -1,5 +1,6 @@
 """Конфигурация приложения."""
 import os
+import socket
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -21,17 +22,135 @@ class Config:
     DB_PASSWORD: str = os.getenv('DB_PASSWORD', '')
     DB_NAME: str = os.getenv('DB_NAME', 'medicaltracker')
     
+    # Настройки пула соединений и драйвера
+    DB_ECHO: str = os.getenv('DB_ECHO', 'false')  # 'false', 'true' или 'debug'
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW: int = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', '30'))  # секунды ожидания свободного соединения
+    DB_POOL_RECYCLE: int = int(os.getenv('DB_POOL_RECYCLE', '1800'))  # секунды жизни соединения
+    DB_POOL_PRE_PING: bool = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))  # 0 для pgbouncer в режиме transaction
+    DB_POOL_SLOW_CHECKOUT_MS: int = int(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', '100'))  # порог предупреждения об ожидании
+    DB_SLOW_QUERY_MS: int = int(os.getenv('DB_SLOW_QUERY_MS', '500'))  # порог журнала медленных запросов
+    DB_SLOW_QUERY_EXPLAIN: bool = os.getenv('DB_SLOW_QUERY_EXPLAIN', 'false').lower() == 'true'  # добавлять EXPLAIN в журнал
+    
+    @property
+    def database_echo(self) -> bool | str:
+        """Уровень логирования SQL для create_async_engine."""
+        echo = self.DB_ECHO.lower()
+        if echo == 'debug':
+            return 'debug'
+        return echo == 'true'
+    
     @property
     def database_url(self) -> str:
         """Возвращает URL для подключения к PostgreSQL."""
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
     
+    # Хранилище состояний FSM
+    FSM_STATE_TTL_HOURS: int = int(os.getenv('FSM_STATE_TTL_HOURS', '24'))  # через сколько брошенный диалог удаляется
+    FSM_FLUSH_INTERVAL: float = float(os.getenv('FSM_FLUSH_INTERVAL', '0.5'))  # секунды, сброс записей вне апдейтов (записи апдейта сохраняются до ответа)
+    
+    # Кэш пользователей в памяти процесса
+    USER_CACHE_SIZE: int = int(os.getenv('USER_CACHE_SIZE', '10000'))
+    USER_CACHE_TTL: int = int(os.getenv('USER_CACHE_TTL', '300'))  # секунды
+    
+    # Кэш лекарств пользователя и готовых текстов плана
+    MEDICATION_CACHE_SIZE: int = int(os.getenv('MEDICATION_CACHE_SIZE', '10000'))  # пользователей
+    MEDICATION_CACHE_TTL: int = int(os.getenv('MEDICATION_CACHE_TTL', '300'))  # секунды, страховка на случай потерянных событий
+    
+    # Канал изменений (LISTEN/NOTIFY): записи рассылают события, каждый процесс сбрасывает по ним свои кэши
+    CHANGE_FEED_ENABLED: bool = os.getenv('CHANGE_FEED_ENABLED', 'true').lower() == 'true'
+    CHANGE_FEED_CHANNEL: str = os.getenv('CHANGE_FEED_CHANNEL', 'medtracker_changes')
+    CHANGE_FEED_PING_SECONDS: float = float(os.getenv('CHANGE_FEED_PING_SECONDS', '30'))  # проверка соединения слушателя
+    CHANGE_FEED_RECONNECT_SECONDS: float = float(os.getenv('CHANGE_FEED_RECONNECT_SECONDS', '5'))
+    
     # Настройки планировщика
     SCHEDULER_TIMEZONE: str = os.getenv('SCHEDULER_TIMEZONE', 'UTC')
     
+    # Шардирование планировщика между процессами: расписание относится к шарду id % SCHEDULER_SHARDS.
+    # Количество шардов должно совпадать во всех процессах
+    SCHEDULER_SHARDS: int = int(os.getenv('SCHEDULER_SHARDS', '16'))
+    SHARD_LEASE_SECONDS: float = float(os.getenv('SHARD_LEASE_SECONDS', '30'))  # через сколько шарды упавшего процесса освобождаются
+    SHARD_RENEW_SECONDS: float = float(os.getenv('SHARD_RENEW_SECONDS', '10'))  # период продления аренд и перераспределения
+    INSTANCE_ID: str = os.getenv('INSTANCE_ID', f'{socket.gethostname()}-{os.getpid()}')
+    # Выбор лидера для одиночных задач (очистка FSM): standby-процесс
+    # становится лидером не позже чем через LEADER_LEASE_SECONDS после падения лидера
+    LEADER_LEASE_SECONDS: float = float(os.getenv('LEADER_LEASE_SECONDS', '15'))
+    LEADER_RENEW_SECONDS: float = float(os.getenv('LEADER_RENEW_SECONDS', '5'))  # период heartbeat лидера и попыток standby
+    RUN_SCHEDULER: bool = os.getenv('RUN_SCHEDULER', 'true').lower() == 'true'  # запускать планировщик в процессе бота
+    
+    # Горизонт (минуты), на который движок расписаний держит срабатывания в памяти
+    ENGINE_HORIZON_MINUTES: int = int(os.getenv('ENGINE_HORIZON_MINUTES', '60'))
+    # Интервал (минуты) сверки движка с таблицей medication_schedules
+    ENGINE_RECONCILE_MINUTES: int = int(os.getenv('ENGINE_RECONCILE_MINUTES', '5'))
+    # То же при CHANGE_FEED_ENABLED=false: изменения из других процессов попадают в движок только со сверкой
+    ENGINE_RECONCILE_MINUTES_WITHOUT_FEED: int = int(os.getenv('ENGINE_RECONCILE_MINUTES_WITHOUT_FEED', '1'))
+    
+    # Настройки рассылки уведомлений
+    DISPATCH_WORKERS: int = int(os.getenv('DISPATCH_WORKERS', '16'))
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # сообщений в секунду
+    TELEGRAM_PER_CHAT_RATE: float = float(os.getenv('TELEGRAM_PER_CHAT_RATE', '1'))  # сообщений в секунду на чат
+    
+    # Насколько поздно (минуты) еще можно отправить пропущенное напоминание
+    # (перезапуск, деплой, зависание event loop); более старые пропускаются
+    NOTIFICATION_MAX_LATENESS_MINUTES: int = int(os.getenv('NOTIFICATION_MAX_LATENESS_MINUTES', '30'))
+    # Интервал (минуты) полного прохода по наступившим срабатываниям: подстраховка движка
+    # расписаний, который сам ставит уведомления в очередь и сверяется с БД
+    CATCH_UP_INTERVAL_MINUTES: int = int(os.getenv('CATCH_UP_INTERVAL_MINUTES', '15'))
+    
+    # Лекарств на странице списка и клавиатур выбора (страницы листаются кнопками)
+    MEDICATIONS_PAGE_SIZE: int = int(os.getenv('MEDICATIONS_PAGE_SIZE', '10'))
+    
+    # Максимум строк в одном многострочном INSERT логов уведомлений
+    NOTIFICATION_LOG_BATCH_SIZE: int = int(os.getenv('NOTIFICATION_LOG_BATCH_SIZE', '1000'))
+    
+    # Прием апдейтов: 'polling' или 'webhook'
+    BOT_MODE: str = os.getenv('BOT_MODE', 'polling')
+    # Адрес Bot API (пусто - api.telegram.org); для нагрузочных тестов - benchmarks.fake_telegram
+    TELEGRAM_API_URL: str = os.getenv('TELEGRAM_API_URL', '')
+    # Режим webhook: публичный адрес, на который Telegram отправляет апдейты (без пути)
+    WEBHOOK_URL: str = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH: str = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET: str = os.getenv('WEBHOOK_SECRET', '')  # проверяется по заголовку X-Telegram-Bot-Api-Secret-Token
+    WEBHOOK_HOST: str = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT: int = int(os.getenv('WEBHOOK_PORT', '8080'))
+    # Процессы-воркеры слушают один порт (SO_REUSEPORT), ядро распределяет между ними соединения
+    WEBHOOK_WORKERS: int = int(os.getenv('WEBHOOK_WORKERS', '2'))
+    # Апдейтов, обрабатываемых воркером одновременно; остальные ждут до WEBHOOK_QUEUE_TIMEOUT
+    # секунд, затем получают 503, и Telegram доставляет их повторно
+    WEBHOOK_MAX_CONCURRENCY: int = int(os.getenv('WEBHOOK_MAX_CONCURRENCY', '50'))
+    WEBHOOK_QUEUE_TIMEOUT: float = float(os.getenv('WEBHOOK_QUEUE_TIMEOUT', '10'))
+    # Одновременных соединений Telegram к webhook (1-100, передается в setWebhook)
+    WEBHOOK_MAX_CONNECTIONS: int = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+    
+    # Сервер метрик Prometheus (только локальный доступ по умолчанию)
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_HOST: str = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT: int = int(os.getenv('METRICS_PORT', '9100'))
+    # Порты метрик процессов scheduler.worker (METRICS_PORT и следующие за ним заняты
+    # ботом и его воркерами webhook): процесс занимает первый свободный из
+    # WORKER_METRICS_PORTS портов начиная с WORKER_METRICS_PORT (--metrics-port, 0 - без метрик)
+    WORKER_METRICS_PORT: int = int(os.getenv('WORKER_METRICS_PORT', '9200'))
+    WORKER_METRICS_PORTS: int = int(os.getenv('WORKER_METRICS_PORTS', '10'))
+    
+    # Секции notification_logs по месяцам: сколько месяцев создавать заранее,
+    # сколько прошлых месяцев хранить и куда выгружать удаляемые секции (пусто - без архива)
+    NOTIFICATION_LOG_PARTITIONS_AHEAD: int = int(os.getenv('NOTIFICATION_LOG_PARTITIONS_AHEAD', '2'))
+    NOTIFICATION_LOG_RETENTION_MONTHS: int = int(os.getenv('NOTIFICATION_LOG_RETENTION_MONTHS', '12'))
+    NOTIFICATION_LOG_ARCHIVE_DIR: str = os.getenv('NOTIFICATION_LOG_ARCHIVE_DIR', '')
+    
     # Настройки повторных попыток
     MAX_RETRY_ATTEMPTS: int = int(os.getenv('MAX_RETRY_ATTEMPTS', '5'))
     RETRY_INTERVALS: list[int] = [5, 15, 30, 60, 120]  # минуты
+    
+    # Обработчики очереди исходящих уведомлений (notification_outbox)
+    OUTBOX_BATCH_SIZE: int = int(os.getenv('OUTBOX_BATCH_SIZE', '50'))  # уведомлений в одной захваченной пачке
+    # Аренда захваченной пачки (секунды): должна быть больше времени ее отправки,
+    # после падения обработчика пачка вернется в очередь через это время
+    OUTBOX_CLAIM_SECONDS: float = float(os.getenv('OUTBOX_CLAIM_SECONDS', '120'))
+    OUTBOX_WORKERS: int = int(os.getenv('OUTBOX_WORKERS', '4'))  # конкурентных обработчиков в процессе (0 - не отправлять)
+    OUTBOX_POLL_SECONDS: float = float(os.getenv('OUTBOX_POLL_SECONDS', '1'))  # опрос очереди, если новых уведомлений не было
 
 
 config = Config()
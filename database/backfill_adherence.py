@@ -0,0 +1,66 @@
+"""
+Пересчет дневной сводки adherence_daily из notification_logs.
+
+Нужен после появления сводки (логи, записанные раньше, в ней не учтены)
+и для сверки с логами. Период обрабатывается помесячно, каждый месяц -
+отдельной транзакцией, чтобы не держать блокировки на весь период.
+
+    python -m database.backfill_adherence [--since ГГГГ-ММ-ДД] [--until ГГГГ-ММ-ДД]
+"""
+import argparse
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from config import config
+from database.base import async_session_maker
+from database.partitions import add_months, month_start
+from database.repository import AdherenceRepository
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def backfill(since: date, until: date) -> int:
+    """
+    Пересчитать сводку за период [since, until].
+
+    Returns:
+        int: Количество записанных строк сводки
+    """
+    total = 0
+    start = since
+    while start <= until:
+        end = min(add_months(month_start(start), 1) - timedelta(days=1), until)
+        async with async_session_maker() as session:
+            rows = await AdherenceRepository(session).rebuild(start, end)
+            await session.commit()
+        logger.info(f"Сводка за {start.isoformat()} - {end.isoformat()}: {rows} строк")
+        total += rows
+        start = end + timedelta(days=1)
+    return total
+
+
+if __name__ == "__main__":
+    today = date.today()
+    parser = argparse.ArgumentParser(description="Пересчет сводки adherence_daily из логов уведомлений")
+    parser.add_argument(
+        '--since',
+        type=date.fromisoformat,
+        # По умолчанию - с самого старого месяца, который хранится в логах
+        default=add_months(month_start(today), -config.NOTIFICATION_LOG_RETENTION_MONTHS),
+        help="Первый день периода (по умолчанию - начало срока хранения логов)"
+    )
+    parser.add_argument(
+        '--until',
+        type=date.fromisoformat,
+        default=today + timedelta(days=1),
+        help="Последний день периода (по умолчанию - завтра)"
+    )
+    args = parser.parse_args()
+
+    rows = asyncio.run(backfill(args.since, args.until))
+    logger.info(f"✅ Сводка пересчитана: {rows} строк")
@@ -1,16 +1,33 @@
 """Базовые классы для работы с базой данных."""
+from typing import Any, Dict
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from config import config
+from database.pool import InstrumentedAsyncQueuePool
+from database import query_stats
 
 
 # Создаем async engine
 engine = create_async_engine(
     config.database_url,
-    echo=True,  # Логирование SQL запросов (можно отключить в продакшене)
+    echo=config.database_echo,  # Логирование SQL запросов (в продакшене выключено)
     future=True,
+    poolclass=InstrumentedAsyncQueuePool,
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE,
+    pool_pre_ping=config.DB_POOL_PRE_PING,
+    connect_args={
+        # Кэш подготовленных выражений asyncpg и SQLAlchemy-адаптера
+        'statement_cache_size': config.DB_STATEMENT_CACHE_SIZE,
+        'prepared_statement_cache_size': config.DB_STATEMENT_CACHE_SIZE,
+    },
 )
 
+# Статистика запросов по методам репозиториев и журнал медленных запросов
+query_stats.install(engine.sync_engine)
+
 # Создаем session factory
 async_session_maker = async_sessionmaker(
     engine,
@@ -29,3 +46,8 @@ async def get_session() -> AsyncSession:
     async with async_session_maker() as session:
         yield session
 
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Состояние пула соединений: занятые соединения, ожидание, переполнение."""
+    pool = engine.sync_engine.pool
+    return pool.stats.snapshot(pool)
@@ -0,0 +1,142 @@
+"""Кэши данных из БД в памяти процесса."""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from config import config
+
+
+class TTLCache:
+    """
+    LRU-кэш ограниченного размера с временем жизни записей.
+
+    Все операции синхронные и выполняются в одном event loop,
+    поэтому блокировки не нужны.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение или None, если его нет или оно устарело."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Сохранить значение, вытеснив самую давнюю запись при переполнении."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        """Удалить запись."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Удалить все записи."""
+        self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора размера кэша."""
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class VersionedCache:
+    """
+    Кэш с версией данных на ключ.
+
+    Каждое изменение данных ключа увеличивает версию (bump), и записи
+    прежних версий больше не выдаются. Загрузка запоминает версию до
+    чтения из БД и сохраняет результат с ней: если данные изменились,
+    пока шла загрузка, запись сразу окажется устаревшей.
+
+    Версии берутся из общего счетчика. Чтобы хранить их для ограниченного
+    числа ключей, вытесненная версия поднимает нижнюю границу _floor,
+    которая служит версией всех ключей без своей записи: это может лишь
+    сделать устаревшими лишние записи, но не выдать устаревшие данные.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions: OrderedDict[Hashable, int] = OrderedDict()
+        self._max_versions = maxsize * 4
+        self._clock = 0
+        self._floor = 0
+        self.stale = 0
+
+    def version(self, key: Hashable) -> int:
+        """Текущая версия данных ключа."""
+        return self._versions.get(key, self._floor)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Получить значение текущей версии или None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, value = entry
+        if version != self.version(key):
+            self._entries.invalidate(key)
+            self.stale += 1
+            return None
+        return value
+
+    def set(self, key: Hashable, version: int, value: Any) -> None:
+        """Сохранить значение, загруженное при версии version (устаревшее не сохраняется)."""
+        if version == self.version(key):
+            self._entries.set(key, (version, value))
+
+    def bump(self, key: Hashable) -> None:
+        """Отметить изменение данных ключа (вызывать после commit)."""
+        self._clock += 1
+        self._versions[key] = self._clock
+        self._versions.move_to_end(key)
+        self._entries.invalidate(key)
+        while len(self._versions) > self._max_versions:
+            _, evicted = self._versions.popitem(last=False)
+            self._floor = max(self._floor, evicted)
+
+    def clear(self) -> None:
+        """Сделать устаревшими все записи."""
+        self._clock += 1
+        self._floor = self._clock
+        self._versions.clear()
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики для подбора размера кэша."""
+        return {**self._entries.stats(), 'versions': len(self._versions), 'stale': self.stale}
+
+
+# Пользователи по Telegram ID (используется в UserMiddleware)
+user_cache = TTLCache(maxsize=config.USER_CACHE_SIZE, ttl=config.USER_CACHE_TTL)
+
+# Лекарства пользователя с расписаниями и готовыми текстами (services.medication_service)
+medication_cache = VersionedCache(maxsize=config.MEDICATION_CACHE_SIZE, ttl=config.MEDICATION_CACHE_TTL)
@@ -0,0 +1,206 @@
+"""Канал изменений: сброс кэшей всех процессов через LISTEN/NOTIFY."""
+import asyncio
+import json
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import asyncpg
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from database.base import engine
+from database.cache import medication_cache, user_cache
+from database.repository import CHANGE_ORIGIN, LOCAL_CHANGES
+from monitoring.metrics import CHANGE_EVENTS_TOTAL, CHANGE_FEED_CONNECTED
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ChangeEvent:
+    """
+    Событие канала изменений.
+
+    kind: 'user', 'medication' или 'reset' - соединение с БД
+    восстановлено, события за время разрыва могли потеряться.
+    """
+    kind: str
+    user_id: Optional[int] = None
+    medication_id: Optional[int] = None
+    origin: Optional[str] = None
+
+
+ChangeHandler = Callable[[ChangeEvent], Awaitable[None]]
+
+RESET = ChangeEvent(kind='reset')
+
+
+class ChangeListener:
+    """
+    Подписка процесса на канал изменений.
+
+    Записи публикуют события (ChangeRepository.publish) в своей транзакции,
+    PostgreSQL доставляет их после commit всем слушателям канала. Слушатель
+    держит отдельное от пула соединение с LISTEN и передает события
+    обработчикам по порядку. Свои события процесса получают только
+    обработчики, подписанные с own_events (например, движок расписаний),
+    остальные их пропускают - кэши уже сброшены при записи. Соединение
+    проверяется каждые ping_interval секунд; после разрыва оно
+    восстанавливается через reconnect_delay секунд, и обработчики
+    получают событие 'reset'.
+
+    При выключенном канале (start(listen=False)) слушатель не подключается
+    к БД, а обработчики получают только события этого процесса
+    (ChangeRepository.publish передает их после commit).
+    """
+
+    def __init__(self, channel: str, ping_interval: float, reconnect_delay: float):
+        self.channel = channel
+        self.ping_interval = ping_interval
+        self.reconnect_delay = reconnect_delay
+        self._handlers: List[Tuple[ChangeHandler, bool]] = []
+        self._queue: asyncio.Queue[ChangeEvent] = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    def subscribe(self, handler: ChangeHandler, own_events: bool = False) -> None:
+        """
+        Добавить обработчик событий.
+
+        Args:
+            own_events: Получать и события, опубликованные этим процессом
+        """
+        self.unsubscribe(handler)
+        self._handlers.append((handler, own_events))
+
+    def unsubscribe(self, handler: ChangeHandler) -> None:
+        """Удалить обработчик событий."""
+        self._handlers = [entry for entry in self._handlers if entry[0] != handler]
+
+    def start(self, listen: bool = True) -> None:
+        """
+        Запустить обработку событий.
+
+        Args:
+            listen: Слушать канал в БД (False - только события этого процесса)
+        """
+        self._consumer = asyncio.create_task(self._consume())
+        if listen:
+            self._task = asyncio.create_task(self._run())
+
+    def deliver_local(self, data: dict) -> None:
+        """Передать обработчикам событие этого процесса без канала в БД."""
+        if self._consumer is not None:
+            self._queue.put_nowait(ChangeEvent(**data))
+
+    async def stop(self) -> None:
+        """Закрыть соединение и остановить обработку событий."""
+        for task in (self._task, self._consumer):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._consumer = None
+        CHANGE_FEED_CONNECTED.set(0)
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            event = ChangeEvent(
+                kind=data['kind'],
+                user_id=data.get('user_id'),
+                medication_id=data.get('medication_id'),
+                origin=data.get('origin'),
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Некорректное событие канала изменений {payload!r}: {e}")
+            return
+        self._queue.put_nowait(event)
+
+    async def _run(self) -> None:
+        # Без драйвера SQLAlchemy: URL postgresql+asyncpg:// asyncpg не принимает
+        dsn = engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+        reconnect = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                await connection.add_listener(self.channel, self._on_notify)
+                CHANGE_FEED_CONNECTED.set(1)
+                logger.info(f"Подписка на канал изменений {self.channel}")
+                if reconnect:
+                    self._queue.put_nowait(RESET)
+
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=self.ping_interval)
+                    except asyncio.TimeoutError:
+                        await connection.fetchval("SELECT 1", timeout=self.ping_interval)
+                logger.warning("Соединение канала изменений закрыто")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка соединения канала изменений: {e}")
+            finally:
+                CHANGE_FEED_CONNECTED.set(0)
+                if connection is not None and not connection.is_closed():
+                    connection.terminate()
+                reconnect = True
+
+            # Пока соединения нет, события теряются: после переподключения будет 'reset'
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _consume(self) -> None:
+        while True:
+            event = await self._queue.get()
+            own = event.origin == CHANGE_ORIGIN
+            CHANGE_EVENTS_TOTAL.inc(kind=event.kind, source='self' if own else 'remote')
+            for handler, own_events in list(self._handlers):
+                if own and not own_events:
+                    continue
+                try:
+                    await handler(event)
+                except Exception as e:
+                    logger.error(f"Ошибка обработчика события {event.kind}: {e}")
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _deliver_local_changes(session: Session) -> None:
+    # Без канала изменений события этого процесса передаются слушателю напрямую
+    for data in session.info.pop(LOCAL_CHANGES, ()):
+        change_listener.deliver_local(data)
+
+
+@sa_event.listens_for(Session, 'after_transaction_end')
+def _drop_local_changes(session: Session, transaction) -> None:
+    # Откат или закрытие сессии без commit: изменения не записаны
+    if transaction.parent is None:
+        session.info.pop(LOCAL_CHANGES, None)
+
+
+async def invalidate_caches(event: ChangeEvent) -> None:
+    """Сбросить кэши процесса по событию канала изменений."""
+    if event.kind == 'reset':
+        user_cache.clear()
+        medication_cache.clear()
+    elif event.kind == 'user':
+        user_cache.invalidate(event.user_id)
+        medication_cache.bump(event.user_id)
+    elif event.kind == 'medication':
+        medication_cache.bump(event.user_id)
+
+
+# Глобальный слушатель процесса
+change_listener = ChangeListener(
+    channel=config.CHANGE_FEED_CHANNEL,
+    ping_interval=config.CHANGE_FEED_PING_SECONDS,
+    reconnect_delay=config.CHANGE_FEED_RECONNECT_SECONDS,
+)
+change_listener.subscribe(invalidate_caches)
@@ -0,0 +1,134 @@
+"""
+Проверка индексов: отсутствующие, невалидные и неиспользуемые.
+
+- Отсутствующие - описаны в моделях, но не созданы в базе (миграция
+  не применена); невалидные - остались от прерванного CREATE INDEX
+  CONCURRENTLY или ожидают присоединения индексов секций.
+- Неиспользуемые - ни одного сканирования с последнего сброса статистики
+  (уникальные и первичные ключи не учитываются: они нужны для ограничений).
+  Индексы секций суммируются в индекс родительской таблицы.
+- Таблицы, которые читаются в основном последовательным сканированием.
+
+При отсутствующих или невалидных индексах команда завершается с кодом 1.
+
+    python -m database.index_report
+"""
+import asyncio
+import sys
+from typing import List, Tuple
+
+from sqlalchemy import text
+
+from database.base import Base, engine
+import database.models  # noqa: F401 - регистрирует модели в Base.metadata
+
+# Таблицы меньше этого размера дешевле читать последовательно
+SEQ_SCAN_MIN_ROWS = 10000
+
+EXISTING_INDEXES = text("""
+    SELECT c.relname, x.indisvalid
+    FROM pg_index x
+    JOIN pg_class c ON c.oid = x.indexrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = current_schema()
+""")
+
+INDEX_USAGE = text("""
+    SELECT
+        COALESCE(parent_index.relname, s.indexrelname) AS index_name,
+        COALESCE(parent_table.relname, s.relname) AS table_name,
+        sum(s.idx_scan) AS scans,
+        sum(pg_relation_size(s.indexrelid)) AS size_bytes
+    FROM pg_stat_user_indexes s
+    JOIN pg_index x ON x.indexrelid = s.indexrelid
+    LEFT JOIN pg_inherits index_link ON index_link.inhrelid = s.indexrelid
+    LEFT JOIN pg_class parent_index ON parent_index.oid = index_link.inhparent
+    LEFT JOIN pg_inherits table_link ON table_link.inhrelid = s.relid
+    LEFT JOIN pg_class parent_table ON parent_table.oid = table_link.inhparent
+    WHERE s.schemaname = current_schema()
+      AND NOT x.indisunique
+    GROUP BY 1, 2
+    HAVING sum(s.idx_scan) = 0
+    ORDER BY 4 DESC
+""")
+
+SEQ_SCANNED_TABLES = text("""
+    SELECT
+        COALESCE(parent_table.relname, s.relname) AS table_name,
+        sum(s.seq_scan) AS seq_scans,
+        sum(COALESCE(s.idx_scan, 0)) AS index_scans,
+        sum(s.n_live_tup) AS live_rows
+    FROM pg_stat_user_tables s
+    LEFT JOIN pg_inherits table_link ON table_link.inhrelid = s.relid
+    LEFT JOIN pg_class parent_table ON parent_table.oid = table_link.inhparent
+    WHERE s.schemaname = current_schema()
+    GROUP BY 1
+    HAVING sum(s.n_live_tup) >= :min_rows AND sum(s.seq_scan) > sum(COALESCE(s.idx_scan, 0))
+    ORDER BY 2 DESC
+""")
+
+STATS_RESET = text("SELECT stats_reset FROM pg_stat_database WHERE datname = current_database()")
+
+
+def declared_indexes() -> List[Tuple[str, str]]:
+    """Индексы, описанные в моделях: (индекс, таблица)."""
+    return sorted(
+        (index.name, table.name)
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    )
+
+
+async def build_report() -> bool:
+    """
+    Напечатать отчет по индексам.
+
+    Returns:
+        bool: True, если все описанные в моделях индексы созданы и валидны
+    """
+    async with engine.connect() as conn:
+        existing = {name: valid for name, valid in (await conn.execute(EXISTING_INDEXES)).all()}
+        unused = (await conn.execute(INDEX_USAGE)).all()
+        seq_scanned = (await conn.execute(SEQ_SCANNED_TABLES, {'min_rows': SEQ_SCAN_MIN_ROWS})).all()
+        stats_reset = await conn.scalar(STATS_RESET)
+
+    missing = [(name, table) for name, table in declared_indexes() if name not in existing]
+    invalid = sorted(name for name, valid in existing.items() if not valid)
+
+    print("📋 Отсутствующие индексы (примените миграции: python -m database.init_db):")
+    for name, table in missing:
+        print(f"   ❌ {name} ON {table}")
+    if not missing:
+        print("   нет")
+
+    print("\n📋 Невалидные индексы (перезапустите миграцию, создавшую индекс):")
+    for name in invalid:
+        print(f"   ⚠️  {name}")
+    if not invalid:
+        print("   нет")
+
+    since = stats_reset.isoformat() if stats_reset else "создания базы"
+    print(f"\n📋 Неиспользуемые индексы (без сканирований с {since}):")
+    for name, table, _, size_bytes in unused:
+        print(f"   💤 {name} ON {table} ({size_bytes / 1024 / 1024:.1f} МБ)")
+    if not unused:
+        print("   нет")
+
+    print(f"\n📋 Таблицы от {SEQ_SCAN_MIN_ROWS} строк, читаемые в основном последовательно:")
+    for table, seq_scans, index_scans, live_rows in seq_scanned:
+        print(f"   🐢 {table}: seq_scan {seq_scans}, idx_scan {index_scans}, строк {live_rows}")
+    if not seq_scanned:
+        print("   нет")
+
+    return not missing and not invalid
+
+
+async def main() -> int:
+    try:
+        return 0 if await build_report() else 1
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
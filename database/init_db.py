@@ -1,27 +1,143 @@
-"""Скрипт инициализации базы данных."""
+"""
+Скрипт инициализации и обновления базы данных.
+
+Схема ведется миграциями Alembic (migrations/): скрипт применяет
+недостающие ревизии и создает секции notification_logs. Существующие
+данные не удаляются; --reset пересоздает базу с нуля (для разработки).
+
+    python -m database.init_db [--reset]
+"""
+import argparse
 import asyncio
+import os
+import sys
+from datetime import date
 from sqlalchemy import text
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from config import config
 from database.base import engine, Base
-from database.models import User, Medication, MedicationSchedule, NotificationLog, NotificationRetry
+from database.partitions import ensure_partitions
+from database.models import User, Medication, MedicationSchedule, NotificationLog, NotificationOutbox, AdherenceDaily, FSMState, SchedulerLease
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'alembic.ini')
+
+# Ревизия, соответствующая схеме, которую до появления миграций создавал create_all
+BASELINE_REVISION = '0000'
+
+# Таблицы и колонки этой схемы (migrations/versions/0000_original_schema.py)
+BASELINE_SCHEMA = {
+    'users': {'id', 'username', 'first_name', 'timezone', 'created_at', 'updated_at'},
+    'medications': {'id', 'user_id', 'name', 'description', 'created_at', 'updated_at', 'is_active'},
+    'medication_schedules': {
+        'id', 'medication_id', 'frequency_type', 'interval_days', 'dose', 'time',
+        'start_date', 'end_date', 'created_at'
+    },
+    'notification_logs': {
+        'id', 'schedule_id', 'scheduled_time', 'sent_at', 'status', 'attempts',
+        'error_message', 'message_id'
+    },
+    'notification_retries': {'id', 'notification_log_id', 'retry_at', 'attempt_number', 'status'},
+}
+
 
+def alembic_config() -> AlembicConfig:
+    """Конфигурация Alembic проекта (логирование настраивает вызывающий код)."""
+    alembic_cfg = AlembicConfig(ALEMBIC_INI)
+    alembic_cfg.attributes['configure_logger'] = False
+    return alembic_cfg
 
-async def init_db():
-    """Создать все таблицы в базе данных."""
+
+async def reset_db():
+    """Удалить все таблицы, включая версию схемы (для разработки)."""
     async with engine.begin() as conn:
-        # Удаляем все таблицы (для разработки)
-        # В продакшене лучше использовать миграции Alembic
+        # notification_retries заменена notification_outbox и больше не описана в моделях,
+        # но ссылается на notification_logs и помешала бы удалить ее
+        await conn.execute(text("DROP TABLE IF EXISTS notification_retries"))
         await conn.run_sync(Base.metadata.drop_all)
-        
-        # Создаем все таблицы
-        await conn.run_sync(Base.metadata.create_all)
-        
-        print("✅ База данных успешно инициализирована!")
-        print("📋 Созданы таблицы:")
-        print("   - users")
-        print("   - medications")
-        print("   - medication_schedules")
-        print("   - notification_logs")
-        print("   - notification_retries")
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+
+
+async def schema_differences(conn) -> list[str]:
+    """
+    Отличия схемы без версии от BASELINE_SCHEMA.
+
+    Returns:
+        list[str]: Описания отличий (пусто - схему можно пометить BASELINE_REVISION)
+    """
+    result = await conn.execute(text(
+        "SELECT table_name, column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema()"
+    ))
+    columns: dict[str, set[str]] = {}
+    for table, column in result.all():
+        columns.setdefault(table, set()).add(column)
+
+    differences = []
+    for table, expected in BASELINE_SCHEMA.items():
+        actual = columns.get(table)
+        if actual is None:
+            differences.append(f"нет таблицы {table}")
+        elif actual != expected:
+            changed = sorted(actual ^ expected)
+            differences.append(f"{table}: колонки {', '.join(changed)} не совпадают")
+    for table in sorted(set(columns) - set(BASELINE_SCHEMA)):
+        differences.append(f"лишняя таблица {table}")
+    return differences
+
+
+async def upgrade_db() -> bool:
+    """
+    Применить недостающие миграции и создать секции notification_logs.
+
+    Returns:
+        bool: False - схема без версии не совпадает с исходной, база не изменена
+    """
+    async with engine.connect() as conn:
+        versioned = await conn.scalar(text("SELECT to_regclass('alembic_version') IS NOT NULL"))
+        legacy = await conn.scalar(text("SELECT to_regclass('users') IS NOT NULL"))
+        differences = await schema_differences(conn) if legacy and not versioned else []
+
+    if differences:
+        # Пометка ревизией пропустила бы миграции, которые нужны этой схеме
+        print(f"❌ Схема без версии не совпадает с ревизией {BASELINE_REVISION}, база не изменена:")
+        for difference in differences:
+            print(f"   - {difference}")
+        print("   Приведите схему к исходной или пометьте подходящей ревизией вручную (alembic stamp)")
+        return False
+
+    alembic_cfg = alembic_config()
+    # Миграции выполняются в отдельном потоке: env.py запускает свой event loop
+    if legacy and not versioned:
+        # База создана через create_all до появления миграций
+        print(f"📌 Схема без версии, помечаем ревизией {BASELINE_REVISION}")
+        await asyncio.to_thread(command.stamp, alembic_cfg, BASELINE_REVISION)
+    await asyncio.to_thread(command.upgrade, alembic_cfg, 'head')
+
+    async with engine.begin() as conn:
+        # notification_logs секционирована: секции создаются отдельно
+        partitions = await ensure_partitions(conn, date.today(), config.NOTIFICATION_LOG_PARTITIONS_AHEAD)
+        revision = await conn.scalar(text("SELECT version_num FROM alembic_version"))
+
+    print(f"✅ База данных обновлена до ревизии {revision}!")
+    print("📋 Таблицы:")
+    print("   - users")
+    print("   - medications")
+    print("   - medication_schedules")
+    print(f"   - notification_logs (секции: {', '.join(partitions)})")
+    print("   - notification_outbox")
+    print("   - adherence_daily")
+    print("   - fsm_states")
+    print("   - scheduler_leases")
+    return True
+
+
+async def init_db(reset: bool = False) -> bool:
+    """Подготовить базу данных: при reset - пересоздать, затем применить миграции."""
+    if reset:
+        await reset_db()
+        print("🗑  Все таблицы удалены")
+    return await upgrade_db()
 
 
 async def test_connection():
@@ -37,16 +153,21 @@ async def test_connection():
         return False
 
 
-async def main():
-    """Главная функция."""
+async def main(reset: bool = False) -> int:
+    """Главная функция; код возврата 1 - база не подготовлена."""
     print("🔌 Проверка подключения к базе данных...")
+    ready = False
     if await test_connection():
-        print("\n📦 Инициализация таблиц...")
-        await init_db()
+        print("\n📦 Применение миграций...")
+        ready = await init_db(reset)
     else:
         print("\n⚠️  Убедитесь, что PostgreSQL запущен и настройки в .env файле корректны.")
+    await engine.dispose()
+    return 0 if ready else 1
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
-
+    parser = argparse.ArgumentParser(description="Инициализация и обновление базы данных")
+    parser.add_argument('--reset', action='store_true', help="Удалить все таблицы и создать схему заново (удаляет данные)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.reset)))
@@ -1,6 +1,7 @@
 """Модели базы данных."""
 from datetime import datetime, date, time
-from sqlalchemy import BigInteger, String, Integer, Boolean, Text, Time, Date, ForeignKey, TIMESTAMP, text, Float
+from sqlalchemy import BigInteger, String, Integer, Boolean, Text, Time, Date, ForeignKey, ForeignKeyConstraint, Index, TIMESTAMP, text, Float, UniqueConstraint
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from database.base import Base
 
@@ -23,6 +24,9 @@ class User(Base):
 class Medication(Base):
     """Модель лекарства."""
     __tablename__ = 'medications'
+    __table_args__ = (
+        Index('ix_medications_user_active', 'user_id', 'is_active'),
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
@@ -42,13 +46,14 @@ class MedicationSchedule(Base):
     __tablename__ = 'medication_schedules'
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    medication_id: Mapped[int] = mapped_column(Integer, ForeignKey('medications.id', ondelete='CASCADE'), nullable=False)
+    medication_id: Mapped[int] = mapped_column(Integer, ForeignKey('medications.id', ondelete='CASCADE'), nullable=False, index=True)
     frequency_type: Mapped[str] = mapped_column(String(20), nullable=False)  # 'daily' или 'interval'
     interval_days: Mapped[int | None] = mapped_column(Integer, nullable=True)  # Для 'interval' типа
     dose: Mapped[float] = mapped_column(Float, nullable=False)  # Количество препарата
     time: Mapped[time] = mapped_column(Time, nullable=False)  # Время приема
     start_date: Mapped[date] = mapped_column(Date, nullable=False)
     end_date: Mapped[date | None] = mapped_column(Date, nullable=True)  # NULL = бессрочно
+    next_fire_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True, index=True)  # Ближайшее срабатывание (UTC), NULL = приемов больше нет
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), default=datetime.utcnow, server_default=text('CURRENT_TIMESTAMP'))
     
     # Relationships
@@ -57,33 +62,100 @@ class MedicationSchedule(Base):
 
 
 class NotificationLog(Base):
-    """Модель лога уведомления."""
+    """
+    Модель лога уведомления.
+    
+    Таблица секционирована по месяцам local_date (database.partitions):
+    первичный ключ и уникальные ограничения включают ключ секционирования,
+    а запросы фильтруют по local_date, чтобы затрагивать только нужные секции.
+    """
     __tablename__ = 'notification_logs'
+    __table_args__ = (
+        # Не больше одного уведомления на расписание за локальный день пользователя
+        UniqueConstraint('schedule_id', 'local_date', name='uq_notification_logs_schedule_local_date'),
+        {'postgresql_partition_by': 'RANGE (local_date)'},
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     schedule_id: Mapped[int] = mapped_column(Integer, ForeignKey('medication_schedules.id', ondelete='CASCADE'), nullable=False)
     scheduled_time: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
+    local_date: Mapped[date] = mapped_column(Date, primary_key=True)  # Дата приема в часовом поясе пользователя (ключ секционирования)
     sent_at: Mapped[datetime | None] = mapped_column(TIMESTAMP(timezone=True), nullable=True)
-    status: Mapped[str] = mapped_column(String(20), nullable=False, default='pending')  # 'pending', 'sent', 'failed', 'delivered'
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default='pending')  # 'pending' (в outbox), 'sent', 'failed', 'delivered'
     attempts: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)  # ID сообщения в Telegram
     
     # Relationships
     schedule: Mapped['MedicationSchedule'] = relationship(back_populates='notification_logs')
-    retries: Mapped[list['NotificationRetry']] = relationship(back_populates='notification_log', cascade='all, delete-orphan')
 
 
-class NotificationRetry(Base):
-    """Модель повторной попытки отправки уведомления."""
-    __tablename__ = 'notification_retries'
+class NotificationOutbox(Base):
+    """
+    Модель исходящего уведомления (transactional outbox).
     
-    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    notification_log_id: Mapped[int] = mapped_column(Integer, ForeignKey('notification_logs.id', ondelete='CASCADE'), nullable=False)
-    retry_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)
-    attempt_number: Mapped[int] = mapped_column(Integer, nullable=False)
-    status: Mapped[str] = mapped_column(String(20), nullable=False, default='pending')  # 'pending', 'completed', 'failed'
+    Строка создается в одной транзакции с логом и сдвигом next_fire_at,
+    живет до успешной отправки или исчерпания попыток и затем удаляется.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ['notification_log_id', 'local_date'],
+            ['notification_logs.id', 'notification_logs.local_date'],
+            ondelete='CASCADE'
+        ),
+    )
     
-    # Relationships
-    notification_log: Mapped['NotificationLog'] = relationship(back_populates='retries')
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    notification_log_id: Mapped[int] = mapped_column(Integer, nullable=False, unique=True)
+    local_date: Mapped[date] = mapped_column(Date, nullable=False)  # Секция лога
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)  # Совпадает с ID пользователя
+    medication_id: Mapped[int] = mapped_column(Integer, nullable=False)  # Для сводки adherence_daily
+    message_text: Mapped[str] = mapped_column(Text, nullable=False)  # Текст формируется при постановке в очередь
+    due_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False)  # Момент срабатывания (UTC)
+    next_attempt_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # Сделанные попытки отправки
+    created_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), default=datetime.utcnow, server_default=text('CURRENT_TIMESTAMP'))
 
+
+class AdherenceDaily(Base):
+    """
+    Модель дневной сводки уведомлений по пользователю и лекарству.
+    
+    Обновляется инкрементально в тех же транзакциях, что и логи
+    уведомлений; пересчитывается из логов командой database.backfill_adherence.
+    """
+    __tablename__ = 'adherence_daily'
+    __table_args__ = (
+        Index('ix_adherence_daily_user_date', 'user_id', 'local_date'),
+    )
+    
+    user_id: Mapped[int] = mapped_column(BigInteger, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    medication_id: Mapped[int] = mapped_column(Integer, ForeignKey('medications.id', ondelete='CASCADE'), primary_key=True)
+    local_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    scheduled: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # Поставлено в очередь
+    sent: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # Отправлено
+    failed: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # Не отправлено окончательно
+    retried: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default='0')  # Завершены после повторных попыток
+    lag_seconds_total: Mapped[float] = mapped_column(Float, nullable=False, default=0, server_default='0')  # Сумма задержек отправленных
+    lag_seconds_max: Mapped[float] = mapped_column(Float, nullable=False, default=0, server_default='0')
+
+
+class FSMState(Base):
+    """Модель состояния FSM (диалоги добавления/редактирования и настроек)."""
+    __tablename__ = 'fsm_states'
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # Ключ aiogram StorageKey
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict, server_default=text("'{}'::jsonb"))
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False, index=True)  # Брошенные диалоги удаляются после истечения
+
+
+class SchedulerLease(Base):
+    """Модель аренды: какой процесс планировщика владеет шардом (или членство процесса)."""
+    __tablename__ = 'scheduler_leases'
+    
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)  # 'shard:<номер>' или 'member:<процесс>'
+    owner: Mapped[str] = mapped_column(String(255), nullable=False)  # Идентификатор процесса
+    expires_at: Mapped[datetime] = mapped_column(TIMESTAMP(timezone=True), nullable=False, index=True)
+    token: Mapped[int] = mapped_column(BigInteger, nullable=False, default=1, server_default='1')  # Растет при каждой смене владельца
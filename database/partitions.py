@@ -0,0 +1,249 @@
+"""
+Секции notification_logs по месяцам и их хранение.
+
+Секция notification_logs_YYYY_MM содержит логи с local_date в этом месяце.
+ensure_partitions заранее создает секции прошлого, текущего и следующих месяцев,
+apply_retention выгружает секции старше срока хранения в сжатый CSV
+(если задан каталог архива), отсоединяет и удаляет их: удаление секции
+не оставляет мертвых строк, поэтому размер горячих данных и работа VACUUM
+не растут со временем.
+"""
+import asyncio
+import gzip
+import logging
+import os
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from database.models import NotificationOutbox
+from database.repository import Fence, holds_lease
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'notification_logs'
+PARTITION_PATTERN = re.compile(rf'^{PARENT_TABLE}_(\d{{4}})_(\d{{2}})$')
+
+
+def month_start(day: date) -> date:
+    """Первый день месяца."""
+    return day.replace(day=1)
+
+
+def add_months(month: date, months: int) -> date:
+    """Первый день месяца, отстоящего на months от month."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Имя секции месяца."""
+    return f'{PARENT_TABLE}_{month.year:04d}_{month.month:02d}'
+
+
+async def list_partitions(conn: AsyncConnection) -> List[Tuple[str, date]]:
+    """
+    Секции notification_logs.
+
+    Returns:
+        List[Tuple[str, date]]: (имя секции, первый день месяца), по возрастанию месяца
+    """
+    result = await conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :parent"
+    ), {'parent': PARENT_TABLE})
+
+    partitions = []
+    for name in result.scalars().all():
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+async def list_detached(conn: AsyncConnection) -> List[Tuple[str, date]]:
+    """
+    Таблицы секций, отсоединенные от notification_logs, но не удаленные
+    (процесс упал между DETACH и DROP).
+
+    Returns:
+        List[Tuple[str, date]]: (имя таблицы, первый день месяца)
+    """
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relkind = 'r' AND NOT c.relispartition "
+        "AND c.relname LIKE :prefix"
+    ), {'prefix': f'{PARENT_TABLE}\\_%'})
+
+    tables = []
+    for name in result.scalars().all():
+        match = PARTITION_PATTERN.match(name)
+        if match:
+            tables.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+    return sorted(tables, key=lambda table: table[1])
+
+
+async def ensure_partitions(conn: AsyncConnection, today: date, months_ahead: int) -> List[str]:
+    """
+    Создать недостающие секции с прошлого месяца на months_ahead месяцев вперед.
+
+    Секции создаются с запасом: local_date у пользователей восточных
+    часовых поясов уже в следующем месяце, пока в UTC еще старый, а у
+    западных в первый день месяца по UTC - еще в прошлом.
+
+    Returns:
+        List[str]: Имена созданных секций
+    """
+    existing = {name for name, _ in await list_partitions(conn)}
+    created = []
+    current = month_start(today)
+
+    for offset in range(-1, months_ahead + 1):
+        month = add_months(current, offset)
+        name = partition_name(month)
+        if name in existing:
+            continue
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {PARENT_TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+        ))
+        created.append(name)
+
+    if created:
+        logger.info(f"Созданы секции логов уведомлений: {', '.join(created)}")
+    return created
+
+
+async def archive_partition(conn: AsyncConnection, name: str, archive_dir: str) -> str:
+    """
+    Выгрузить секцию в сжатый CSV-файл <archive_dir>/<name>.csv.gz.
+
+    Файл пишется во временный и переименовывается после успешной выгрузки,
+    поэтому в каталоге архива не бывает недописанных файлов.
+
+    Returns:
+        str: Путь к файлу архива
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f'{name}.csv.gz')
+    temporary_path = path + '.tmp'
+
+    raw_connection = await conn.get_raw_connection()
+    with gzip.open(temporary_path, 'wb') as archive:
+        async def write(chunk: bytes) -> None:
+            # Сжатие - в потоке, чтобы не задерживать event loop планировщика
+            await asyncio.to_thread(archive.write, chunk)
+
+        # COPY выгружает секцию потоком, не загружая строки в память
+        await raw_connection.driver_connection.copy_from_table(
+            name, output=write, format='csv', header=True
+        )
+
+    os.replace(temporary_path, path)
+    return path
+
+
+async def detach_partition(conn: AsyncConnection, name: str) -> None:
+    """
+    Отсоединить секцию от notification_logs.
+
+    На PostgreSQL 14+ - DETACH PARTITION CONCURRENTLY: запись в родительскую
+    таблицу не блокируется. Команда не выполняется в транзакции, поэтому
+    идет напрямую через соединение asyncpg (conn не должен быть
+    в транзакции). Прерванное отсоединение завершается FINALIZE.
+    На более старых версиях - обычный DETACH (короткая блокировка родителя).
+    """
+    raw_connection = await conn.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    mode = ''
+    if conn.dialect.server_version_info >= (14,):
+        pending = await driver_connection.fetchval(
+            "SELECT inhdetachpending FROM pg_inherits WHERE inhrelid = to_regclass($1)", name
+        )
+        mode = 'FINALIZE' if pending else 'CONCURRENTLY'
+
+    await driver_connection.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name} {mode}")
+
+
+async def apply_retention(conn: AsyncConnection, today: date, retention_months: int,
+                          archive_dir: Optional[str] = None, fence: Optional[Fence] = None) -> List[str]:
+    """
+    Удалить секции месяцев, целиком вышедших за срок хранения.
+
+    Хранятся текущий месяц и retention_months предыдущих (не меньше одного:
+    в прошлый месяц еще пишут пользователи западных часовых поясов). Каждая секция:
+    - выгружается в архив, если задан archive_dir (при ошибке выгрузки
+      секция остается);
+    - теряет строки notification_outbox, ссылающиеся на нее внешним
+      ключом: за пределами срока хранения они давно не будут отправлены,
+      а без этого PostgreSQL не отсоединит секцию;
+    - отсоединяется (detach_partition) и удаляется.
+    Шаги выполняются в отдельных коротких транзакциях (conn не должен быть
+    в транзакции). Таблица, отсоединенная прошлым запуском, но не удаленная,
+    удаляется при следующем: выгрузка выполняется до отсоединения.
+
+    Args:
+        fence: Fencing token лидера: секция удаляется, только пока аренда действует
+
+    Returns:
+        List[str]: Имена удаленных секций
+    """
+    oldest_kept = add_months(month_start(today), -max(retention_months, 1))
+    dropped = []
+
+    async def leadership_lost() -> bool:
+        if fence and not await conn.scalar(select(holds_lease(fence))):
+            logger.warning("Лидерство потеряно, удаление секций прервано")
+            return True
+        return False
+
+    async with conn.begin():
+        partitions = await list_partitions(conn)
+        leftovers = await list_detached(conn)
+
+    for name, month in leftovers:
+        if month >= oldest_kept:
+            continue
+        async with conn.begin():
+            if await leadership_lost():
+                return dropped
+            await conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+        dropped.append(name)
+
+    for name, month in partitions:
+        if month >= oldest_kept:
+            break
+
+        async with conn.begin():
+            if await leadership_lost():
+                break
+            if archive_dir:
+                path = await archive_partition(conn, name, archive_dir)
+                logger.info(f"Секция {name} выгружена в {path}")
+
+        async with conn.begin():
+            purged = await conn.execute(
+                delete(NotificationOutbox)
+                .where(NotificationOutbox.local_date >= month, NotificationOutbox.local_date < add_months(month, 1))
+            )
+        if purged.rowcount:
+            logger.warning(f"Из outbox удалено {purged.rowcount} неотправленных уведомлений секции {name}")
+
+        await detach_partition(conn, name)
+
+        async with conn.begin():
+            if await leadership_lost():
+                break
+            await conn.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+
+    if dropped:
+        logger.info(f"Удалены секции логов уведомлений: {', '.join(dropped)}")
+    return dropped
@@ -0,0 +1,70 @@
+"""Пул соединений с метриками выдачи соединений."""
+import logging
+import time
+from typing import Any, Dict
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Счетчики пула: ожидание соединения, переполнение и таймауты."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.overflow_events = 0
+        self.timeouts = 0
+
+    def record_checkout(self, waited: float, overflowed: bool) -> None:
+        self.checkouts += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        if overflowed:
+            self.overflow_events += 1
+
+    def snapshot(self, pool: AsyncAdaptedQueuePool) -> Dict[str, Any]:
+        """Текущее состояние пула и накопленные счетчики."""
+        return {
+            'size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'checkouts': self.checkouts,
+            'wait_avg_ms': self.wait_total / self.checkouts * 1000 if self.checkouts else 0.0,
+            'wait_max_ms': self.wait_max * 1000,
+            'overflow_events': self.overflow_events,
+            'timeouts': self.timeouts,
+        }
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool, измеряющий время ожидания соединения."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Свои счетчики у каждого engine (приложение, бенчмарк, миграции)
+        self.stats = PoolStats()
+
+    def connect(self):
+        overflow_before = self._overflow
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.stats.timeouts += 1
+            logger.error(f"Не дождались соединения из пула за {self._timeout} с: пул исчерпан")
+            raise
+
+        waited = time.perf_counter() - started
+        self.stats.record_checkout(waited, overflowed=self._overflow > overflow_before)
+        if waited * 1000 >= config.DB_POOL_SLOW_CHECKOUT_MS:
+            logger.warning(
+                f"Долгое ожидание соединения из пула: {waited * 1000:.0f} мс "
+                f"(занято {self.checkedout()}, переполнение {self.overflow()})"
+            )
+        return connection
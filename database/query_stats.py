@@ -0,0 +1,167 @@
+"""Статистика SQL-запросов по методам репозиториев и журнал медленных запросов."""
+import functools
+import inspect
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import config
+
+slow_query_logger = logging.getLogger('database.slow_queries')
+
+# Метод репозитория, выполняющийся в текущей задаче ("Класс.метод")
+current_operation: ContextVar[Optional[str]] = ContextVar('current_operation', default=None)
+
+UNATTRIBUTED = 'unattributed'
+LATENCY_WINDOW = 1024  # Последних замеров на операцию для перцентилей
+
+
+class OperationStats:
+    """Накопленная статистика одной операции."""
+
+    __slots__ = ('calls', 'statements', 'rows', 'total_time', 'latencies')
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.latencies: deque = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+        return {
+            'calls': self.calls,
+            'statements': self.statements,
+            'rows': self.rows,
+            'total_ms': self.total_time * 1000,
+            'p50_ms': percentile(0.50),
+            'p90_ms': percentile(0.90),
+            'p99_ms': percentile(0.99),
+        }
+
+
+class QueryStats:
+    """Статистика SQL-запросов, сгруппированная по методам репозиториев."""
+
+    def __init__(self):
+        self._operations: Dict[str, OperationStats] = {}
+
+    def _get(self, operation: str) -> OperationStats:
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = OperationStats()
+        return stats
+
+    def record_call(self, operation: str) -> None:
+        self._get(operation).calls += 1
+
+    def record_statement(self, operation: str, elapsed: float, rows: int) -> None:
+        stats = self._get(operation)
+        stats.statements += 1
+        stats.rows += rows
+        stats.total_time += elapsed
+        stats.latencies.append(elapsed)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Статистика по операциям, самые затратные первыми."""
+        snapshots = {name: stats.snapshot() for name, stats in self._operations.items()}
+        return dict(sorted(snapshots.items(), key=lambda item: item[1]['total_ms'], reverse=True))
+
+    def reset(self) -> None:
+        self._operations.clear()
+
+
+query_stats = QueryStats()
+
+
+def track_operation(name: str):
+    """Декоратор async-метода: все запросы внутри него приписываются операции name."""
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(*args, **kwargs):
+            # Вложенные вызовы (метод репозитория вызывает другой) приписываются внешнему
+            if current_operation.get() is not None:
+                return await method(*args, **kwargs)
+
+            query_stats.record_call(name)
+            token = current_operation.set(name)
+            try:
+                return await method(*args, **kwargs)
+            finally:
+                current_operation.reset(token)
+
+        return wrapper
+    return decorator
+
+
+def track_class_operations(cls: type) -> None:
+    """Обернуть публичные async-методы класса в track_operation."""
+    for attribute, method in list(vars(cls).items()):
+        if attribute.startswith('_') or not inspect.iscoroutinefunction(method):
+            continue
+        setattr(cls, attribute, track_operation(f'{cls.__name__}.{attribute}')(method))
+
+
+def _row_count(cursor) -> int:
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        return cursor.rowcount
+    # Адаптер asyncpg выбирает строки SELECT целиком до того, как их прочитает ORM
+    rows = getattr(cursor, '_rows', None)
+    return len(rows) if rows is not None else 0
+
+
+def _explain(conn, statement: str, parameters) -> Optional[str]:
+    """Получить план запроса отдельным курсором (без ANALYZE - запрос не выполняется повторно)."""
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(f'EXPLAIN {statement}', parameters)
+        return '\n'.join(str(row[0]) for row in cursor.fetchall())
+    except Exception as e:
+        return f'не удалось получить план: {e}'
+    finally:
+        cursor.close()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started']
+    operation = current_operation.get() or UNATTRIBUTED
+    query_stats.record_statement(operation, elapsed, _row_count(cursor))
+
+    if elapsed * 1000 < config.DB_SLOW_QUERY_MS:
+        return
+
+    plan = None
+    explainable = statement.lstrip()[:6].upper() in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH')
+    if config.DB_SLOW_QUERY_EXPLAIN and explainable and not executemany:
+        plan = _explain(conn, statement, parameters)
+
+    message = (
+        f"Медленный запрос {operation}: {elapsed * 1000:.0f} мс\n"
+        f"{statement}\n"
+        f"Параметры: {repr(parameters)[:1000]}"
+    )
+    if plan:
+        message += f"\nПлан:\n{plan}"
+    slow_query_logger.warning(message)
+
+
+def install(engine: Engine) -> None:
+    """Подключить сбор статистики к синхронному engine (AsyncEngine.sync_engine)."""
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
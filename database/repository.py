@@ -1,20 +1,134 @@
 """Репозитории для работы с базой данных."""
-from typing import Optional, List
-from sqlalchemy import select, delete, update
+import json
+import os
+import socket
+from typing import Any, Collection, NamedTuple, Optional, List, Set, Tuple
+from sqlalchemy import (
+    select, delete, update, and_, func, cast, values, column, case, false,
+    Integer, BigInteger, String, Text, Date, TIMESTAMP
+)
+from sqlalchemy.sql.expression import Values
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
 
-from database.models import User, Medication, MedicationSchedule, NotificationLog, NotificationRetry
+from database.models import User, Medication, MedicationSchedule, NotificationLog, NotificationOutbox, AdherenceDaily, SchedulerLease
+from database.cache import user_cache
+from database.query_stats import track_class_operations
+from config import config
+
+
+def typed_values(name: str, columns: List[tuple[str, Any]], rows: List[tuple]) -> Values:
+    """
+    Конструкция VALUES для массовых запросов.
+    
+    NULL приводится к типу колонки явно, иначе PostgreSQL считает
+    колонку из одних NULL текстовой.
+    """
+    return values(
+        *(column(column_name, column_type) for column_name, column_type in columns),
+        name=name
+    ).data([
+        tuple(
+            cast(None, column_type) if value is None else value
+            for value, (_, column_type) in zip(row, columns)
+        )
+        for row in rows
+    ])
+
+
+# Шарды планировщика: (общее количество шардов, номера шардов этого процесса)
+Shards = Tuple[int, Collection[int]]
+
+
+def in_shards(schedule_id_column, shards: Shards):
+    """Условие: расписание относится к одному из указанных шардов (id % количество)."""
+    shard_count, owned = shards
+    if not owned:
+        return false()
+    return (schedule_id_column % shard_count).in_(sorted(owned))
+
+
+class Page(NamedTuple):
+    """Страница выборки по курсору (keyset-пагинация)."""
+    items: list
+    has_prev: bool
+    has_next: bool
+
+
+# Fencing token лидера: (имя аренды, владелец, токен на момент захвата)
+Fence = Tuple[str, str, int]
+
+
+def holds_lease(fence: Fence):
+    """
+    Условие: аренда все еще действует и не переходила к другому владельцу.
+    
+    Добавляется в запросы одиночных задач: если лидер "проспал" истечение
+    аренды (пауза GC, сеть), его запоздалые записи не пройдут, так как
+    новый лидер уже получил больший токен.
+    """
+    name, owner, token = fence
+    return select(SchedulerLease.name).where(
+        SchedulerLease.name == name,
+        SchedulerLease.owner == owner,
+        SchedulerLease.token == token,
+        SchedulerLease.expires_at >= func.now()
+    ).exists()
 
 
 class BaseRepository:
     """Базовый репозиторий с общими методами."""
     
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Запросы каждого метода учитываются в статистике как "Класс.метод"
+        track_class_operations(cls)
+    
     def __init__(self, session: AsyncSession):
         self.session = session
 
 
+# Отправитель событий канала изменений: процесс не применяет свои же события повторно
+CHANGE_ORIGIN = f'{socket.gethostname()}-{os.getpid()}'
+
+# Ключ session.info с событиями, которые без канала изменений доставляются
+# только этому процессу после commit (database.change_feed)
+LOCAL_CHANGES = 'local_changes'
+
+
+class ChangeRepository(BaseRepository):
+    """
+    Публикация событий канала изменений (NOTIFY).
+    
+    Событие отправляется в транзакции сессии и доставляется слушателям
+    (database.change_feed) только после commit; при откате оно теряется
+    вместе с изменением. При CHANGE_FEED_ENABLED=false NOTIFY не отправляется:
+    событие после commit получает только слушатель этого процесса.
+    """
+    
+    async def publish(self, kind: str, user_id: int, medication_id: Optional[int] = None) -> None:
+        """
+        Сообщить об изменении данных пользователя.
+        
+        Args:
+            kind: 'user' - профиль (часовой пояс), 'medication' - лекарство и его расписания
+            user_id: ID пользователя
+            medication_id: ID измененного лекарства
+        """
+        event = {
+            'kind': kind,
+            'user_id': user_id,
+            'medication_id': medication_id,
+            'origin': CHANGE_ORIGIN,
+        }
+        if not config.CHANGE_FEED_ENABLED:
+            self.session.info.setdefault(LOCAL_CHANGES, []).append(event)
+            return
+        await self.session.execute(select(func.pg_notify(config.CHANGE_FEED_CHANNEL, json.dumps(event))))
+
+
 class UserRepository(BaseRepository):
     """Репозиторий для работы с пользователями."""
     
@@ -37,16 +151,16 @@ class UserRepository(BaseRepository):
         self.session.add(user)
         await self.session.commit()
         await self.session.refresh(user)
+        user_cache.invalidate(user_id)
         return user
     
     async def update_timezone(self, user_id: int, timezone: str) -> bool:
-        """Обновить часовой пояс пользователя."""
+        """Обновить часовой пояс пользователя. Commit выполняет вызывающий код."""
         result = await self.session.execute(
             update(User)
             .where(User.id == user_id)
             .values(timezone=timezone, updated_at=datetime.utcnow())
         )
-        await self.session.commit()
         return result.rowcount > 0
 
 
@@ -83,23 +197,81 @@ class MedicationRepository(BaseRepository):
         result = await self.session.execute(query)
         return list(result.scalars().all())
     
-    async def delete(self, medication_id: int) -> bool:
-        """Удалить лекарство (каскадно удалит расписания)."""
+    async def get_page(
+        self,
+        user_id: int,
+        limit: int,
+        after_id: Optional[int] = None,
+        before_id: Optional[int] = None,
+        active_only: bool = True
+    ) -> Page:
+        """
+        Получить страницу лекарств пользователя в порядке ID.
+        
+        Курсор - ID лекарства на границе соседней страницы: after_id для
+        следующей, before_id для предыдущей. Запрос читает limit + 1 строк
+        по индексу, сколько бы лекарств у пользователя ни было, а лишняя
+        строка показывает, есть ли страница дальше.
+        
+        Args:
+            user_id: ID пользователя
+            limit: Размер страницы
+            after_id: Вернуть лекарства с ID больше курсора
+            before_id: Вернуть лекарства с ID меньше курсора
+            active_only: Только активные лекарства
+        """
+        query = select(Medication).where(Medication.user_id == user_id)
+        if active_only:
+            query = query.where(Medication.is_active == True)
+        
+        backward = before_id is not None
+        if backward:
+            query = query.where(Medication.id < before_id).order_by(Medication.id.desc())
+        else:
+            if after_id is not None:
+                query = query.where(Medication.id > after_id)
+            query = query.order_by(Medication.id)
+        
         result = await self.session.execute(
-            delete(Medication).where(Medication.id == medication_id)
+            query.limit(limit + 1).options(selectinload(Medication.schedules))
         )
-        await self.session.commit()
-        return result.rowcount > 0
+        medications = list(result.scalars().all())
+        has_more = len(medications) > limit
+        medications = medications[:limit]
+        
+        if backward:
+            # Курсор указывал на лекарство следующей страницы
+            return Page(items=medications[::-1], has_prev=has_more, has_next=True)
+        return Page(items=medications, has_prev=after_id is not None, has_next=has_more)
+    
+    async def delete(self, medication_id: int) -> Optional[int]:
+        """
+        Удалить лекарство (каскадно удалит расписания). Commit выполняет вызывающий код.
+        
+        Returns:
+            Optional[int]: ID владельца удаленного лекарства (None - лекарства нет)
+        """
+        result = await self.session.execute(
+            delete(Medication)
+            .where(Medication.id == medication_id)
+            .returning(Medication.user_id)
+        )
+        return result.scalar_one_or_none()
     
-    async def deactivate(self, medication_id: int) -> bool:
-        """Деактивировать лекарство."""
+    async def deactivate(self, medication_id: int) -> Optional[int]:
+        """
+        Деактивировать лекарство. Commit выполняет вызывающий код.
+        
+        Returns:
+            Optional[int]: ID владельца лекарства (None - лекарства нет)
+        """
         result = await self.session.execute(
             update(Medication)
             .where(Medication.id == medication_id)
             .values(is_active=False, updated_at=datetime.utcnow())
+            .returning(Medication.user_id)
         )
-        await self.session.commit()
-        return result.rowcount > 0
+        return result.scalar_one_or_none()
 
 
 class ScheduleRepository(BaseRepository):
@@ -107,7 +279,8 @@ class ScheduleRepository(BaseRepository):
     
     async def create(self, medication_id: int, frequency_type: str, dose: int,
                     time: time, start_date: date, interval_days: Optional[int] = None,
-                    end_date: Optional[date] = None) -> MedicationSchedule:
+                    end_date: Optional[date] = None,
+                    next_fire_at: Optional[datetime] = None) -> MedicationSchedule:
         """Создать новое расписание."""
         schedule = MedicationSchedule(
             medication_id=medication_id,
@@ -116,7 +289,8 @@ class ScheduleRepository(BaseRepository):
             dose=dose,
             time=time,
             start_date=start_date,
-            end_date=end_date
+            end_date=end_date,
+            next_fire_at=next_fire_at
         )
         self.session.add(schedule)
         await self.session.commit()
@@ -132,128 +306,526 @@ class ScheduleRepository(BaseRepository):
         )
         return result.scalar_one_or_none()
     
-    async def get_active_schedules(self) -> List[MedicationSchedule]:
-        """Получить все активные расписания с активными лекарствами."""
+    async def get_by_user(self, user_id: int) -> List[MedicationSchedule]:
+        """Получить все расписания лекарств пользователя."""
         result = await self.session.execute(
             select(MedicationSchedule)
             .join(Medication)
-            .where(Medication.is_active == True)
-            .options(
-                selectinload(MedicationSchedule.medication).selectinload(Medication.user)
+            .where(Medication.user_id == user_id)
+        )
+        return list(result.scalars().all())
+    
+    async def get_due_schedules(self, now: datetime,
+                                schedule_ids: Optional[List[int]] = None,
+                                shards: Optional[Shards] = None) -> List[MedicationSchedule]:
+        """Получить расписания активных лекарств, время срабатывания которых наступило."""
+        query = (
+            select(MedicationSchedule)
+            .join(Medication)
+            .where(
+                MedicationSchedule.next_fire_at <= now,
+                Medication.is_active == True
             )
         )
+        if schedule_ids is not None:
+            query = query.where(MedicationSchedule.id.in_(schedule_ids))
+        if shards is not None:
+            query = query.where(in_shards(MedicationSchedule.id, shards))
+        query = query.order_by(MedicationSchedule.next_fire_at).options(
+            selectinload(MedicationSchedule.medication).selectinload(Medication.user)
+        )
+        result = await self.session.execute(query)
         return list(result.scalars().all())
+    
+    async def get_fire_times(self, until: Optional[datetime] = None,
+                             schedule_ids: Optional[List[int]] = None,
+                             user_id: Optional[int] = None,
+                             shards: Optional[Shards] = None) -> List[tuple[int, int, datetime]]:
+        """
+        Получить время срабатывания активных расписаний без загрузки ORM-объектов.
+        
+        Returns:
+            List[tuple[int, int, datetime]]: (id расписания, id лекарства, next_fire_at)
+        """
+        query = (
+            select(
+                MedicationSchedule.id,
+                MedicationSchedule.medication_id,
+                MedicationSchedule.next_fire_at
+            )
+            .join(Medication)
+            .where(
+                MedicationSchedule.next_fire_at.is_not(None),
+                Medication.is_active == True
+            )
+        )
+        if until is not None:
+            query = query.where(MedicationSchedule.next_fire_at <= until)
+        if schedule_ids is not None:
+            query = query.where(MedicationSchedule.id.in_(schedule_ids))
+        if user_id is not None:
+            query = query.where(Medication.user_id == user_id)
+        if shards is not None:
+            query = query.where(in_shards(MedicationSchedule.id, shards))
+        result = await self.session.execute(query)
+        return [tuple(row) for row in result.all()]
 
 
 class NotificationRepository(BaseRepository):
     """Репозиторий для работы с уведомлениями."""
     
-    async def create_log(self, schedule_id: int, scheduled_time: datetime) -> NotificationLog:
-        """Создать лог уведомления."""
-        log = NotificationLog(
-            schedule_id=schedule_id,
-            scheduled_time=scheduled_time,
-            status='pending'
+    async def create_logs(self, logs: List[dict]) -> dict[int, int]:
+        """
+        Записать пачку логов уведомлений.
+        
+        Многострочный INSERT ... ON CONFLICT DO NOTHING RETURNING; строки,
+        для которых лог за этот день уже существует, пропускаются.
+        Без commit - фиксирует вызывающий код.
+        
+        Args:
+            logs: Значения колонок NotificationLog (schedule_id, local_date, status, ...)
+        
+        Returns:
+            dict[int, int]: schedule_id -> ID созданного лога
+        """
+        created = {}
+        for offset in range(0, len(logs), config.NOTIFICATION_LOG_BATCH_SIZE):
+            result = await self.session.execute(
+                insert(NotificationLog)
+                .values(logs[offset:offset + config.NOTIFICATION_LOG_BATCH_SIZE])
+                .on_conflict_do_nothing(index_elements=['schedule_id', 'local_date'])
+                .returning(NotificationLog.schedule_id, NotificationLog.id)
+            )
+            created.update({schedule_id: log_id for schedule_id, log_id in result.all()})
+        return created
+    
+    async def get_unnotified_schedule_ids(self, candidates: List[tuple[int, date]]) -> Set[int]:
+        """
+        Отобрать расписания, по которым еще нет лога за указанную локальную дату.
+        
+        Один запрос (анти-join) для всех кандидатов тика.
+        
+        Args:
+            candidates: Пары (id расписания, локальная дата приема)
+        """
+        if not candidates:
+            return set()
+        
+        candidate_rows = typed_values(
+            'candidates',
+            [('schedule_id', Integer), ('local_date', Date)],
+            candidates
         )
-        self.session.add(log)
-        await self.session.commit()
-        await self.session.refresh(log)
-        return log
-    
-    async def update_log_status(self, log_id: int, status: str, 
-                               message_id: Optional[int] = None,
-                               error_message: Optional[str] = None) -> bool:
-        """Обновить статус лога уведомления."""
-        values = {
-            'status': status,
-            'sent_at': datetime.utcnow() if status in ('sent', 'delivered') else None,
-            'attempts': NotificationLog.attempts + 1
-        }
-        if message_id:
-            values['message_id'] = message_id
-        if error_message:
-            values['error_message'] = error_message
         
+        # Явные границы дат ограничивают join секциями этих дней
+        dates = [local_date for _, local_date in candidates]
         result = await self.session.execute(
-            update(NotificationLog)
-            .where(NotificationLog.id == log_id)
-            .values(**values)
+            select(candidate_rows.c.schedule_id)
+            .select_from(candidate_rows)
+            .outerjoin(
+                NotificationLog,
+                and_(
+                    NotificationLog.schedule_id == candidate_rows.c.schedule_id,
+                    NotificationLog.local_date == candidate_rows.c.local_date,
+                    NotificationLog.local_date.between(min(dates), max(dates))
+                )
+            )
+            .where(NotificationLog.id.is_(None))
         )
-        await self.session.commit()
-        return result.rowcount > 0
+        return set(result.scalars().all())
     
-    async def create_retry(self, notification_log_id: int, retry_at: datetime, 
-                          attempt_number: int) -> NotificationRetry:
-        """Создать запись о повторной попытке."""
-        retry = NotificationRetry(
-            notification_log_id=notification_log_id,
-            retry_at=retry_at,
-            attempt_number=attempt_number,
-            status='pending'
+    async def update_log_results(self, results: List[dict]) -> None:
+        """
+        Записать результаты попыток отправки для пачки логов одним UPDATE ... FROM (VALUES ...).
+        
+        Без commit - фиксирует вызывающий код.
+        
+        Args:
+            results: Словари с ключами log_id, local_date, status, attempts, sent_at, message_id, error_message
+        """
+        if not results:
+            return
+        
+        result_rows = typed_values(
+            'results',
+            [
+                ('log_id', Integer),
+                ('local_date', Date),
+                ('status', String),
+                ('attempts', Integer),
+                ('sent_at', TIMESTAMP(timezone=True)),
+                ('message_id', BigInteger),
+                ('error_message', Text),
+            ],
+            [
+                (row['log_id'], row['local_date'], row['status'], row['attempts'],
+                 row['sent_at'], row['message_id'], row['error_message'])
+                for row in results
+            ]
         )
-        self.session.add(retry)
-        await self.session.commit()
-        await self.session.refresh(retry)
-        return retry
-    
-    async def get_pending_retries(self, current_time: datetime) -> List[NotificationRetry]:
-        """Получить все ожидающие повторные попытки."""
-        result = await self.session.execute(
-            select(NotificationRetry)
+        
+        await self.session.execute(
+            update(NotificationLog)
             .where(
-                NotificationRetry.status == 'pending',
-                NotificationRetry.retry_at <= current_time
+                NotificationLog.id == result_rows.c.log_id,
+                # Ключ секционирования: строка ищется только в своей секции
+                NotificationLog.local_date == result_rows.c.local_date,
+                NotificationLog.local_date.between(
+                    min(row['local_date'] for row in results),
+                    max(row['local_date'] for row in results)
+                )
             )
-            .options(
-                selectinload(NotificationRetry.notification_log)
-                .selectinload(NotificationLog.schedule)
-                .selectinload(MedicationSchedule.medication)
-                .selectinload(Medication.user)
+            .values(
+                status=result_rows.c.status,
+                sent_at=result_rows.c.sent_at,
+                message_id=func.coalesce(result_rows.c.message_id, NotificationLog.message_id),
+                error_message=func.coalesce(result_rows.c.error_message, NotificationLog.error_message),
+                attempts=result_rows.c.attempts
             )
+            .execution_options(synchronize_session=False)
         )
-        return list(result.scalars().all())
+
+
+class OutboxRepository(BaseRepository):
+    """
+    Репозиторий очереди исходящих уведомлений (notification_outbox).
+    
+    Методы не делают commit: постановка в очередь фиксируется вместе
+    с логами и next_fire_at, а захват и результаты отправки - каждый
+    своей короткой транзакцией (dispatch_outbox_batch).
+    """
     
-    async def check_notification_sent_today(self, schedule_id: int, target_date: date) -> bool:
-        """Проверить, было ли отправлено уведомление для этого расписания сегодня."""
-        start_of_day = datetime.combine(target_date, datetime.min.time())
-        end_of_day = datetime.combine(target_date, datetime.max.time())
+    async def enqueue(self, messages: List[dict]) -> None:
+        """
+        Поставить уведомления в очередь многострочным INSERT.
         
-        result = await self.session.execute(
-            select(NotificationLog)
-            .where(
-                NotificationLog.schedule_id == schedule_id,
-                NotificationLog.scheduled_time >= start_of_day,
-                NotificationLog.scheduled_time <= end_of_day,
-                NotificationLog.status.in_(['sent', 'delivered'])
+        Args:
+            messages: Словари с ключами notification_log_id, local_date, chat_id, medication_id,
+                message_text, due_at, next_attempt_at
+        """
+        for offset in range(0, len(messages), config.NOTIFICATION_LOG_BATCH_SIZE):
+            await self.session.execute(
+                insert(NotificationOutbox)
+                .values(messages[offset:offset + config.NOTIFICATION_LOG_BATCH_SIZE])
             )
+    
+    async def claim(self, now: datetime, limit: int,
+                    lease_seconds: float) -> List[tuple[NotificationOutbox, datetime]]:
+        """
+        Захватить пачку наступивших уведомлений арендой.
+        
+        Один UPDATE: строки выбираются через FOR UPDATE SKIP LOCKED, и их
+        next_attempt_at переносится на now + lease_seconds. После commit
+        блокировок нет, а другие обработчики не видят строки до истечения
+        аренды. Если процесс упадет во время отправки, строки снова станут
+        наступившими через lease_seconds; повторно отправятся только
+        сообщения этой пачки, чьи результаты не успели записать.
+        
+        Returns:
+            List[tuple[NotificationOutbox, datetime]]: Строка и время попытки до захвата
+        """
+        claimable = (
+            select(NotificationOutbox.id, NotificationOutbox.next_attempt_at.label('attempt_at'))
+            .where(NotificationOutbox.next_attempt_at <= now)
+            .order_by(NotificationOutbox.next_attempt_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .subquery('claimable')
+        )
+        result = await self.session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id == claimable.c.id)
+            .values(next_attempt_at=now + timedelta(seconds=lease_seconds))
+            .returning(NotificationOutbox, claimable.c.attempt_at)
+            .execution_options(synchronize_session=False)
+        )
+        return [(row, attempt_at) for row, attempt_at in result.all()]
+    
+    async def reschedule(self, attempts: List[tuple[int, int, datetime]]) -> None:
+        """
+        Перенести неудачные отправки на следующую попытку одним UPDATE ... FROM (VALUES ...).
+        
+        Args:
+            attempts: Тройки (ID строки, сделано попыток, время следующей попытки)
+        """
+        if not attempts:
+            return
+        
+        attempt_rows = typed_values(
+            'next_attempts',
+            [('id', BigInteger), ('attempts', Integer), ('next_attempt_at', TIMESTAMP(timezone=True))],
+            attempts
+        )
+        await self.session.execute(
+            update(NotificationOutbox)
+            .where(NotificationOutbox.id == attempt_rows.c.id)
+            .values(attempts=attempt_rows.c.attempts, next_attempt_at=attempt_rows.c.next_attempt_at)
+            .execution_options(synchronize_session=False)
         )
-        return result.scalar_one_or_none() is not None
     
-    async def update_retry_status(self, retry_id: int, status: str) -> bool:
-        """Обновить статус повторной попытки."""
+    async def delete(self, ids: List[int]) -> None:
+        """Удалить завершенные уведомления (отправлены или попытки исчерпаны)."""
+        if not ids:
+            return
+        
+        await self.session.execute(
+            delete(NotificationOutbox)
+            .where(NotificationOutbox.id.in_(ids))
+            .execution_options(synchronize_session=False)
+        )
+    
+    async def get_backlog(self, now: datetime) -> tuple[int, int, float]:
+        """
+        Размер очереди.
+        
+        Returns:
+            tuple[int, int, float]: (всего в очереди, из них наступивших, возраст самого старого наступившего в секундах)
+        """
         result = await self.session.execute(
-            update(NotificationRetry)
-            .where(NotificationRetry.id == retry_id)
-            .values(status=status)
+            select(
+                func.count(),
+                func.count().filter(NotificationOutbox.next_attempt_at <= now),
+                func.min(NotificationOutbox.next_attempt_at).filter(NotificationOutbox.next_attempt_at <= now)
+            )
         )
-        await self.session.commit()
-        return result.rowcount > 0
+        pending, due, oldest = result.one()
+        age = (now - oldest).total_seconds() if oldest is not None else 0.0
+        return pending, due, age
+
+
+class AdherenceRepository(BaseRepository):
+    """Репозиторий дневной сводки уведомлений (adherence_daily)."""
+    
+    async def apply(self, deltas: List[dict]) -> None:
+        """
+        Прибавить приращения к сводке одним многострочным upsert.
+        
+        Строки блокируются в порядке ключа, чтобы параллельные обработчики
+        не взаимоблокировались. Без commit - приращения фиксируются вместе
+        с логами, которые их вызвали.
+        
+        Args:
+            deltas: Словари с ключами user_id, medication_id, local_date, scheduled,
+                sent, failed, retried, lag_seconds_total, lag_seconds_max
+        """
+        if not deltas:
+            return
+        
+        rows = sorted(deltas, key=lambda row: (row['user_id'], row['medication_id'], row['local_date']))
+        for offset in range(0, len(rows), config.NOTIFICATION_LOG_BATCH_SIZE):
+            statement = insert(AdherenceDaily).values(rows[offset:offset + config.NOTIFICATION_LOG_BATCH_SIZE])
+            await self.session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=['user_id', 'medication_id', 'local_date'],
+                    set_={
+                        'scheduled': AdherenceDaily.scheduled + statement.excluded.scheduled,
+                        'sent': AdherenceDaily.sent + statement.excluded.sent,
+                        'failed': AdherenceDaily.failed + statement.excluded.failed,
+                        'retried': AdherenceDaily.retried + statement.excluded.retried,
+                        'lag_seconds_total': AdherenceDaily.lag_seconds_total + statement.excluded.lag_seconds_total,
+                        'lag_seconds_max': func.greatest(AdherenceDaily.lag_seconds_max, statement.excluded.lag_seconds_max),
+                    }
+                )
+            )
     
-    async def get_user_notification_logs(self, user_id: int, since_date: datetime) -> List[NotificationLog]:
-        """Получить все логи уведомлений пользователя с указанной даты."""
+    async def get_summary(self, user_id: int, since: date, until: date) -> List[tuple]:
+        """
+        Сводка пользователя по лекарствам за период.
+        
+        Returns:
+            List[tuple]: (название лекарства, scheduled, sent, failed, retried, lag_seconds_total, lag_seconds_max)
+        """
         result = await self.session.execute(
-            select(NotificationLog)
-            .join(NotificationLog.schedule)
-            .join(MedicationSchedule.medication)
+            select(
+                Medication.name,
+                func.sum(AdherenceDaily.scheduled),
+                func.sum(AdherenceDaily.sent),
+                func.sum(AdherenceDaily.failed),
+                func.sum(AdherenceDaily.retried),
+                func.sum(AdherenceDaily.lag_seconds_total),
+                func.max(AdherenceDaily.lag_seconds_max)
+            )
+            .join(Medication, Medication.id == AdherenceDaily.medication_id)
             .where(
-                Medication.user_id == user_id,
-                NotificationLog.scheduled_time >= since_date
+                AdherenceDaily.user_id == user_id,
+                AdherenceDaily.local_date.between(since, until)
             )
-            .order_by(NotificationLog.scheduled_time.desc())
-            .options(
-                selectinload(NotificationLog.schedule)
-                .selectinload(MedicationSchedule.medication)
+            .group_by(Medication.id, Medication.name)
+            .order_by(Medication.name)
+        )
+        return [tuple(row) for row in result.all()]
+    
+    async def rebuild(self, since: date, until: date) -> int:
+        """
+        Пересчитать сводку за период из notification_logs.
+        
+        DELETE и INSERT ... SELECT выполняются в одной транзакции (commit делает
+        вызывающий код). Параллельные инкрементальные обновления не теряются и
+        не учитываются дважды: строка лога и ее приращение фиксируются вместе,
+        а каждый запрос READ COMMITTED видит уже зафиксированные изменения.
+        
+        Returns:
+            int: Количество строк сводки за период
+        """
+        await self.session.execute(
+            delete(AdherenceDaily).where(AdherenceDaily.local_date.between(since, until))
+        )
+        
+        # Неудачная попытка окончательна, только если строки в outbox больше нет
+        finished = NotificationOutbox.id.is_(None)
+        is_sent = NotificationLog.status.in_(('sent', 'delivered'))
+        lag = func.extract('epoch', NotificationLog.sent_at - NotificationLog.scheduled_time)
+        
+        aggregated = (
+            select(
+                Medication.user_id,
+                Medication.id,
+                NotificationLog.local_date,
+                func.count(),
+                func.count().filter(is_sent),
+                func.count().filter(NotificationLog.status == 'failed', finished),
+                func.count().filter(NotificationLog.attempts > 1, finished),
+                func.coalesce(func.sum(lag).filter(is_sent), 0),
+                func.coalesce(func.max(lag).filter(is_sent), 0)
             )
+            .select_from(NotificationLog)
+            .join(MedicationSchedule, MedicationSchedule.id == NotificationLog.schedule_id)
+            .join(Medication, Medication.id == MedicationSchedule.medication_id)
+            .outerjoin(
+                NotificationOutbox,
+                and_(
+                    NotificationOutbox.notification_log_id == NotificationLog.id,
+                    NotificationOutbox.local_date == NotificationLog.local_date
+                )
+            )
+            .where(NotificationLog.local_date.between(since, until))
+            .group_by(Medication.user_id, Medication.id, NotificationLog.local_date)
         )
-        return list(result.scalars().all())
+        result = await self.session.execute(
+            insert(AdherenceDaily).from_select(
+                ['user_id', 'medication_id', 'local_date', 'scheduled', 'sent', 'failed',
+                 'retried', 'lag_seconds_total', 'lag_seconds_max'],
+                aggregated
+            )
+        )
+        return result.rowcount
 
+
+class LeaseRepository(BaseRepository):
+    """
+    Репозиторий аренд планировщика.
+    
+    Время истечения считается по часам БД (now()), чтобы расхождение
+    часов между серверами не влияло на владение. Методы сами делают commit:
+    аренда должна быть видна другим процессам сразу.
+    """
+    
+    async def acquire(self, names: List[str], owner: str, ttl_seconds: float) -> dict[str, int]:
+        """
+        Захватить свободные, истекшие или уже свои аренды.
+        
+        Returns:
+            dict[str, int]: Захваченные аренды -> токен (растет при смене владельца)
+        """
+        if not names:
+            return {}
+        
+        expires_at = func.now() + timedelta(seconds=ttl_seconds)
+        statement = insert(SchedulerLease).values([
+            {'name': name, 'owner': owner, 'expires_at': expires_at, 'token': 1} for name in names
+        ])
+        result = await self.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=['name'],
+                set_={
+                    'owner': statement.excluded.owner,
+                    'expires_at': statement.excluded.expires_at,
+                    'token': case(
+                        (SchedulerLease.owner == statement.excluded.owner, SchedulerLease.token),
+                        else_=SchedulerLease.token + 1
+                    ),
+                },
+                where=(SchedulerLease.owner == statement.excluded.owner) | (SchedulerLease.expires_at < func.now())
+            ).returning(SchedulerLease.name, SchedulerLease.token)
+        )
+        acquired = {name: token for name, token in result.all()}
+        await self.session.commit()
+        return acquired
+    
+    async def renew(self, names: List[str], owner: str, ttl_seconds: float) -> Set[str]:
+        """
+        Продлить свои аренды.
+        
+        Returns:
+            Set[str]: Аренды, которые все еще принадлежат owner
+        """
+        if not names:
+            return set()
+        
+        result = await self.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name.in_(names), SchedulerLease.owner == owner)
+            .values(expires_at=func.now() + timedelta(seconds=ttl_seconds))
+            .returning(SchedulerLease.name)
+        )
+        renewed = set(result.scalars().all())
+        await self.session.commit()
+        return renewed
+    
+    async def release(self, names: List[str], owner: str) -> None:
+        """Освободить свои аренды досрочно."""
+        if not names:
+            return
+        
+        await self.session.execute(
+            update(SchedulerLease)
+            .where(SchedulerLease.name.in_(names), SchedulerLease.owner == owner)
+            .values(expires_at=func.now())
+        )
+        await self.session.commit()
+    
+    async def delete(self, names: List[str], owner: str) -> None:
+        """Удалить свои аренды (например, членство останавливаемого процесса)."""
+        if not names:
+            return
+        
+        await self.session.execute(
+            delete(SchedulerLease)
+            .where(SchedulerLease.name.in_(names), SchedulerLease.owner == owner)
+        )
+        await self.session.commit()
+    
+    async def purge_expired(self, prefix: str, expired_for_seconds: float,
+                            fence: Optional[Fence] = None) -> int:
+        """
+        Удалить аренды с префиксом имени, истекшие больше expired_for_seconds назад.
+        
+        Args:
+            fence: Fencing token лидера (ничего не удаляется, если лидерство потеряно)
+        
+        Returns:
+            int: Количество удаленных аренд
+        """
+        conditions = [
+            SchedulerLease.name.startswith(prefix),
+            SchedulerLease.expires_at < func.now() - timedelta(seconds=expired_for_seconds)
+        ]
+        if fence:
+            conditions.append(holds_lease(fence))
+        
+        result = await self.session.execute(delete(SchedulerLease).where(*conditions))
+        await self.session.commit()
+        return result.rowcount
+    
+    async def get_live(self, prefix: str) -> dict[str, str]:
+        """
+        Получить действующие аренды с указанным префиксом имени.
+        
+        Returns:
+            dict[str, str]: Имя аренды -> владелец
+        """
+        result = await self.session.execute(
+            select(SchedulerLease.name, SchedulerLease.owner)
+            .where(SchedulerLease.name.startswith(prefix), SchedulerLease.expires_at >= func.now())
+        )
+        return {name: owner for name, owner in result.all()}
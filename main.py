@@ -1,14 +1,13 @@
 """Точка входа приложения."""
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import config
-from bot.middlewares.user_middleware import UserMiddleware
-from bot.middlewares.error_middleware import ErrorMiddleware
-from bot.handlers import start, medication, schedule, edit_and_settings, simple_stats
-from scheduler.notification_scheduler import setup_scheduler
+from bot.app import create_bot, create_dispatcher
+from bot.webhook import run_webhook
+from scheduler.notification_scheduler import setup_scheduler, start_scheduling_engine, stop_scheduling_engine
+from monitoring.server import start_metrics_server
+from database.change_feed import change_listener
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,35 +25,45 @@ async def main():
         return
     
     # Инициализация бота и диспетчера
-    bot = Bot(token=config.BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    bot = create_bot()
+    dp = create_dispatcher()
     
-    # Регистрация middleware (порядок важен - последний добавленный выполняется первым)
-    dp.message.middleware(ErrorMiddleware())
-    dp.callback_query.middleware(ErrorMiddleware())
-    dp.message.middleware(UserMiddleware())
-    dp.callback_query.middleware(UserMiddleware())
+    # Кэши процесса сбрасываются по изменениям из других процессов
+    change_listener.start(listen=config.CHANGE_FEED_ENABLED)
     
-    # Регистрация роутеров
-    dp.include_router(start.router)
-    dp.include_router(medication.router)
-    dp.include_router(schedule.router)
-    dp.include_router(edit_and_settings.router)
-    dp.include_router(simple_stats.router)
+    # Настройка планировщика (можно вынести в отдельные процессы scheduler.worker)
+    scheduler = None
+    if config.RUN_SCHEDULER:
+        scheduler = setup_scheduler(bot)
+        scheduler.start()
+        await start_scheduling_engine(bot)
+        logger.info("✅ Планировщик запущен")
     
-    # Настройка планировщика
-    scheduler = setup_scheduler(bot)
-    scheduler.start()
-    logger.info("✅ Планировщик запущен")
+    # Сервер метрик работает в том же event loop, что и прием апдейтов
+    metrics_runner = None
+    if config.METRICS_ENABLED:
+        metrics_runner = await start_metrics_server(config.METRICS_HOST, config.METRICS_PORT)
     
     try:
-        logger.info("🚀 Бот запущен!")
-        # Запуск polling
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.BOT_MODE == 'webhook':
+            # Апдейты принимают процессы-воркеры, этот процесс следит за ними
+            await run_webhook(bot, dp)
+        else:
+            logger.info("🚀 Бот запущен!")
+            # Webhook мешает getUpdates: снимаем его, если бот раньше работал в режиме webhook
+            await bot.delete_webhook()
+            # Запуск polling
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
     finally:
-        scheduler.shutdown()
+        if scheduler:
+            await stop_scheduling_engine()
+            scheduler.shutdown()
+        await change_listener.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await dp.storage.close()
         await bot.session.close()
 
 
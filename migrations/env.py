@@ -0,0 +1,85 @@
+"""Окружение Alembic: миграции выполняются через asyncpg с настройками из config.py."""
+import asyncio
+import re
+from logging.config import fileConfig
+
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembic import context
+
+from config import config as app_config
+from database.base import Base
+import database.models  # noqa: F401 - регистрирует модели в Base.metadata
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get('configure_logger', True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+# Месячные секции notification_logs создаются во время работы (database.partitions)
+# и не описаны в моделях - autogenerate не должен предлагать их удалить
+PARTITION_NAME = re.compile(r'^notification_logs_\d{4}_\d{2}')
+
+
+def include_name(name, type_, parent_names) -> bool:
+    """Исключить секции notification_logs и их индексы из сравнения со схемой."""
+    if type_ == 'table':
+        return not PARTITION_NAME.match(name or '')
+    if type_ == 'index':
+        return not PARTITION_NAME.match(parent_names.get('table_name') or '')
+    return True
+
+
+def run_migrations_offline() -> None:
+    """Вывести SQL миграций без подключения к базе (alembic upgrade --sql)."""
+    context.configure(
+        url=app_config.database_url,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        include_name=include_name,
+        # Каждая ревизия - своя транзакция: ревизии с CONCURRENTLY
+        # выходят из нее через autocommit_block
+        transaction_per_migration=True,
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    """Выполнить миграции через отдельный engine без пула."""
+    # Не используем database.base.engine: миграции могут запускаться
+    # в отдельном потоке со своим event loop (database.init_db)
+    connectable = create_async_engine(app_config.database_url, poolclass=pool.NullPool)
+
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
+def run_migrations_online() -> None:
+    """Выполнить миграции на базе из настроек приложения."""
+    asyncio.run(run_async_migrations())
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
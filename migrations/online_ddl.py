@@ -0,0 +1,42 @@
+"""
+Создание индексов без блокировки записи для ревизий Alembic.
+
+CREATE INDEX CONCURRENTLY не выполняется в транзакции, поэтому помощники
+работают в autocommit_block. Прерванная сборка оставляет невалидный индекс:
+он удаляется и строится заново, так что ревизию можно просто перезапустить.
+"""
+from alembic import op
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+
+def _require_online() -> Connection:
+    if op.get_context().as_sql:
+        raise RuntimeError("Создание индексов CONCURRENTLY требует подключения к базе (без --sql)")
+    return op.get_bind()
+
+
+def _is_invalid(bind: Connection, name: str) -> bool:
+    return bool(bind.execute(
+        text("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"),
+        {'name': name}
+    ).scalar())
+
+
+def _build_concurrently(bind: Connection, name: str, table: str, columns: str) -> None:
+    if _is_invalid(bind, name):
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+    op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def create_index_concurrently(name: str, table: str, columns: str) -> None:
+    """Создать индекс на обычной таблице, не блокируя запись."""
+    bind = _require_online()
+    with op.get_context().autocommit_block():
+        _build_concurrently(bind, name, table, columns)
+
+
+def drop_index_concurrently(name: str) -> None:
+    """Удалить индекс обычной таблицы, не блокируя запись."""
+    with op.get_context().autocommit_block():
+        op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
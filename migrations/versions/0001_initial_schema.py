@@ -0,0 +1,291 @@
+"""Начальная схема
+
+Приводит исходную схему (ревизия 0000) к схеме с планированием по
+next_fire_at, секционированной notification_logs и очередью отправки:
+- medication_schedules получает next_fire_at, рассчитанный для
+  существующих расписаний (требуется подключение к базе, без --sql);
+- notification_retries удаляется: повторные попытки ведет
+  notification_outbox, незавершенные старые повторы не переносятся;
+- логи переносятся в секционированную по local_date (дата приема
+  в часовом поясе пользователя) notification_logs с секциями на все
+  месяцы с логами; из повторов за один день остается один лог
+  (отправленный, иначе самый ранний);
+- создаются notification_outbox, adherence_daily (для перенесенных логов
+  заполняется командой database.backfill_adherence), fsm_states
+  и scheduler_leases.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import pytz
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = '0000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Расчет next_fire_at - копия services.schedule_calculator на момент ревизии:
+# миграция не должна меняться вместе с кодом приложения
+
+def _step_days(schedule) -> Optional[int]:
+    if schedule.frequency_type == 'daily':
+        return 1
+    if schedule.frequency_type == 'interval' and schedule.interval_days:
+        return schedule.interval_days
+    return None
+
+
+def _first_occurrence_on_or_after(schedule, from_date: date) -> Optional[date]:
+    step = _step_days(schedule)
+    if step is None:
+        return None
+
+    candidate = max(from_date, schedule.start_date)
+    offset = (candidate - schedule.start_date).days % step
+    if offset:
+        candidate += timedelta(days=step - offset)
+
+    if schedule.end_date and candidate > schedule.end_date:
+        return None
+
+    return candidate
+
+
+def _localize(user_tz: pytz.BaseTzInfo, local_time: datetime) -> datetime:
+    try:
+        return user_tz.localize(local_time, is_dst=None)
+    except pytz.NonExistentTimeError:
+        return user_tz.normalize(user_tz.localize(local_time, is_dst=False))
+    except pytz.AmbiguousTimeError:
+        return user_tz.localize(local_time, is_dst=True)
+
+
+def _calculate_next_fire_at(schedule, timezone_name: str, after: datetime) -> Optional[datetime]:
+    user_tz = pytz.timezone(timezone_name)
+    after_user_tz = after.astimezone(user_tz)
+
+    target_date = _first_occurrence_on_or_after(schedule, after_user_tz.date())
+    if target_date is None:
+        return None
+
+    fire_at = _localize(user_tz, datetime.combine(target_date, schedule.time))
+    if fire_at <= after:
+        target_date = _first_occurrence_on_or_after(
+            schedule,
+            target_date + timedelta(days=_step_days(schedule))
+        )
+        if target_date is None:
+            return None
+        fire_at = _localize(user_tz, datetime.combine(target_date, schedule.time))
+
+    return fire_at.astimezone(pytz.UTC)
+
+
+def _backfill_next_fire_at() -> None:
+    """Рассчитать next_fire_at существующих расписаний."""
+    if op.get_context().as_sql:
+        raise RuntimeError("Расчет next_fire_at требует подключения к базе (без --sql)")
+
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT s.id, s.frequency_type, s.interval_days, s.time, s.start_date, s.end_date, u.timezone "
+        "FROM medication_schedules s "
+        "JOIN medications m ON m.id = s.medication_id "
+        "JOIN users u ON u.id = m.user_id"
+    )).all()
+
+    now_utc = datetime.now(pytz.UTC)
+    updates = []
+    for row in rows:
+        next_fire_at = _calculate_next_fire_at(row, row.timezone, now_utc)
+        if next_fire_at is not None:
+            updates.append({'schedule_id': row.id, 'next_fire_at': next_fire_at})
+
+    if updates:
+        bind.execute(
+            sa.text("UPDATE medication_schedules SET next_fire_at = :next_fire_at WHERE id = :schedule_id"),
+            updates
+        )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('medication_schedules', sa.Column('next_fire_at', sa.TIMESTAMP(timezone=True), nullable=True))
+    op.create_index('ix_medication_schedules_next_fire_at', 'medication_schedules', ['next_fire_at'])
+    _backfill_next_fire_at()
+
+    op.drop_table('notification_retries')
+
+    # Старая таблица логов освобождает имена ключа и последовательности для новой
+    op.rename_table('notification_logs', 'notification_logs_legacy')
+    op.execute("ALTER TABLE notification_logs_legacy RENAME CONSTRAINT notification_logs_pkey TO notification_logs_legacy_pkey")
+    op.execute("ALTER SEQUENCE notification_logs_id_seq RENAME TO notification_logs_legacy_id_seq")
+    op.add_column('notification_logs_legacy', sa.Column('local_date', sa.Date(), nullable=True))
+    op.execute(
+        "UPDATE notification_logs_legacy AS l "
+        "SET local_date = (l.scheduled_time AT TIME ZONE u.timezone)::date "
+        "FROM medication_schedules s "
+        "JOIN medications m ON m.id = s.medication_id "
+        "JOIN users u ON u.id = m.user_id "
+        "WHERE s.id = l.schedule_id"
+    )
+
+    # Секции создает database.partitions.ensure_partitions
+    op.create_table(
+        'notification_logs',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('schedule_id', sa.Integer(), nullable=False),
+        sa.Column('scheduled_time', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('local_date', sa.Date(), nullable=False),
+        sa.Column('sent_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('message_id', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['schedule_id'], ['medication_schedules.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id', 'local_date'),
+        sa.UniqueConstraint('schedule_id', 'local_date', name='uq_notification_logs_schedule_local_date'),
+        postgresql_partition_by='RANGE (local_date)',
+    )
+
+    # Секции месяцев перенесенных логов (имена - как в database.partitions)
+    op.execute(
+        "DO $$ DECLARE month date; BEGIN "
+        "FOR month IN SELECT DISTINCT date_trunc('month', local_date)::date FROM notification_logs_legacy LOOP "
+        "EXECUTE format('CREATE TABLE %I PARTITION OF notification_logs FOR VALUES FROM (%L) TO (%L)', "
+        "'notification_logs_' || to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date); "
+        "END LOOP; END $$"
+    )
+    op.execute(
+        "INSERT INTO notification_logs "
+        "(id, schedule_id, scheduled_time, local_date, sent_at, status, attempts, error_message, message_id) "
+        "SELECT DISTINCT ON (schedule_id, local_date) "
+        "id, schedule_id, scheduled_time, local_date, sent_at, status, attempts, error_message, message_id "
+        "FROM notification_logs_legacy "
+        "ORDER BY schedule_id, local_date, status = 'sent' DESC, id"
+    )
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('notification_logs', 'id'), COALESCE(max(id), 0) + 1, false) "
+        "FROM notification_logs"
+    )
+    op.drop_table('notification_logs_legacy')
+
+    op.create_table(
+        'notification_outbox',
+        sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('notification_log_id', sa.Integer(), nullable=False),
+        sa.Column('local_date', sa.Date(), nullable=False),
+        sa.Column('chat_id', sa.BigInteger(), nullable=False),
+        sa.Column('medication_id', sa.Integer(), nullable=False),
+        sa.Column('message_text', sa.Text(), nullable=False),
+        sa.Column('due_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('next_attempt_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP'), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['notification_log_id', 'local_date'],
+            ['notification_logs.id', 'notification_logs.local_date'],
+            ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('notification_log_id'),
+    )
+    op.create_index('ix_notification_outbox_next_attempt_at', 'notification_outbox', ['next_attempt_at'])
+
+    op.create_table(
+        'adherence_daily',
+        sa.Column('user_id', sa.BigInteger(), nullable=False),
+        sa.Column('medication_id', sa.Integer(), nullable=False),
+        sa.Column('local_date', sa.Date(), nullable=False),
+        sa.Column('scheduled', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('sent', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('failed', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('retried', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('lag_seconds_total', sa.Float(), server_default='0', nullable=False),
+        sa.Column('lag_seconds_max', sa.Float(), server_default='0', nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['medication_id'], ['medications.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'medication_id', 'local_date'),
+    )
+    op.create_index('ix_adherence_daily_user_date', 'adherence_daily', ['user_id', 'local_date'])
+
+    op.create_table(
+        'fsm_states',
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('state', sa.String(length=255), nullable=True),
+        sa.Column('data', postgresql.JSONB(astext_type=sa.Text()), server_default=sa.text("'{}'::jsonb"), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('key'),
+    )
+    op.create_index('ix_fsm_states_expires_at', 'fsm_states', ['expires_at'])
+
+    op.create_table(
+        'scheduler_leases',
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('owner', sa.String(length=255), nullable=False),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('token', sa.BigInteger(), server_default='1', nullable=False),
+        sa.PrimaryKeyConstraint('name'),
+    )
+    op.create_index('ix_scheduler_leases_expires_at', 'scheduler_leases', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('scheduler_leases')
+    op.drop_table('fsm_states')
+    op.drop_table('adherence_daily')
+    op.drop_table('notification_outbox')
+
+    # Логи возвращаются в несекционированную таблицу без local_date
+    op.execute(
+        "CREATE TABLE notification_logs_flat AS "
+        "SELECT id, schedule_id, scheduled_time, sent_at, status, attempts, error_message, message_id "
+        "FROM notification_logs"
+    )
+    # Удаляет и все секции
+    op.drop_table('notification_logs')
+    op.create_table(
+        'notification_logs',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('schedule_id', sa.Integer(), nullable=False),
+        sa.Column('scheduled_time', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('sent_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('error_message', sa.Text(), nullable=True),
+        sa.Column('message_id', sa.BigInteger(), nullable=True),
+        sa.ForeignKeyConstraint(['schedule_id'], ['medication_schedules.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO notification_logs SELECT * FROM notification_logs_flat")
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('notification_logs', 'id'), COALESCE(max(id), 0) + 1, false) "
+        "FROM notification_logs"
+    )
+    op.drop_table('notification_logs_flat')
+
+    op.create_table(
+        'notification_retries',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('notification_log_id', sa.Integer(), nullable=False),
+        sa.Column('retry_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('attempt_number', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.ForeignKeyConstraint(['notification_log_id'], ['notification_logs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    op.drop_index('ix_medication_schedules_next_fire_at', table_name='medication_schedules')
+    op.drop_column('medication_schedules', 'next_fire_at')
@@ -0,0 +1,38 @@
+"""Индексы горячих запросов
+
+Строятся CONCURRENTLY, запись в таблицы во время миграции не блокируется:
+- medications (user_id, is_active) - лекарства пользователя и активные
+  расписания;
+- medication_schedules (medication_id) - загрузка расписаний лекарств
+  и каскадное удаление.
+
+Очередь повторных попыток notification_retries заменена notification_outbox,
+ее предикат next_attempt_at уже покрыт индексом из 0001.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from migrations.online_ddl import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_index_concurrently('ix_medications_user_active', 'medications', 'user_id, is_active')
+    create_index_concurrently('ix_medication_schedules_medication_id', 'medication_schedules', 'medication_id')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_index_concurrently('ix_medication_schedules_medication_id')
+    drop_index_concurrently('ix_medications_user_active')
@@ -0,0 +1 @@
+"""Метрики приложения в формате Prometheus."""
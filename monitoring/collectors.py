@@ -0,0 +1,64 @@
+"""Коллекторы метрик, которые вычисляются в момент запроса /metrics."""
+from datetime import datetime
+import pytz
+
+from database.base import async_session_maker, get_pool_stats
+from database.cache import medication_cache, user_cache
+from database.query_stats import query_stats
+from database.repository import OutboxRepository
+from monitoring.metrics import (
+    registry,
+    OUTBOX_BACKLOG,
+    OUTBOX_OLDEST_DUE_AGE,
+    DB_POOL,
+    USER_CACHE,
+    MEDICATION_CACHE,
+    DB_OPERATION_STATEMENTS,
+    DB_OPERATION_SECONDS,
+    DB_OPERATION_LATENCY
+)
+
+
+async def collect_outbox_backlog() -> None:
+    """Очередь неотправленных уведомлений из notification_outbox."""
+    async with async_session_maker() as session:
+        pending, due, age = await OutboxRepository(session).get_backlog(datetime.now(pytz.UTC))
+    OUTBOX_BACKLOG.set(pending, state='pending')
+    OUTBOX_BACKLOG.set(due, state='due')
+    OUTBOX_OLDEST_DUE_AGE.set(age)
+
+
+async def collect_pool_stats() -> None:
+    """Занятость пула соединений и ожидание соединений."""
+    for field, value in get_pool_stats().items():
+        DB_POOL.set(value, field=field)
+
+
+async def collect_user_cache() -> None:
+    """Размер и попадания кэша пользователей."""
+    for field, value in user_cache.stats().items():
+        USER_CACHE.set(value, field=field)
+
+
+async def collect_medication_cache() -> None:
+    """Размер, попадания и устаревшие записи кэша снимков лекарств."""
+    for field, value in medication_cache.stats().items():
+        MEDICATION_CACHE.set(value, field=field)
+
+
+async def collect_query_stats() -> None:
+    """Количество и время SQL-запросов по методам репозиториев."""
+    for operation, stats in query_stats.snapshot().items():
+        DB_OPERATION_STATEMENTS.set_total(stats['statements'], operation=operation)
+        DB_OPERATION_SECONDS.set_total(stats['total_ms'] / 1000, operation=operation)
+        for quantile in ('50', '90', '99'):
+            DB_OPERATION_LATENCY.set(stats[f'p{quantile}_ms'] / 1000, operation=operation, quantile=f'0.{quantile}')
+
+
+def register_collectors() -> None:
+    """Подключить коллекторы к реестру метрик."""
+    registry.add_collector(collect_pool_stats)
+    registry.add_collector(collect_user_cache)
+    registry.add_collector(collect_medication_cache)
+    registry.add_collector(collect_query_stats)
+    registry.add_collector(collect_outbox_backlog)
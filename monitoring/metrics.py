@@ -0,0 +1,254 @@
+"""
+Минимальная реализация метрик Prometheus без внешних зависимостей.
+
+Запись метрики - это несколько операций со словарем в памяти, поэтому
+их можно вызывать в горячем пути (тик планировщика, обработка апдейтов).
+Дорогие значения (очередь повторных попыток, пул соединений) собираются
+коллекторами только в момент запроса /metrics.
+"""
+import logging
+from bisect import bisect_left
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Базовый класс метрики с набором меток."""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, '')) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.kind}',
+            *self.samples(),
+        ]
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels: str) -> None:
+        """Передать накопленное значение счетчика, который ведется в другом месте (для коллекторов)."""
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(Metric):
+    """Значение, которое может как расти, так и уменьшаться."""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}'
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> (счетчики по корзинам, сумма, количество)
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+Collector = Callable[[], Awaitable[None]]
+
+
+class Registry:
+    """Набор метрик и коллекторов, отдаваемых по /metrics."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labels: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labels))
+
+    def add_collector(self, collector: Collector) -> None:
+        """Добавить функцию, обновляющую метрики перед каждой выгрузкой."""
+        self._collectors.append(collector)
+
+    async def render(self) -> str:
+        """Собрать все метрики в текстовом формате Prometheus."""
+        for collector in self._collectors:
+            try:
+                await collector()
+            except Exception as e:
+                logger.error(f"Ошибка коллектора метрик {collector.__name__}: {e}")
+
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+# Планировщик
+TICK_DURATION = registry.histogram(
+    'scheduler_tick_duration_seconds', 'Длительность тика отправки уведомлений',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+SCHEDULES_SCANNED = registry.gauge(
+    'scheduler_tick_schedules_scanned', 'Расписаний, выбранных последним тиком'
+)
+SCHEDULES_SCANNED_TOTAL = registry.counter(
+    'scheduler_schedules_scanned_total', 'Расписаний, выбранных тиками'
+)
+CATCH_UP_COMPLETED = registry.gauge(
+    'scheduler_catch_up_completed_timestamp_seconds', 'Момент начала последнего завершенного догоняющего прохода (Unix time)'
+)
+SCHEDULES_DUE_TOTAL = registry.counter(
+    'scheduler_schedules_due_total', 'Расписаний, по которым нужно было отправить уведомление'
+)
+IS_LEADER = registry.gauge(
+    'scheduler_is_leader', 'Процесс выполняет одиночные задачи планировщика (1 - лидер)'
+)
+
+# Рассылка
+NOTIFICATIONS_TOTAL = registry.counter(
+    'notifications_total', 'Результаты отправки уведомлений', labels=('kind', 'status')
+)
+SEND_LATENCY = registry.histogram(
+    'notification_send_latency_seconds', 'Задержка отправки относительно запланированного времени',
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900)
+)
+
+# Очередь исходящих уведомлений (заполняются коллектором)
+OUTBOX_BACKLOG = registry.gauge(
+    'notification_outbox_pending', 'Неотправленные уведомления в outbox (включая ожидающие повтора)', labels=('state',)
+)
+OUTBOX_OLDEST_DUE_AGE = registry.gauge(
+    'notification_outbox_oldest_due_age_seconds', 'Возраст самого старого наступившего уведомления в outbox'
+)
+
+# Пул соединений и кэши (заполняются коллектором)
+DB_POOL = registry.gauge('db_pool', 'Состояние пула соединений', labels=('field',))
+USER_CACHE = registry.gauge('user_cache', 'Кэш пользователей', labels=('field',))
+MEDICATION_CACHE = registry.gauge('medication_cache', 'Кэш снимков лекарств пользователей', labels=('field',))
+
+# Канал изменений (LISTEN/NOTIFY)
+CHANGE_FEED_CONNECTED = registry.gauge(
+    'change_feed_connected', 'Слушатель канала изменений подключен к БД (1 - подключен)'
+)
+CHANGE_EVENTS_TOTAL = registry.counter(
+    'change_feed_events_total', 'События канала изменений, полученные процессом', labels=('kind', 'source')
+)
+
+# SQL-запросы по методам репозиториев (заполняются коллектором)
+DB_OPERATION_STATEMENTS = registry.counter(
+    'db_operation_statements_total', 'SQL-запросов, выполненных методом репозитория', labels=('operation',)
+)
+DB_OPERATION_SECONDS = registry.counter(
+    'db_operation_seconds_total', 'Суммарное время SQL-запросов метода репозитория', labels=('operation',)
+)
+DB_OPERATION_LATENCY = registry.gauge(
+    'db_operation_latency_seconds', 'Перцентили времени SQL-запроса метода репозитория',
+    labels=('operation', 'quantile')
+)
+
+# Обработчики бота
+BOT_UPDATES_TOTAL = registry.counter(
+    'bot_updates_total', 'Обработанные апдейты по обработчикам', labels=('handler', 'status')
+)
+WEBHOOK_IN_FLIGHT = registry.gauge(
+    'webhook_updates_in_flight', 'Апдейты, которые воркер webhook обрабатывает сейчас'
+)
+WEBHOOK_REJECTED_TOTAL = registry.counter(
+    'webhook_updates_rejected_total', 'Апдейты, отклоненные воркером webhook из-за перегрузки (503)'
+)
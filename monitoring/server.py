@@ -0,0 +1,41 @@
+"""Локальный HTTP-сервер метрик."""
+import logging
+from aiohttp import web
+
+from monitoring.metrics import registry
+from monitoring.collectors import register_collectors
+
+logger = logging.getLogger(__name__)
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Отдать метрики в текстовом формате Prometheus."""
+    body = await registry.render()
+    return web.Response(
+        body=body.encode('utf-8'),
+        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    )
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """
+    Запустить сервер метрик в текущем event loop.
+
+    Returns:
+        web.AppRunner: Для остановки через cleanup()
+    """
+    register_collectors()
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        # Порт занят: освобождаем runner, вызывающий код решает, что делать дальше
+        await runner.cleanup()
+        raise
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return runner
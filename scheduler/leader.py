@@ -0,0 +1,122 @@
+"""Выбор лидера для одиночных задач планировщика."""
+import asyncio
+import functools
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from database.base import async_session_maker
+from database.repository import LeaseRepository, Fence
+from monitoring.metrics import IS_LEADER
+from config import config
+
+logger = logging.getLogger(__name__)
+
+LEADER_LEASE = 'leader'
+
+
+class LeaderElector:
+    """
+    Лидерство через аренду в таблице scheduler_leases.
+
+    Все процессы каждые renew_interval секунд пытаются захватить аренду
+    с именем name: лидер этим продлевает ее (heartbeat), standby-процессы
+    забирают ее после истечения, то есть не позже чем через lease_ttl после
+    падения лидера. При каждой смене владельца токен аренды растет - это
+    fencing token: одиночные задачи добавляют его в свои запросы
+    (repository.holds_lease), поэтому запоздалые записи бывшего лидера
+    отбрасываются базой.
+    """
+
+    def __init__(self, name: str, instance_id: str, lease_ttl: float, renew_interval: float):
+        self.name = name
+        self.instance_id = instance_id
+        self.lease_ttl = lease_ttl
+        self.renew_interval = renew_interval
+        self._token: Optional[int] = None
+        self._valid_until = 0.0  # Момент (monotonic), до которого аренда гарантированно наша
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        """Процесс - лидер (аренда удержана и не истекла по локальным часам)."""
+        return self._token is not None and time.monotonic() <= self._valid_until
+
+    @property
+    def fence(self) -> Optional[Fence]:
+        """Fencing token для запросов одиночных задач (None, если процесс не лидер)."""
+        if not self.is_leader:
+            return None
+        return self.name, self.instance_id, self._token
+
+    async def start(self) -> None:
+        """Попытаться стать лидером и запустить heartbeat."""
+        await self.heartbeat()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановить heartbeat и отдать лидерство, чтобы standby-процесс перехватил его сразу."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._token is not None:
+            try:
+                async with async_session_maker() as session:
+                    await LeaseRepository(session).release([self.name], self.instance_id)
+            except Exception as e:
+                logger.error(f"Ошибка при освобождении аренды лидера: {e}")
+        self._set_token(None)
+
+    async def heartbeat(self) -> None:
+        """Продлить аренду лидера или захватить ее, если она свободна или истекла."""
+        started = time.monotonic()
+        try:
+            async with async_session_maker() as session:
+                acquired = await LeaseRepository(session).acquire([self.name], self.instance_id, self.lease_ttl)
+        except Exception as e:
+            # Аренда перестанет считаться своей по истечении _valid_until
+            logger.error(f"Ошибка при продлении аренды лидера: {e}")
+            return
+
+        # Запас на расхождение часов процесса и БД
+        self._valid_until = started + self.lease_ttl - self.renew_interval
+        self._set_token(acquired.get(self.name))
+
+    def _set_token(self, token: Optional[int]) -> None:
+        if token != self._token:
+            if token is not None:
+                logger.info(f"Процесс {self.instance_id} стал лидером (токен {token})")
+            elif self._token is not None:
+                logger.warning(f"Процесс {self.instance_id} потерял лидерство")
+            self._token = token
+        IS_LEADER.set(1 if self._token is not None else 0)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            await self.heartbeat()
+
+
+def leader_only(job: Callable[..., Awaitable[None]]) -> Callable[..., Awaitable[None]]:
+    """Выполнять задачу планировщика только на лидере; задача получает fence первым аргументом."""
+    @functools.wraps(job)
+    async def wrapper(*args, **kwargs):
+        fence = leader_elector.fence
+        if fence is None:
+            return
+        await job(fence, *args, **kwargs)
+
+    return wrapper
+
+
+leader_elector = LeaderElector(
+    name=LEADER_LEASE,
+    instance_id=config.INSTANCE_ID,
+    lease_ttl=config.LEADER_LEASE_SECONDS,
+    renew_interval=config.LEADER_RENEW_SECONDS
+)
@@ -1,105 +1,186 @@
 """Планировщик для проверки расписаний и отправки уведомлений."""
+import asyncio
 import logging
-from datetime import datetime, timezone
+import time
+from datetime import datetime
+from typing import List, Optional
 import pytz
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from aiogram import Bot
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.base import async_session_maker
-from database.repository import NotificationRepository
+from database.base import async_session_maker, engine
+from database.change_feed import ChangeEvent, change_listener
+from database.partitions import ensure_partitions, apply_retention
 from services.notification_service import NotificationService
+from bot.storage.database_storage import purge_expired_states
+from scheduler.scheduling_engine import scheduling_engine
+from scheduler.sharding import shard_coordinator
+from scheduler.leader import leader_elector, leader_only
+from scheduler.outbox_dispatcher import outbox_dispatcher
+from database.repository import Fence
+from monitoring.metrics import TICK_DURATION
 from config import config
 
 logger = logging.getLogger(__name__)
 
+# Проходы движка и догоняющие проходы выбирают одни и те же наступившие
+# расписания, поэтому в процессе они выполняются строго по очереди
+_tick_lock = asyncio.Lock()
 
-async def check_and_send_notifications(bot: Bot):
-    """Проверить расписания и отправить уведомления."""
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
+_background_tasks = set()
+
+
+async def enqueue_due_notifications(bot: Bot, schedule_ids: Optional[List[int]] = None):
+    """Проверить расписания и поставить наступившие уведомления в outbox."""
+    async with _tick_lock:
+        started = time.perf_counter()
+        try:
+            async with async_session_maker() as session:
+                service = NotificationService(session, bot)
+                enqueued = await service.process_notifications(schedule_ids, shards=shard_coordinator.shards)
+            if enqueued:
+                outbox_dispatcher.wake()
+            logger.info(f"Проверка расписаний завершена, в очередь поставлено: {enqueued}")
+        except Exception as e:
+            logger.error(f"Ошибка при проверке расписаний: {e}")
+        finally:
+            TICK_DURATION.observe(time.perf_counter() - started)
+
+
+async def catch_up_notifications(bot: Bot):
+    """Догнать все наступившие срабатывания одним проходом."""
+    if not shard_coordinator.owned:
+        return
+    
+    async with _tick_lock:
+        started = time.perf_counter()
+        try:
+            async with async_session_maker() as session:
+                await NotificationService(session, bot).catch_up(shards=shard_coordinator.shards)
+            outbox_dispatcher.wake()
+        except Exception as e:
+            logger.error(f"Ошибка при догоняющей проверке расписаний: {e}")
+        finally:
+            TICK_DURATION.observe(time.perf_counter() - started)
+
+
+async def start_scheduling_engine(bot: Bot):
+    """
+    Запустить движок расписаний, отправляющий уведомления в момент срабатывания.
+    
+    Процесс обрабатывает только свои шарды расписаний: при смене набора
+    шардов движок сразу сверяется с БД, а догоняющий проход подхватывает
+    срабатывания шардов, полученных от упавшего процесса. Движок только
+    ставит уведомления в outbox, отправляют их обработчики outbox_dispatcher.
+    Одиночные задачи (очистка FSM) выполняет только выбранный лидер.
+    """
+    async def on_due(schedule_ids: List[int]):
+        await enqueue_due_notifications(bot, schedule_ids)
+    
+    async def on_shards_change(owned):
+        await reconcile_scheduling_engine()
+        # Догоняем срабатывания новых шардов (и пропущенные, пока бот был остановлен).
+        # Не ждем прохода здесь, чтобы не задерживать продление аренд
+        task = asyncio.create_task(catch_up_notifications(bot))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    
+    if config.OUTBOX_WORKERS:
+        outbox_dispatcher.start(bot)
+    await leader_elector.start()
+    await shard_coordinator.start(on_shards_change)
+    await scheduling_engine.start(on_due)
+    change_listener.subscribe(apply_change, own_events=True)
+
+
+async def stop_scheduling_engine():
+    """Остановить движок и обработчики outbox, отдать шарды и лидерство другим процессам."""
+    change_listener.unsubscribe(apply_change)
+    await scheduling_engine.stop()
+    await outbox_dispatcher.stop()
+    await shard_coordinator.stop()
+    await leader_elector.stop()
+
+
+async def reconcile_scheduling_engine():
+    """Сверить движок расписаний с базой данных."""
     try:
-        async with async_session_maker() as session:
-            service = NotificationService(session, bot)
-            await service.process_notifications()
-            logger.info("Проверка расписаний завершена")
+        mismatches = await scheduling_engine.reconcile()
+        if mismatches:
+            logger.warning(f"Сверка движка расписаний: исправлено расхождений: {mismatches}")
     except Exception as e:
-        logger.error(f"Ошибка при проверке расписаний: {e}")
+        logger.error(f"Ошибка при сверке движка расписаний: {e}")
 
 
-async def process_retries(bot: Bot):
-    """Обработать повторные попытки отправки уведомлений."""
-    try:
-        async with async_session_maker() as session:
-            notification_repo = NotificationRepository(session)
-            service = NotificationService(session, bot)
-            
-            # Получаем все ожидающие повторные попытки
-            current_time = datetime.now(timezone.utc).replace(tzinfo=None)
-            retries = await notification_repo.get_pending_retries(current_time)
-            
-            logger.info(f"Найдено {len(retries)} повторных попыток для обработки")
-            
-            for retry in retries:
-                try:
-                    # Получаем расписание из лога
-                    notification_log = retry.notification_log
-                    schedule = notification_log.schedule
-                    
-                    # Пытаемся отправить уведомление снова
-                    success, message_id, error = await service.send_notification(schedule)
-                    
-                    if success:
-                        # Обновляем статус лога
-                        await notification_repo.update_log_status(
-                            notification_log.id,
-                            'sent',
-                            message_id=message_id
-                        )
-                        
-                        # Помечаем retry как выполненный
-                        await notification_repo.update_retry_status(retry.id, 'completed')
-                        
-                        logger.info(f"Повторная отправка успешна для лога {notification_log.id}")
-                    
-                    else:
-                        # Увеличиваем номер попытки
-                        next_attempt = retry.attempt_number + 1
-                        
-                        if next_attempt <= config.MAX_RETRY_ATTEMPTS:
-                            # Планируем следующую попытку
-                            await service.schedule_retry(
-                                notification_log.id,
-                                next_attempt
-                            )
-                            
-                            # Помечаем текущую попытку как failed
-                            await notification_repo.update_retry_status(retry.id, 'failed')
-                            
-                            logger.info(
-                                f"Повторная отправка не удалась для лога {notification_log.id}, "
-                                f"запланирована попытка {next_attempt}"
-                            )
-                        else:
-                            # Превышено максимальное количество попыток
-                            await notification_repo.update_log_status(
-                                notification_log.id,
-                                'failed',
-                                error_message=f"Превышено максимальное количество попыток ({config.MAX_RETRY_ATTEMPTS})"
-                            )
-                            await notification_repo.update_retry_status(retry.id, 'failed')
-                            
-                            logger.warning(
-                                f"Превышено максимальное количество попыток для лога {notification_log.id}"
-                            )
-                
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке повторной попытки {retry.id}: {e}")
-                    continue
-        
-        logger.info("Обработка повторных попыток завершена")
+def reconcile_minutes() -> int:
+    """Интервал сверки движка: без канала изменений другие процессы не сообщают о правках."""
+    if config.CHANGE_FEED_ENABLED:
+        return config.ENGINE_RECONCILE_MINUTES
+    return min(config.ENGINE_RECONCILE_MINUTES, config.ENGINE_RECONCILE_MINUTES_WITHOUT_FEED)
+
+
+async def apply_change(event: ChangeEvent):
+    """
+    Обновить движок расписаний по изменению лекарств или профиля.
+    
+    Движок меняется только здесь и при сверке: сервисы лишь публикуют
+    события, в том числе для своего процесса, поэтому изменение из любого
+    процесса попадает в движок после commit, а не при следующей сверке.
+    При CHANGE_FEED_ENABLED=false сюда приходят только изменения этого
+    процесса, остальные подхватывает сверка раз в reconcile_minutes().
+    """
+    if event.kind == 'reset':
+        await reconcile_scheduling_engine()
+        return
     
+    if event.medication_id is not None:
+        # Удаленное или отключенное лекарство refresh_user уже не вернет
+        scheduling_engine.remove_medication(event.medication_id)
+    await scheduling_engine.refresh_user(event.user_id)
+
+
+@leader_only
+async def purge_fsm_states(fence: Fence):
+    """Удалить брошенные диалоги FSM."""
+    try:
+        purged = await purge_expired_states(fence)
+        if purged:
+            logger.info(f"Удалено устаревших состояний FSM: {purged}")
     except Exception as e:
-        logger.error(f"Ошибка при обработке повторных попыток: {e}")
+        logger.error(f"Ошибка при очистке состояний FSM: {e}")
+
+
+@leader_only
+async def purge_stale_members(fence: Fence):
+    """Удалить аренды членства процессов, давно переставших их продлевать."""
+    try:
+        purged = await shard_coordinator.purge_stale_members(fence)
+        if purged:
+            logger.info(f"Удалено аренд членства упавших процессов: {purged}")
+    except Exception as e:
+        logger.error(f"Ошибка при очистке аренд членства: {e}")
+
+
+@leader_only
+async def maintain_log_partitions(fence: Fence):
+    """Создать будущие секции notification_logs и удалить (архивировать) устаревшие."""
+    try:
+        today = datetime.now(pytz.UTC).date()
+        async with engine.connect() as conn:
+            async with conn.begin():
+                await ensure_partitions(conn, today, config.NOTIFICATION_LOG_PARTITIONS_AHEAD)
+            await apply_retention(
+                conn,
+                today,
+                config.NOTIFICATION_LOG_RETENTION_MONTHS,
+                config.NOTIFICATION_LOG_ARCHIVE_DIR or None,
+                fence
+            )
+    except Exception as e:
+        logger.error(f"Ошибка при обслуживании секций логов уведомлений: {e}")
 
 
 def setup_scheduler(bot: Bot) -> AsyncIOScheduler:
@@ -114,29 +195,64 @@ def setup_scheduler(bot: Bot) -> AsyncIOScheduler:
     """
     scheduler = AsyncIOScheduler(timezone=pytz.UTC)
     
-    # Задача проверки расписаний
+    # Уведомления ставит в очередь движок расписаний (start_scheduling_engine),
+    # здесь только периодическая сверка его состояния с БД
     scheduler.add_job(
-        check_and_send_notifications,
-        trigger=CronTrigger(minute='*'),
-        args=[bot],
-        id='check_notifications',
+        reconcile_scheduling_engine,
+        trigger=IntervalTrigger(minutes=reconcile_minutes()),
+        id='reconcile_engine',
         replace_existing=True,
         max_instances=1
     )
     
-    # Задача обработки повторных попыток
+    # Догоняющий проход: срабатывания, пропущенные движком (зависание,
+    # ошибка тика), отправляются в пределах NOTIFICATION_MAX_LATENESS_MINUTES
     scheduler.add_job(
-        process_retries,
-        trigger=CronTrigger(minute='*'),
+        catch_up_notifications,
+        trigger=IntervalTrigger(minutes=config.CATCH_UP_INTERVAL_MINUTES),
         args=[bot],
-        id='process_retries',
+        id='catch_up_notifications',
+        replace_existing=True,
+        max_instances=1
+    )
+    
+    # Одиночные задачи (leader_only): зарегистрированы во всех процессах,
+    # но выполняет их только лидер, остальные ждут его падения.
+    # Задача очистки брошенных диалогов
+    scheduler.add_job(
+        purge_fsm_states,
+        trigger=IntervalTrigger(hours=1),
+        id='purge_fsm_states',
+        replace_existing=True,
+        max_instances=1
+    )
+    
+    # Перезапущенные процессы получают новый INSTANCE_ID, их старое членство удаляется
+    scheduler.add_job(
+        purge_stale_members,
+        trigger=IntervalTrigger(hours=1),
+        id='purge_stale_members',
+        replace_existing=True,
+        max_instances=1
+    )
+    
+    # Секции логов создаются на NOTIFICATION_LOG_PARTITIONS_AHEAD месяцев вперед,
+    # поэтому редкого запуска достаточно
+    scheduler.add_job(
+        maintain_log_partitions,
+        trigger=IntervalTrigger(hours=6),
+        id='maintain_log_partitions',
         replace_existing=True,
         max_instances=1
     )
     
     logger.info("Планировщик настроен:")
-    logger.info("  - Проверка расписаний: каждый час в :00 минут")
-    logger.info("  - Обработка повторных попыток: каждые 5 минут")
+    logger.info(f"  - Сверка движка расписаний: каждые {reconcile_minutes()} минут")
+    logger.info(f"  - Догоняющая проверка расписаний: каждые {config.CATCH_UP_INTERVAL_MINUTES} минут")
+    logger.info(f"  - Отправка из outbox: {config.OUTBOX_WORKERS} обработчиков, опрос каждые {config.OUTBOX_POLL_SECONDS} с")
+    logger.info("  - Очистка брошенных диалогов FSM: каждый час (только лидер)")
+    logger.info("  - Очистка членства упавших процессов: каждый час (только лидер)")
+    logger.info(f"  - Секции логов: каждые 6 часов, хранение {config.NOTIFICATION_LOG_RETENTION_MONTHS} месяцев (только лидер)")
     
     return scheduler
 
@@ -0,0 +1,88 @@
+"""Обработчики очереди исходящих уведомлений (notification_outbox)."""
+import asyncio
+import logging
+from typing import List, Optional
+
+from aiogram import Bot
+
+from database.base import async_session_maker
+from services.notification_service import NotificationService
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxDispatcher:
+    """
+    Конкурентные обработчики outbox в процессе.
+    
+    Каждый обработчик захватывает пачки, пока очередь не опустеет, затем
+    ждет пробуждения (wake - после постановки уведомлений этим процессом)
+    или poll_interval секунд (уведомления других процессов и повторные
+    попытки). Пачки захватываются арендой через SKIP LOCKED, поэтому
+    обработчики можно запускать в любом количестве процессов.
+    """
+    
+    def __init__(self, workers: int, batch_size: int, poll_interval: float):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._bot: Optional[Bot] = None
+    
+    def start(self, bot: Bot) -> None:
+        """Запустить обработчики."""
+        self._bot = bot
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        logger.info(f"Обработчики outbox запущены: {self.workers}")
+    
+    async def stop(self) -> None:
+        """Остановить обработчики (неотправленные захваченные пачки вернутся в очередь после аренды)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def wake(self) -> None:
+        """Разбудить обработчики: в очереди появились наступившие уведомления."""
+        self._wakeup.set()
+    
+    async def drain(self) -> int:
+        """
+        Обрабатывать пачки, пока наступившие уведомления не закончатся.
+        
+        Returns:
+            int: Количество обработанных уведомлений
+        """
+        processed = 0
+        while True:
+            async with async_session_maker() as session:
+                claimed = await NotificationService(session, self._bot).dispatch_outbox_batch(self.batch_size)
+            
+            processed += claimed
+            if claimed < self.batch_size:
+                return processed
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.drain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при обработке outbox: {e}")
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            # Событие будит всех ожидающих сразу, поэтому его можно сбросить
+            self._wakeup.clear()
+
+
+outbox_dispatcher = OutboxDispatcher(
+    workers=config.OUTBOX_WORKERS,
+    batch_size=config.OUTBOX_BATCH_SIZE,
+    poll_interval=config.OUTBOX_POLL_SECONDS
+)
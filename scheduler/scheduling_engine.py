@@ -0,0 +1,209 @@
+"""Движок расписаний: очередь ближайших срабатываний в памяти процесса."""
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import pytz
+
+from database.base import async_session_maker
+from database.repository import ScheduleRepository
+from scheduler.sharding import shard_coordinator
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Минимальная задержка перед повторным срабатыванием расписания,
+# которое после обработки все еще считается наступившим
+REFIRE_DELAY = timedelta(seconds=30)
+
+
+class SchedulingEngine:
+    """
+    Мин-куча ближайших срабатываний расписаний.
+
+    Источником истины остается колонка medication_schedules.next_fire_at:
+    движок лишь знает, когда нужно проснуться и какие расписания проверить.
+    Куча загружается при старте, обновляется инкрементально обработчиками
+    и периодически сверяется с базой данных. Движок держит только расписания
+    шардов, принадлежащих процессу (shard_coordinator).
+    """
+
+    def __init__(self, horizon: timedelta):
+        self.horizon = horizon
+        self._heap: List[Tuple[datetime, int]] = []
+        self._entries: Dict[int, Tuple[datetime, int]] = {}  # schedule_id -> (fire_at, medication_id)
+        self._by_medication: Dict[int, Set[int]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._on_due: Optional[Callable[[List[int]], Awaitable[None]]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def start(self, on_due: Callable[[List[int]], Awaitable[None]]) -> None:
+        """Загрузить срабатывания из БД и запустить цикл ожидания."""
+        self._on_due = on_due
+        await self.reconcile()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Движок расписаний запущен, загружено срабатываний: {len(self)}")
+
+    async def stop(self) -> None:
+        """Остановить цикл ожидания."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def upsert(self, schedule_id: int, medication_id: int, fire_at: Optional[datetime]) -> None:
+        """Добавить или перенести срабатывание расписания."""
+        if not shard_coordinator.owns(schedule_id):
+            # Расписание обрабатывает другой процесс
+            self.remove(schedule_id)
+            return
+        
+        if fire_at is None or fire_at > datetime.now(pytz.UTC) + self.horizon:
+            # Срабатывание за горизонтом загрузит следующая сверка
+            self.remove(schedule_id)
+            return
+
+        previous = self._entries.get(schedule_id)
+        if previous and previous[0] == fire_at:
+            return
+        if previous and previous[1] != medication_id:
+            self._by_medication.get(previous[1], set()).discard(schedule_id)
+
+        self._entries[schedule_id] = (fire_at, medication_id)
+        self._by_medication.setdefault(medication_id, set()).add(schedule_id)
+        heapq.heappush(self._heap, (fire_at, schedule_id))
+
+        # Будим цикл, если новое срабатывание раньше текущего ожидания
+        if self._heap[0] == (fire_at, schedule_id):
+            self._wakeup.set()
+
+    def remove(self, schedule_id: int) -> None:
+        """Удалить срабатывание расписания (запись в куче удаляется лениво)."""
+        previous = self._entries.pop(schedule_id, None)
+        if previous:
+            medication_schedules = self._by_medication.get(previous[1])
+            if medication_schedules is not None:
+                medication_schedules.discard(schedule_id)
+                if not medication_schedules:
+                    del self._by_medication[previous[1]]
+
+    def remove_medication(self, medication_id: int) -> None:
+        """Удалить срабатывания всех расписаний лекарства."""
+        for schedule_id in list(self._by_medication.get(medication_id, ())):
+            self.remove(schedule_id)
+
+    async def refresh(self, schedule_ids: Iterable[int], not_before: Optional[datetime] = None) -> None:
+        """Перечитать время срабатывания указанных расписаний из БД."""
+        schedule_ids = list(schedule_ids)
+        if not schedule_ids:
+            return
+
+        async with async_session_maker() as session:
+            rows = await ScheduleRepository(session).get_fire_times(schedule_ids=schedule_ids)
+
+        found = set()
+        for schedule_id, medication_id, fire_at in rows:
+            found.add(schedule_id)
+            if not_before and fire_at < not_before:
+                fire_at = not_before
+            self.upsert(schedule_id, medication_id, fire_at)
+
+        for schedule_id in schedule_ids:
+            if schedule_id not in found:
+                self.remove(schedule_id)
+
+    async def refresh_user(self, user_id: int) -> None:
+        """Перечитать срабатывания всех расписаний пользователя (например, после смены часового пояса)."""
+        async with async_session_maker() as session:
+            rows = await ScheduleRepository(session).get_fire_times(user_id=user_id)
+
+        for schedule_id, medication_id, fire_at in rows:
+            self.upsert(schedule_id, medication_id, fire_at)
+
+    async def reconcile(self) -> int:
+        """
+        Сверить движок с таблицей medication_schedules в пределах горизонта.
+
+        Returns:
+            int: Количество исправленных расхождений
+        """
+        until = datetime.now(pytz.UTC) + self.horizon
+        async with async_session_maker() as session:
+            rows = await ScheduleRepository(session).get_fire_times(
+                until=until,
+                shards=shard_coordinator.shards
+            )
+
+        expected = {schedule_id: (fire_at, medication_id) for schedule_id, medication_id, fire_at in rows}
+        mismatches = 0
+
+        for schedule_id in list(self._entries):
+            if schedule_id not in expected:
+                self.remove(schedule_id)
+                mismatches += 1
+
+        for schedule_id, (fire_at, medication_id) in expected.items():
+            if self._entries.get(schedule_id) != (fire_at, medication_id):
+                self.upsert(schedule_id, medication_id, fire_at)
+                mismatches += 1
+
+        # Очищаем кучу от устаревших записей
+        self._heap = [(fire_at, schedule_id) for schedule_id, (fire_at, _) in self._entries.items()]
+        heapq.heapify(self._heap)
+        self._wakeup.set()
+
+        return mismatches
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        """Извлечь из кучи все наступившие срабатывания."""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, schedule_id = heapq.heappop(self._heap)
+            entry = self._entries.get(schedule_id)
+            if entry and entry[0] == fire_at:
+                due.append(schedule_id)
+        return due
+
+    def _seconds_until_next(self, now: datetime) -> Optional[float]:
+        """Количество секунд до ближайшего актуального срабатывания."""
+        while self._heap:
+            fire_at, schedule_id = self._heap[0]
+            entry = self._entries.get(schedule_id)
+            if entry and entry[0] == fire_at:
+                return max((fire_at - now).total_seconds(), 0)
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self) -> None:
+        """Цикл: спать до ближайшего срабатывания и обрабатывать наступившие."""
+        while True:
+            now = datetime.now(pytz.UTC)
+            due = self._pop_due(now)
+
+            if due:
+                try:
+                    await self._on_due(due)
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке срабатываний: {e}")
+
+                try:
+                    await self.refresh(due, not_before=datetime.now(pytz.UTC) + REFIRE_DELAY)
+                except Exception as e:
+                    logger.error(f"Ошибка при обновлении срабатываний после обработки: {e}")
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._seconds_until_next(now))
+            except asyncio.TimeoutError:
+                pass
+
+
+scheduling_engine = SchedulingEngine(horizon=timedelta(minutes=config.ENGINE_HORIZON_MINUTES))
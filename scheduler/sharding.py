@@ -0,0 +1,159 @@
+"""Распределение шардов расписаний между процессами планировщика."""
+import asyncio
+import logging
+import math
+import time
+from typing import Awaitable, Callable, FrozenSet, List, Optional
+
+from database.base import async_session_maker
+from database.repository import Fence, LeaseRepository, Shards
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX = 'shard:'
+MEMBER_PREFIX = 'member:'
+
+# Через сколько сроков аренды удаляется членство упавшего процесса
+STALE_MEMBER_LEASES = 10
+
+
+class ShardCoordinator:
+    """
+    Владение шардами через таблицу аренд scheduler_leases.
+
+    Расписание относится к шарду id % shard_count. Каждый процесс держит
+    аренду членства и не больше своей доли шардов (shard_count / число
+    живых процессов, с округлением вверх), продлевая аренды каждые
+    renew_interval секунд. Лишние шарды отдаются, свободные и истекшие
+    (процесс упал) - забираются, поэтому новый процесс разгружает остальных,
+    а шарды упавшего подхватываются после истечения его аренды.
+    """
+
+    def __init__(self, shard_count: int, instance_id: str, lease_ttl: float, renew_interval: float):
+        self.shard_count = shard_count
+        self.instance_id = instance_id
+        self.lease_ttl = lease_ttl
+        self.renew_interval = renew_interval
+        self._owned: FrozenSet[int] = frozenset()
+        self._valid_until = 0.0  # Момент (monotonic), до которого аренды гарантированно наши
+        self._task: Optional[asyncio.Task] = None
+        self._on_change: Optional[Callable[[FrozenSet[int]], Awaitable[None]]] = None
+
+    @property
+    def owned(self) -> FrozenSet[int]:
+        """Шарды, принадлежащие процессу (пусто, если аренды давно не удавалось продлить)."""
+        if time.monotonic() > self._valid_until:
+            return frozenset()
+        return self._owned
+
+    @property
+    def shards(self) -> Shards:
+        """Фильтр для репозиториев: (количество шардов, свои шарды)."""
+        return self.shard_count, self.owned
+
+    def owns(self, schedule_id: int) -> bool:
+        """Проверить, обрабатывает ли процесс расписание."""
+        return schedule_id % self.shard_count in self.owned
+
+    async def start(self, on_change: Optional[Callable[[FrozenSet[int]], Awaitable[None]]] = None) -> None:
+        """Захватить свою долю шардов и запустить продление аренд."""
+        self._on_change = on_change
+        await self.rebalance()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Процесс {self.instance_id} владеет шардами: {sorted(self._owned)}")
+
+    async def stop(self) -> None:
+        """Остановить продление и освободить аренды, чтобы их сразу забрали другие процессы."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        try:
+            async with async_session_maker() as session:
+                leases = LeaseRepository(session)
+                await leases.release(self._shard_names(self._owned), self.instance_id)
+                # Имя членства уникально для процесса (INSTANCE_ID включает pid) - строка больше не нужна
+                await leases.delete([MEMBER_PREFIX + self.instance_id], self.instance_id)
+        except Exception as e:
+            logger.error(f"Ошибка при освобождении аренд шардов: {e}")
+        self._owned = frozenset()
+
+    async def rebalance(self) -> None:
+        """Продлить аренды и привести число своих шардов к справедливой доле."""
+        started = time.monotonic()
+        async with async_session_maker() as session:
+            leases = LeaseRepository(session)
+
+            await leases.acquire([MEMBER_PREFIX + self.instance_id], self.instance_id, self.lease_ttl)
+            members = await leases.get_live(MEMBER_PREFIX)
+            fair_share = math.ceil(self.shard_count / max(len(members), 1))
+
+            renewed = await leases.renew(self._shard_names(self._owned), self.instance_id, self.lease_ttl)
+            owned = {int(name[len(SHARD_PREFIX):]) for name in renewed}
+            lost = self._owned - owned
+            if lost:
+                logger.warning(f"Потеряна аренда шардов: {sorted(lost)}")
+
+            if len(owned) > fair_share:
+                # Отдаем лишние шарды появившимся процессам
+                extra = sorted(owned)[fair_share:]
+                await leases.release(self._shard_names(extra), self.instance_id)
+                owned -= set(extra)
+
+            elif len(owned) < fair_share:
+                taken = await leases.get_live(SHARD_PREFIX)
+                free = [
+                    shard for shard in range(self.shard_count)
+                    if shard not in owned and f'{SHARD_PREFIX}{shard}' not in taken
+                ]
+                acquired = await leases.acquire(
+                    self._shard_names(free[:fair_share - len(owned)]),
+                    self.instance_id,
+                    self.lease_ttl
+                )
+                owned |= {int(name[len(SHARD_PREFIX):]) for name in acquired}
+
+        owned = frozenset(owned)
+        # Аренды продлены от момента начала прохода; запас на расхождение часов процесса и БД
+        self._valid_until = started + self.lease_ttl - self.renew_interval
+        if owned != self._owned:
+            logger.info(f"Шарды процесса {self.instance_id}: {sorted(owned)} (процессов: {len(members)})")
+            self._owned = owned
+            if self._on_change:
+                await self._on_change(owned)
+
+    async def purge_stale_members(self, fence: Optional[Fence] = None) -> int:
+        """
+        Удалить членство процессов, упавших без stop.
+        
+        Returns:
+            int: Количество удаленных аренд
+        """
+        async with async_session_maker() as session:
+            return await LeaseRepository(session).purge_expired(
+                MEMBER_PREFIX, self.lease_ttl * STALE_MEMBER_LEASES, fence
+            )
+
+    def _shard_names(self, shards) -> List[str]:
+        return [f'{SHARD_PREFIX}{shard}' for shard in shards]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Ошибка при продлении аренд шардов: {e}")
+
+
+shard_coordinator = ShardCoordinator(
+    shard_count=config.SCHEDULER_SHARDS,
+    instance_id=config.INSTANCE_ID,
+    lease_ttl=config.SHARD_LEASE_SECONDS,
+    renew_interval=config.SHARD_RENEW_SECONDS
+)
@@ -0,0 +1,107 @@
+"""
+Отдельный процесс планировщика без приема апдейтов.
+
+Процессов можно запустить несколько: шарды расписаний распределяются
+между ними автоматически (scheduler.sharding). С --dispatch-only процесс
+только отправляет уведомления из outbox, что позволяет масштабировать
+отправку отдельно от поиска наступивших расписаний.
+
+    python -m scheduler.worker [--dispatch-only] [--metrics-port PORT]
+"""
+import argparse
+import asyncio
+import logging
+from typing import Optional
+
+from aiohttp import web
+
+from config import config
+from bot.app import create_bot
+from scheduler.notification_scheduler import setup_scheduler, start_scheduling_engine, stop_scheduling_engine
+from scheduler.outbox_dispatcher import outbox_dispatcher
+from database.change_feed import change_listener
+from monitoring.server import start_metrics_server
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+async def start_worker_metrics(host: str, first_port: int, ports: int) -> Optional[web.AppRunner]:
+    """
+    Запустить сервер метрик на первом свободном порту диапазона.
+
+    Несколько процессов на одном хосте занимают соседние порты; если весь
+    диапазон занят, процесс работает без метрик.
+
+    Returns:
+        Optional[web.AppRunner]: Для остановки через cleanup() (None - сервер не запущен)
+    """
+    if first_port <= 0:
+        return None
+    for port in range(first_port, first_port + max(ports, 1)):
+        try:
+            return await start_metrics_server(host, port)
+        except OSError:
+            continue
+    logger.error(f"❌ Порты метрик {first_port}-{first_port + max(ports, 1) - 1} заняты, процесс работает без метрик")
+    return None
+
+
+async def main(dispatch_only: bool = False, metrics_port: int = config.WORKER_METRICS_PORT):
+    """Запустить планировщик и работать до остановки процесса."""
+    if not config.BOT_TOKEN:
+        logger.error("❌ BOT_TOKEN не установлен! Проверьте файл .env")
+        return
+    
+    # Бот нужен только для отправки уведомлений
+    bot = create_bot()
+    
+    # Метрики отправки и планировщика собираются в этом процессе
+    metrics_runner = None
+    if config.METRICS_ENABLED:
+        metrics_runner = await start_worker_metrics(config.METRICS_HOST, metrics_port, config.WORKER_METRICS_PORTS)
+    
+    if dispatch_only:
+        outbox_dispatcher.start(bot)
+        logger.info(f"✅ Обработчики outbox {config.INSTANCE_ID} запущены")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await outbox_dispatcher.stop()
+            if metrics_runner:
+                await metrics_runner.cleanup()
+            await bot.session.close()
+        return
+    
+    # Движок расписаний обновляется по изменениям, сделанным процессами бота
+    change_listener.start(listen=config.CHANGE_FEED_ENABLED)
+    scheduler = setup_scheduler(bot)
+    scheduler.start()
+    await start_scheduling_engine(bot)
+    logger.info(f"✅ Планировщик {config.INSTANCE_ID} запущен")
+    
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stop_scheduling_engine()
+        scheduler.shutdown()
+        await change_listener.stop()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Процесс планировщика уведомлений")
+    parser.add_argument('--dispatch-only', action='store_true',
+                        help="Только отправлять уведомления из outbox")
+    parser.add_argument('--metrics-port', type=int, default=config.WORKER_METRICS_PORT,
+                        help="Первый порт сервера метрик: занимается первый свободный, 0 - без метрик")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main(args.dispatch_only, args.metrics_port))
+    except KeyboardInterrupt:
+        pass
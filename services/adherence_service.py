@@ -0,0 +1,109 @@
+"""Сервис дневной сводки уведомлений (adherence_daily)."""
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.repository import AdherenceRepository
+
+AdherenceKey = Tuple[int, int, date]  # (ID пользователя, ID лекарства, локальная дата)
+
+
+class AdherenceDeltas:
+    """
+    Приращения сводки, накопленные за одну транзакцию.
+
+    Счетчики:
+        scheduled - уведомление поставлено в outbox;
+        sent - уведомление отправлено (lag - задержка от due_at до отправки);
+        failed - уведомление окончательно не отправлено;
+        retried - уведомление завершено (sent или failed) больше чем с одной попытки.
+    """
+
+    def __init__(self):
+        self._rows: Dict[AdherenceKey, dict] = {}
+
+    def _row(self, user_id: int, medication_id: int, local_date: date) -> dict:
+        key = (user_id, medication_id, local_date)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = {
+                'user_id': user_id,
+                'medication_id': medication_id,
+                'local_date': local_date,
+                'scheduled': 0,
+                'sent': 0,
+                'failed': 0,
+                'retried': 0,
+                'lag_seconds_total': 0.0,
+                'lag_seconds_max': 0.0,
+            }
+        return row
+
+    def scheduled(self, user_id: int, medication_id: int, local_date: date) -> None:
+        self._row(user_id, medication_id, local_date)['scheduled'] += 1
+
+    def sent(self, user_id: int, medication_id: int, local_date: date, attempts: int, lag_seconds: float) -> None:
+        row = self._row(user_id, medication_id, local_date)
+        row['sent'] += 1
+        row['retried'] += attempts > 1
+        lag_seconds = max(lag_seconds, 0.0)
+        row['lag_seconds_total'] += lag_seconds
+        row['lag_seconds_max'] = max(row['lag_seconds_max'], lag_seconds)
+
+    def failed(self, user_id: int, medication_id: int, local_date: date, attempts: int) -> None:
+        row = self._row(user_id, medication_id, local_date)
+        row['failed'] += 1
+        row['retried'] += attempts > 1
+
+    def rows(self) -> List[dict]:
+        return list(self._rows.values())
+
+
+@dataclass
+class MedicationAdherence:
+    """Сводка по одному лекарству за период."""
+    name: str
+    scheduled: int
+    sent: int
+    failed: int
+    retried: int
+    lag_seconds_total: float
+    lag_seconds_max: float
+
+    @property
+    def sent_percent(self) -> float:
+        return 100.0 * self.sent / self.scheduled if self.scheduled else 0.0
+
+    @property
+    def average_lag_seconds(self) -> float:
+        return self.lag_seconds_total / self.sent if self.sent else 0.0
+
+
+class AdherenceService:
+    """Сервис чтения дневной сводки уведомлений."""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+        self.adherence_repo = AdherenceRepository(session)
+
+    async def get_summary(self, user_id: int, today: date, days: int) -> List[MedicationAdherence]:
+        """
+        Сводка пользователя по лекарствам за последние days дней (включая today).
+
+        Читает не больше days строк на лекарство вместо всех логов уведомлений.
+        """
+        rows = await self.adherence_repo.get_summary(user_id, today - timedelta(days=days - 1), today)
+        return [
+            MedicationAdherence(
+                name=name,
+                scheduled=int(scheduled or 0),
+                sent=int(sent or 0),
+                failed=int(failed or 0),
+                retried=int(retried or 0),
+                lag_seconds_total=float(lag_total or 0),
+                lag_seconds_max=float(lag_max or 0)
+            )
+            for name, scheduled, sent, failed, retried, lag_total, lag_max in rows
+        ]
@@ -1,14 +1,58 @@
 """Сервис для работы с лекарствами."""
-from typing import Optional, List
-from datetime import date, time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Optional, List
+from datetime import date, time, datetime
+import pytz
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.repository import (
     MedicationRepository,
     ScheduleRepository,
-    UserRepository
+    UserRepository,
+    ChangeRepository,
+    Page
 )
 from database.models import Medication, MedicationSchedule
+from database.cache import medication_cache, user_cache
+from services.schedule_calculator import calculate_next_fire_at
+from config import config
+
+
+@dataclass
+class MedicationSnapshot:
+    """
+    Активные лекарства пользователя с расписаниями (в порядке ID)
+    и готовые тексты, построенные по ним.
+    
+    Снимок только читается: любое изменение данных пользователя
+    увеличивает версию в medication_cache, и следующий запрос
+    загружает новый снимок.
+    """
+    medications: List[Medication]
+    rendered: Dict[Hashable, str] = field(default_factory=dict)
+    
+    def page(self, limit: int, direction: str = 'next', cursor: Optional[int] = None) -> Page:
+        """Страница снимка по курсору - как MedicationRepository.get_page, но без запроса."""
+        ids = [medication.id for medication in self.medications]
+        if direction == 'prev' and cursor is not None:
+            end = bisect_left(ids, cursor)
+            start = max(end - limit, 0)
+        else:
+            start = bisect_right(ids, cursor) if cursor is not None else 0
+            end = start + limit
+        return Page(
+            items=self.medications[start:end],
+            has_prev=start > 0,
+            has_next=end < len(ids)
+        )
+    
+    def render(self, key: Hashable, build: Callable[[], str]) -> str:
+        """Текст по ключу (например, план на дату в часовом поясе), построенный один раз."""
+        text = self.rendered.get(key)
+        if text is None:
+            text = self.rendered[key] = build()
+        return text
 
 
 class MedicationService:
@@ -19,6 +63,7 @@ class MedicationService:
         self.medication_repo = MedicationRepository(session)
         self.schedule_repo = ScheduleRepository(session)
         self.user_repo = UserRepository(session)
+        self.change_repo = ChangeRepository(session)
     
     async def add_medication(
         self,
@@ -56,25 +101,137 @@ class MedicationService:
             end_date=end_date
         )
         
+        # Рассчитываем ближайшее срабатывание для планировщика
+        await self.refresh_fire_times(medication, [schedule])
+        await self.change_repo.publish('medication', user_id, medication.id)
+        await self.session.commit()
+        medication_cache.bump(user_id)
+        
         return medication, schedule
     
+    async def save_medication(self, medication: Medication) -> None:
+        """
+        Зафиксировать изменения лекарства и его расписаний.
+        
+        Событие канала изменений уходит в той же транзакции: остальные
+        процессы сбросят свои кэши только после commit.
+        """
+        await self.change_repo.publish('medication', medication.user_id, medication.id)
+        await self.session.commit()
+        medication_cache.bump(medication.user_id)
+    
+    async def refresh_fire_times(
+        self,
+        medication: Medication,
+        schedules: Optional[List[MedicationSchedule]] = None
+    ) -> None:
+        """
+        Пересчитать время следующего срабатывания расписаний лекарства.
+        
+        Изменения не фиксируются - commit выполняет вызывающий код
+        (save_medication), и движок расписаний узнает о них из канала изменений.
+        """
+        user = await self.user_repo.get_by_id(medication.user_id)
+        timezone_name = user.timezone if user else 'UTC'
+        now_utc = datetime.now(pytz.UTC)
+        
+        for schedule in schedules if schedules is not None else medication.schedules:
+            schedule.next_fire_at = calculate_next_fire_at(schedule, timezone_name, now_utc)
+    
+    async def update_timezone(self, user_id: int, timezone: str) -> bool:
+        """
+        Сменить часовой пояс пользователя и пересчитать срабатывания его расписаний.
+        
+        Время приема хранится в локальном времени пользователя, поэтому
+        при смене часового пояса сдвигаются все срабатывания.
+        """
+        updated = await self.user_repo.update_timezone(user_id, timezone)
+        
+        now_utc = datetime.now(pytz.UTC)
+        for schedule in await self.schedule_repo.get_by_user(user_id):
+            schedule.next_fire_at = calculate_next_fire_at(schedule, timezone, now_utc)
+        
+        await self.change_repo.publish('user', user_id)
+        await self.session.commit()
+        user_cache.invalidate(user_id)
+        medication_cache.bump(user_id)
+        return updated
+    
+    async def get_user_snapshot(self, user_id: int) -> MedicationSnapshot:
+        """
+        Снимок активных лекарств пользователя из medication_cache.
+        
+        Повторные просмотры в пределах версии данных не обращаются к БД;
+        версия запоминается до загрузки, поэтому снимок, прочитанный
+        одновременно с изменением, не сохраняется.
+        """
+        snapshot = medication_cache.get(user_id)
+        if snapshot is None:
+            version = medication_cache.version(user_id)
+            medications = await self.medication_repo.get_by_user(user_id, active_only=True)
+            snapshot = MedicationSnapshot(sorted(medications, key=lambda medication: medication.id))
+            medication_cache.set(user_id, version, snapshot)
+        return snapshot
+    
     async def get_user_medications(
         self,
         user_id: int,
         active_only: bool = True
     ) -> List[Medication]:
-        """Получить все лекарства пользователя."""
+        """Получить все лекарства пользователя (активные - из снимка)."""
+        if active_only:
+            return list((await self.get_user_snapshot(user_id)).medications)
         return await self.medication_repo.get_by_user(user_id, active_only)
     
+    async def get_medications_page(
+        self,
+        user_id: int,
+        direction: str = 'next',
+        cursor: Optional[int] = None,
+        active_only: bool = True
+    ) -> Page:
+        """
+        Получить страницу лекарств пользователя.
+        
+        Активные лекарства берутся из снимка пользователя, остальные
+        читаются постранично из БД.
+        
+        Args:
+            direction: 'next' - лекарства после курсора, 'prev' - перед ним
+            cursor: ID лекарства на границе текущей страницы (None - первая страница)
+        """
+        if active_only:
+            snapshot = await self.get_user_snapshot(user_id)
+            return snapshot.page(config.MEDICATIONS_PAGE_SIZE, direction, cursor)
+        if direction == 'prev' and cursor is not None:
+            return await self.medication_repo.get_page(
+                user_id, config.MEDICATIONS_PAGE_SIZE, before_id=cursor, active_only=active_only
+            )
+        return await self.medication_repo.get_page(
+            user_id, config.MEDICATIONS_PAGE_SIZE, after_id=cursor, active_only=active_only
+        )
+    
     async def get_medication_by_id(self, medication_id: int) -> Optional[Medication]:
         """Получить лекарство по ID."""
         return await self.medication_repo.get_by_id(medication_id)
     
     async def delete_medication(self, medication_id: int) -> bool:
         """Удалить лекарство (каскадно удалит расписания)."""
-        return await self.medication_repo.delete(medication_id)
+        user_id = await self.medication_repo.delete(medication_id)
+        await self._commit_change(user_id, medication_id)
+        return user_id is not None
     
     async def deactivate_medication(self, medication_id: int) -> bool:
         """Деактивировать лекарство."""
-        return await self.medication_repo.deactivate(medication_id)
+        user_id = await self.medication_repo.deactivate(medication_id)
+        await self._commit_change(user_id, medication_id)
+        return user_id is not None
+    
+    async def _commit_change(self, user_id: Optional[int], medication_id: int) -> None:
+        """Зафиксировать изменение лекарства вместе с событием канала изменений."""
+        if user_id is not None:
+            await self.change_repo.publish('medication', user_id, medication_id)
+        await self.session.commit()
+        if user_id is not None:
+            medication_cache.bump(user_id)
 
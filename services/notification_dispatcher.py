@@ -0,0 +1,219 @@
+"""Конкурентная отправка уведомлений с учетом лимитов Telegram."""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+import pytz
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+
+from monitoring.metrics import SEND_LATENCY
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutgoingMessage:
+    """Сообщение, ожидающее отправки."""
+    key: int  # Идентификатор для сопоставления результата (например, ID лога)
+    chat_id: int
+    text: str
+    due_at: datetime  # Момент, к которому сообщение должно было быть отправлено
+
+
+@dataclass
+class DeliveryResult:
+    """Результат отправки сообщения."""
+    key: int
+    success: bool
+    message_id: Optional[int] = None
+    error: Optional[str] = None
+    sent_at: Optional[datetime] = None
+    lag: Optional[float] = None  # Задержка отправки относительно due_at, секунды
+    retry_after: Optional[float] = None  # Не отправлено из-за паузы 429: повторить через столько секунд
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self) -> bool:
+        """Корзина полна - ограничение сейчас не действует."""
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self) -> None:
+        """Дождаться и забрать один токен."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TelegramRateLimiter:
+    """
+    Общие для процесса лимиты Telegram: глобальный и на каждый чат,
+    плюс общая пауза после ответа 429 (TelegramRetryAfter).
+    """
+
+    def __init__(self, global_rate: float, per_chat_rate: float):
+        self.per_chat_rate = per_chat_rate
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[int, TokenBucket] = {}
+        self._paused_until = 0.0
+
+    def backoff(self, retry_after: float) -> None:
+        """Приостановить все отправки на retry_after секунд."""
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def pause_remaining(self) -> float:
+        """Сколько секунд еще длится общая пауза (0 - паузы нет)."""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    async def acquire(self, chat_id: int) -> float:
+        """
+        Дождаться разрешения на отправку сообщения в чат.
+
+        Паузу 429 не ждет: она может длиться дольше аренды пачки outbox.
+
+        Returns:
+            float: 0 - можно отправлять, иначе остаток паузы в секундах (не отправлять)
+        """
+        pause = self.pause_remaining()
+        if pause > 0:
+            return pause
+
+        chat_bucket = self._chats.get(chat_id)
+        if chat_bucket is None:
+            if len(self._chats) > 10000:
+                # Забываем чаты, для которых ограничение уже не действует
+                self._chats = {key: bucket for key, bucket in self._chats.items() if not bucket.idle}
+            chat_bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate, 1)
+
+        await chat_bucket.acquire()
+        await self._global.acquire()
+        # Пока сообщение ждало в корзинах, мог прийти 429: проверяем паузу перед самой отправкой
+        return self.pause_remaining()
+
+
+def summarize_lag(results: List[DeliveryResult]) -> Dict[str, float]:
+    """Распределение задержки доставки: p50, p90, p99 и максимум (секунды)."""
+    lags = sorted(result.lag for result in results if result.lag is not None)
+    if not lags:
+        return {}
+
+    def percentile(p: float) -> float:
+        return lags[min(len(lags) - 1, int(p * len(lags)))]
+
+    return {
+        'p50': percentile(0.50),
+        'p90': percentile(0.90),
+        'p99': percentile(0.99),
+        'max': lags[-1],
+    }
+
+
+class NotificationDispatcher:
+    """Рассылка пачки сообщений пулом asyncio-воркеров."""
+
+    def __init__(
+        self,
+        bot: Bot,
+        limiter: Optional[TelegramRateLimiter] = None,
+        workers: int = config.DISPATCH_WORKERS
+    ):
+        self.bot = bot
+        self.limiter = limiter or telegram_rate_limiter
+        self.workers = workers
+
+    async def dispatch(self, messages: List[OutgoingMessage]) -> List[DeliveryResult]:
+        """
+        Отправить сообщения конкурентно.
+
+        Returns:
+            List[DeliveryResult]: Результаты в порядке исходных сообщений
+        """
+        if not messages:
+            return []
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for index, message in enumerate(messages):
+            queue.put_nowait((index, message))
+
+        results: List[Optional[DeliveryResult]] = [None] * len(messages)
+
+        async def worker():
+            while not queue.empty():
+                index, message = queue.get_nowait()
+                results[index] = await self._send(message)
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(messages)))))
+
+        sent = sum(1 for result in results if result.success)
+        lag = summarize_lag(results)
+        lag_text = ", ".join(f"{name}={value:.2f}с" for name, value in lag.items())
+        logger.info(f"Отправлено {sent}/{len(results)} уведомлений, задержка: {lag_text or 'нет данных'}")
+
+        return results
+
+    async def _send(self, message: OutgoingMessage) -> DeliveryResult:
+        """
+        Отправить одно сообщение, соблюдая лимиты.
+
+        Во время паузы 429 сообщение не отправляется и не ждет: результат
+        с retry_after возвращает его в очередь, чтобы пачка уложилась в аренду.
+        """
+        pause = await self.limiter.acquire(message.chat_id)
+        if pause > 0:
+            return DeliveryResult(
+                key=message.key,
+                success=False,
+                error="Отложено: пауза после ответа 429",
+                retry_after=pause
+            )
+
+        try:
+            sent = await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+            sent_at = datetime.now(pytz.UTC)
+            lag = (sent_at - message.due_at).total_seconds()
+            SEND_LATENCY.observe(lag)
+            return DeliveryResult(
+                key=message.key,
+                success=True,
+                message_id=sent.message_id,
+                sent_at=sent_at,
+                lag=lag
+            )
+
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать - притормаживаем всех воркеров
+            self.limiter.backoff(e.retry_after)
+            return DeliveryResult(key=message.key, success=False, error=str(e), retry_after=e.retry_after)
+
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сообщения в чат {message.chat_id}: {e}")
+            return DeliveryResult(key=message.key, success=False, error=str(e))
+
+
+telegram_rate_limiter = TelegramRateLimiter(
+    global_rate=config.TELEGRAM_GLOBAL_RATE,
+    per_chat_rate=config.TELEGRAM_PER_CHAT_RATE
+)
@@ -1,7 +1,7 @@
 """Сервис для отправки уведомлений о приеме лекарств."""
 import logging
-from datetime import datetime, date, timedelta, timezone
-from typing import List
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 import pytz
 from aiogram import Bot
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -9,14 +9,39 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database.base import async_session_maker
 from database.repository import (
     ScheduleRepository,
-    NotificationRepository
+    NotificationRepository,
+    OutboxRepository,
+    AdherenceRepository,
+    Shards
 )
 from database.models import MedicationSchedule
+from services.adherence_service import AdherenceDeltas
+from services.schedule_calculator import calculate_next_fire_at
+from services.timezones import get_timezone
+from services.notification_dispatcher import (
+    DeliveryResult,
+    NotificationDispatcher,
+    OutgoingMessage
+)
+from monitoring.metrics import (
+    SCHEDULES_SCANNED,
+    SCHEDULES_SCANNED_TOTAL,
+    SCHEDULES_DUE_TOTAL,
+    NOTIFICATIONS_TOTAL,
+    CATCH_UP_COMPLETED
+)
 from config import config
 
 logger = logging.getLogger(__name__)
 
 
+def record_results(kind: str, results: List[DeliveryResult]) -> None:
+    """Учесть результаты отправки в метриках."""
+    sent = sum(1 for result in results if result.success)
+    NOTIFICATIONS_TOTAL.inc(sent, kind=kind, status='sent')
+    NOTIFICATIONS_TOTAL.inc(len(results) - sent, kind=kind, status='failed')
+
+
 class NotificationService:
     """Сервис для управления уведомлениями."""
     
@@ -25,222 +50,368 @@ class NotificationService:
         self.bot = bot
         self.schedule_repo = ScheduleRepository(session)
         self.notification_repo = NotificationRepository(session)
+        self.outbox_repo = OutboxRepository(session)
+        self.adherence_repo = AdherenceRepository(session)
     
-    def should_take_today(self, schedule: MedicationSchedule, target_date: date) -> bool:
+    def advance_schedule(self, schedule: MedicationSchedule, oldest_allowed: datetime) -> None:
         """
-        Проверить, нужно ли принимать лекарство в указанную дату.
-        
-        Args:
-            schedule: Расписание приема
-            target_date: Дата для проверки
+        Перевести расписание на следующее срабатывание после текущего.
         
-        Returns:
-            bool: True если нужно принять в эту дату
+        Срабатывания раньше oldest_allowed все равно были бы пропущены
+        по лимиту опоздания, поэтому после долгого простоя расписание
+        сразу переходит к первому срабатыванию не раньше oldest_allowed.
         """
-        if schedule.end_date and target_date > schedule.end_date:
-            return False
-        
-        if target_date < schedule.start_date:
-            return False
-        
-        if schedule.frequency_type == 'daily':
-            return True
-        
-        if schedule.frequency_type == 'interval':
-            if not schedule.interval_days:
-                return False
-            
-            # Вычисляем количество дней с начала приема
-            days_since_start = (target_date - schedule.start_date).days
-            
-            # Проверяем, кратно ли количество дней интервалу
-            return days_since_start >= 0 and days_since_start % schedule.interval_days == 0
-        
-        return False
+        schedule.next_fire_at = calculate_next_fire_at(
+            schedule,
+            schedule.medication.user.timezone,
+            max(schedule.next_fire_at, oldest_allowed - timedelta(microseconds=1))
+        )
     
-    async def check_scheduled_medications(self) -> List[MedicationSchedule]:
+    async def check_scheduled_medications(
+        self,
+        schedule_ids: Optional[List[int]] = None,
+        now_utc: Optional[datetime] = None,
+        shards: Optional[Shards] = None
+    ) -> List[tuple[MedicationSchedule, datetime]]:
         """
         Проверить расписания и найти те, для которых нужно отправить уведомление.
         
+        Расписания выбираются по индексу next_fire_at: в выборку попадают все
+        наступившие срабатывания, сколько бы тиков ни было пропущено.
+        Срабатывания старше NOTIFICATION_MAX_LATENESS_MINUTES и уже отправленные
+        не отправляются и сразу переводятся на следующую дату.
+        
+        Args:
+            schedule_ids: Ограничить проверку указанными расписаниями
+            now_utc: Момент проверки (по умолчанию - текущее время)
+            shards: Ограничить проверку шардами этого процесса
+        
         Returns:
-            List[MedicationSchedule]: Список расписаний, требующих уведомления
+            List[tuple[MedicationSchedule, datetime]]: Расписания, требующие уведомления,
+                и время срабатывания в часовом поясе пользователя
         """
         # Получаем текущее время в UTC
-        now_utc = datetime.now(pytz.UTC)
+        now_utc = now_utc or datetime.now(pytz.UTC)
+        oldest_allowed = now_utc - timedelta(minutes=config.NOTIFICATION_MAX_LATENESS_MINUTES)
         
-        # Получаем все активные расписания
-        all_schedules = await self.schedule_repo.get_active_schedules()
+        # Получаем только расписания, время срабатывания которых наступило
+        due_schedules = await self.schedule_repo.get_due_schedules(now_utc, schedule_ids, shards)
+        SCHEDULES_SCANNED.set(len(due_schedules))
+        SCHEDULES_SCANNED_TOTAL.inc(len(due_schedules))
         
-        schedules_to_notify = []
+        local_times = self.local_fire_times(due_schedules)
+        candidates = []
+        to_advance = []
         
-        for schedule in all_schedules:
+        for schedule in due_schedules:
             try:
-                # Получаем часовой пояс пользователя
-                user_tz = pytz.timezone(schedule.medication.user.timezone)
-                
-                # Конвертируем текущее время в часовой пояс пользователя
-                now_user_tz = now_utc.astimezone(user_tz)
-                
-                # Получаем время приема из расписания
-                medication_time = schedule.time
-                
-                # Сравниваем время (только часы и минуты)
-                if now_user_tz.hour == medication_time.hour and \
-                   now_user_tz.minute == medication_time.minute:
-                    
-                    # Проверяем, нужно ли принимать сегодня
-                    target_date = now_user_tz.date()
-                    if self.should_take_today(schedule, target_date):
-                        # Проверяем, не было ли уже отправлено уведомление
-                        already_notified = await self.notification_repo.check_notification_sent_today(
-                            schedule.id,
-                            target_date
-                        )
-                        
-                        if not already_notified:
-                            schedules_to_notify.append(schedule)
+                if schedule.next_fire_at < oldest_allowed:
+                    # Напоминание безнадежно опоздало (например, бот был долго остановлен)
+                    logger.warning(
+                        f"Пропущено срабатывание расписания {schedule.id} "
+                        f"({schedule.next_fire_at.isoformat()}): опоздание больше "
+                        f"{config.NOTIFICATION_MAX_LATENESS_MINUTES} минут"
+                    )
+                    to_advance.append(schedule)
+                else:
+                    candidates.append((schedule, local_times[schedule.id]))
             
             except Exception as e:
                 logger.error(f"Ошибка при проверке расписания {schedule.id}: {e}")
                 continue
         
+        # Одним запросом отсекаем расписания, по которым уже есть лог за этот день
+        unnotified_ids = await self.notification_repo.get_unnotified_schedule_ids(
+            [(schedule.id, local_time.date()) for schedule, local_time in candidates]
+        )
+        
+        schedules_to_notify = []
+        for schedule, local_time in candidates:
+            if schedule.id in unnotified_ids:
+                schedules_to_notify.append((schedule, local_time))
+            else:
+                to_advance.append(schedule)
+        
+        if to_advance:
+            for schedule in to_advance:
+                self.advance_schedule(schedule, oldest_allowed)
+            await self.session.commit()
+        
+        SCHEDULES_DUE_TOTAL.inc(len(schedules_to_notify))
         return schedules_to_notify
     
-    async def send_notification(self, schedule: MedicationSchedule) -> tuple[bool, int | None, str | None]:
+    def local_fire_times(self, schedules: List[MedicationSchedule]) -> Dict[int, datetime]:
         """
-        Отправить уведомление пользователю.
+        Текущее срабатывание каждого расписания в часовом поясе пользователя.
+        
+        Расписания группируются по часовому поясу, а в пределах пояса перевод
+        выполняется один раз на каждый момент срабатывания: в тике большинство
+        расписаний одного пояса срабатывает в одну и ту же минуту.
         
         Returns:
-            Tuple[bool, int | None, str | None]: (успех, message_id, ошибка)
+            Dict[int, datetime]: ID расписания -> локальное время срабатывания
         """
-        try:
-            user = schedule.medication.user
-            medication = schedule.medication
-            
-            # Формируем текст уведомления
-            time_str = schedule.time.strftime("%H:%M")
-            frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через каждые {schedule.interval_days} дней"
-            
-            notification_text = (
-                "🔔 Напоминание о приеме лекарства!\n\n"
-                f"💊 {medication.name}\n"
-                f"⏰ Время: {time_str}\n"
-                f"💊 Количество: {schedule.dose} препарата\n"
-                f"📅 Периодичность: {frequency_text}\n"
-            )
-            
-            if medication.description:
-                notification_text += f"📝 {medication.description}\n"
-            
-            notification_text += "\n✅ Не забудьте принять лекарство!"
-            
-            # Отправляем простое сообщение без кнопок
-            message = await self.bot.send_message(
-                chat_id=user.id,
-                text=notification_text
-            )
-            
-            return True, message.message_id, None
+        by_timezone: Dict[str, List[MedicationSchedule]] = {}
+        for schedule in schedules:
+            by_timezone.setdefault(schedule.medication.user.timezone, []).append(schedule)
+        
+        local_times = {}
+        for timezone_name, zone_schedules in by_timezone.items():
+            user_tz = get_timezone(timezone_name)
+            converted: Dict[datetime, datetime] = {}
+            for schedule in zone_schedules:
+                local_time = converted.get(schedule.next_fire_at)
+                if local_time is None:
+                    local_time = converted[schedule.next_fire_at] = schedule.next_fire_at.astimezone(user_tz)
+                local_times[schedule.id] = local_time
         
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления для расписания {schedule.id}: {e}")
-            return False, None, str(e)
+        return local_times
     
-    async def log_notification(
+    def build_notification_text(self, schedule: MedicationSchedule) -> str:
+        """Сформировать текст уведомления."""
+        medication = schedule.medication
+        time_str = schedule.time.strftime("%H:%M")
+        frequency_text = "каждый день" if schedule.frequency_type == 'daily' else f"через каждые {schedule.interval_days} дней"
+        
+        notification_text = (
+            "🔔 Напоминание о приеме лекарства!\n\n"
+            f"💊 {medication.name}\n"
+            f"⏰ Время: {time_str}\n"
+            f"💊 Количество: {schedule.dose} препарата\n"
+            f"📅 Периодичность: {frequency_text}\n"
+        )
+        
+        if medication.description:
+            notification_text += f"📝 {medication.description}\n"
+        
+        notification_text += "\n✅ Не забудьте принять лекарство!"
+        return notification_text
+    
+    def next_attempt_at(self, attempts: int, now: datetime) -> Optional[datetime]:
+        """
+        Время следующей попытки после attempts неудачных (None - попытки исчерпаны).
+        
+        Первая повторная попытка - через RETRY_INTERVALS[0] минут, вторая -
+        через RETRY_INTERVALS[1] и т.д., но не больше MAX_RETRY_ATTEMPTS.
+        """
+        if attempts > config.MAX_RETRY_ATTEMPTS or attempts > len(config.RETRY_INTERVALS):
+            return None
+        return now + timedelta(minutes=config.RETRY_INTERVALS[attempts - 1])
+    
+    async def process_notifications(
         self,
-        schedule: MedicationSchedule,
-        scheduled_time: datetime,
-        success: bool,
-        message_id: int | None = None,
-        error_message: str | None = None
+        schedule_ids: Optional[List[int]] = None,
+        now_utc: Optional[datetime] = None,
+        shards: Optional[Shards] = None
     ) -> int:
         """
-        Записать лог уведомления в БД.
+        Поставить наступившие уведомления (все или только указанные) в outbox.
+        
+        Логи со статусом 'pending', строки outbox и новые next_fire_at
+        фиксируются одним commit, поэтому падение процесса не теряет
+        и не дублирует напоминания. Отправляют их обработчики outbox
+        (dispatch_outbox_batch), так что медленный Telegram не задерживает
+        поиск наступивших расписаний.
         
         Returns:
-            int: ID созданного лога
+            int: Количество поставленных в очередь уведомлений
         """
-        log = await self.notification_repo.create_log(schedule.id, scheduled_time)
-        
-        if success:
-            status = 'sent'
-            await self.notification_repo.update_log_status(
-                log.id,
-                status,
-                message_id=message_id
-            )
-        else:
-            status = 'failed'
-            await self.notification_repo.update_log_status(
-                log.id,
-                status,
-                error_message=error_message
-            )
-        
-        return log.id
+        now_utc = now_utc or datetime.now(pytz.UTC)
+        oldest_allowed = now_utc - timedelta(minutes=config.NOTIFICATION_MAX_LATENESS_MINUTES)
+        schedules = await self.check_scheduled_medications(schedule_ids, now_utc, shards)
+        if not schedules:
+            return 0
+        
+        logs = []
+        messages = {}
+        # Локальное время уже вычислено при проверке
+        for schedule, scheduled_time in schedules:
+            try:
+                logs.append({
+                    'schedule_id': schedule.id,
+                    'scheduled_time': scheduled_time,
+                    'local_date': scheduled_time.date(),
+                    'status': 'pending',
+                    'attempts': 0,
+                })
+                messages[schedule.id] = {
+                    'local_date': scheduled_time.date(),
+                    'chat_id': schedule.medication.user.id,
+                    'medication_id': schedule.medication_id,
+                    'message_text': self.build_notification_text(schedule),
+                    'due_at': schedule.next_fire_at,
+                    'next_attempt_at': schedule.next_fire_at,
+                }
+                
+                # Переводим расписание на следующее срабатывание,
+                # изменение фиксируется вместе с логами
+                self.advance_schedule(schedule, oldest_allowed)
+            
+            except Exception as e:
+                logger.error(f"Ошибка при подготовке уведомления для расписания {schedule.id}: {e}")
+        
+        # Лог уже мог появиться в параллельном проходе - такие расписания не ставятся в очередь
+        created = await self.notification_repo.create_logs(logs)
+        await self.outbox_repo.enqueue([
+            {'notification_log_id': log_id, **messages[schedule_id]}
+            for schedule_id, log_id in created.items()
+        ])
+        
+        deltas = AdherenceDeltas()
+        for schedule_id in created:
+            message = messages[schedule_id]
+            deltas.scheduled(message['chat_id'], message['medication_id'], message['local_date'])
+        await self.adherence_repo.apply(deltas.rows())
+        
+        await self.session.commit()
+        return len(created)
     
-    async def schedule_retry(
-        self,
-        notification_log_id: int,
-        attempt_number: int
-    ) -> bool:
+    async def catch_up(self, shards: Optional[Shards] = None) -> None:
         """
-        Запланировать повторную попытку отправки.
+        Полный проход по всем наступившим срабатываниям.
+        
+        Отдельная отметка прохода не нужна: next_fire_at каждого расписания
+        сам служит отметкой - срабатывание переводится вперед только после
+        постановки в очередь или пропуска по лимиту опоздания. Поэтому
+        пропущенные движком тики (перезапуск, деплой, зависание) догоняет
+        выборка next_fire_at <= now.
         
         Args:
-            notification_log_id: ID лога уведомления
-            attempt_number: Номер попытки (начиная с 1)
+            shards: Обработать только шарды этого процесса
+        """
+        now_utc = datetime.now(pytz.UTC)
+        await self.process_notifications(now_utc=now_utc, shards=shards)
+        CATCH_UP_COMPLETED.set(now_utc.timestamp())
+    
+    async def dispatch_outbox_batch(self, limit: int) -> int:
+        """
+        Отправить одну пачку уведомлений из outbox.
+        
+        Пачка захватывается арендой (OutboxRepository.claim) в отдельной
+        короткой транзакции: во время отправки блокировки строк и соединение
+        пула не удерживаются. Затем сообщения отправляются конкурентно.
+        Отправленные и исчерпавшие попытки строки удаляются, остальные
+        переносятся на следующую попытку; не отправленные из-за паузы 429
+        возвращаются в очередь на конец паузы без учета попытки; логи и очередь обновляются массово
+        одним commit, вместе с приращениями сводки adherence_daily.
+        
+        Args:
+            limit: Размер пачки
         
         Returns:
-            bool: Успех создания записи о повторной попытке
+            int: Количество захваченных уведомлений
         """
-        if attempt_number > len(config.RETRY_INTERVALS):
-            logger.warning(f"Превышено максимальное количество попыток для лога {notification_log_id}")
-            return False
-        
-        # Вычисляем время следующей попытки
-        retry_interval_minutes = config.RETRY_INTERVALS[attempt_number - 1]
-        retry_at = datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(minutes=retry_interval_minutes)
-        
-        try:
-            await self.notification_repo.create_retry(
-                notification_log_id,
-                retry_at,
-                attempt_number
-            )
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при создании записи о повторной попытке: {e}")
-            return False
-    
-    async def process_notifications(self):
-        """Обработать все запланированные уведомления."""
-        schedules = await self.check_scheduled_medications()
+        now = datetime.now(pytz.UTC)
+        claimed = await self.outbox_repo.claim(now, limit, config.OUTBOX_CLAIM_SECONDS)
+        # Commit снимает блокировки: строки защищает аренда, соединение возвращается в пул
+        await self.session.commit()
+        if not claimed:
+            return 0
+        rows = [row for row, _ in claimed]
+        attempt_at = {row.id: claimed_at for row, claimed_at in claimed}
         
-        for schedule in schedules:
-            try:
-                # Получаем текущее время для логирования
-                now_utc = datetime.now(pytz.UTC)
-                user_tz = pytz.timezone(schedule.medication.user.timezone)
-                now_user_tz = now_utc.astimezone(user_tz)
-                
-                # Отправляем уведомление
-                success, message_id, error = await self.send_notification(schedule)
-                
-                # Логируем
-                log_id = await self.log_notification(
-                    schedule,
-                    now_user_tz,
-                    success,
-                    message_id,
-                    error
+        log_results = []
+        finished_ids = []
+        deltas = AdherenceDeltas()
+        
+        # Первая попытка, опоздавшая больше лимита (например, обработчики
+        # долго не работали), не отправляется - как и при поиске расписаний
+        oldest_allowed = now - timedelta(minutes=config.NOTIFICATION_MAX_LATENESS_MINUTES)
+        to_send = []
+        for row in rows:
+            if row.attempts == 0 and row.due_at < oldest_allowed:
+                log_results.append({
+                    'log_id': row.notification_log_id,
+                    'local_date': row.local_date,
+                    'status': 'failed',
+                    'attempts': 0,
+                    'sent_at': None,
+                    'message_id': None,
+                    'error_message': f"Не отправлено: опоздание больше {config.NOTIFICATION_MAX_LATENESS_MINUTES} минут",
+                })
+                finished_ids.append(row.id)
+                deltas.failed(row.chat_id, row.medication_id, row.local_date, 0)
+            else:
+                to_send.append(row)
+        
+        rows_by_id = {row.id: row for row in to_send}
+        results = await NotificationDispatcher(self.bot).dispatch([
+            OutgoingMessage(key=row.id, chat_id=row.chat_id, text=row.message_text, due_at=attempt_at[row.id])
+            for row in to_send
+        ])
+        
+        rescheduled = []
+        deferred = []
+        first_results = []
+        retry_results = []
+        
+        for result in results:
+            row = rows_by_id[result.key]
+            if result.retry_after is not None:
+                # Пауза 429: строка возвращается в очередь после паузы, попытка не засчитывается
+                retry_at = datetime.now(pytz.UTC) + timedelta(seconds=result.retry_after)
+                deferred.append((row.id, row.attempts, retry_at))
+                continue
+            
+            attempts = row.attempts + 1
+            (first_results if row.attempts == 0 else retry_results).append(result)
+            
+            if result.success:
+                log_results.append({
+                    'log_id': row.notification_log_id,
+                    'local_date': row.local_date,
+                    'status': 'sent',
+                    'attempts': attempts,
+                    'sent_at': result.sent_at,
+                    'message_id': result.message_id,
+                    'error_message': None,
+                })
+                finished_ids.append(row.id)
+                deltas.sent(
+                    row.chat_id, row.medication_id, row.local_date, attempts,
+                    (result.sent_at - row.due_at).total_seconds()
                 )
-                
-                # Если не удалось отправить, планируем повторную попытку
-                if not success:
-                    await self.schedule_retry(log_id, 1)
-                    logger.info(f"Запланирована повторная попытка для лога {log_id}")
+                continue
             
-            except Exception as e:
-                logger.error(f"Ошибка при обработке уведомления для расписания {schedule.id}: {e}")
-
+            next_attempt_at = self.next_attempt_at(attempts, now)
+            if next_attempt_at is not None:
+                # Планируем следующую попытку
+                log_results.append({
+                    'log_id': row.notification_log_id,
+                    'local_date': row.local_date,
+                    'status': 'failed',
+                    'attempts': attempts,
+                    'sent_at': None,
+                    'message_id': None,
+                    'error_message': result.error,
+                })
+                rescheduled.append((row.id, attempts, next_attempt_at))
+            else:
+                # Превышено максимальное количество попыток
+                log_results.append({
+                    'log_id': row.notification_log_id,
+                    'local_date': row.local_date,
+                    'status': 'failed',
+                    'attempts': attempts,
+                    'sent_at': None,
+                    'message_id': None,
+                    'error_message': f"Превышено максимальное количество попыток ({config.MAX_RETRY_ATTEMPTS})",
+                })
+                finished_ids.append(row.id)
+                deltas.failed(row.chat_id, row.medication_id, row.local_date, attempts)
+                logger.warning(f"Превышено максимальное количество попыток для лога {row.notification_log_id}")
+        
+        record_results('tick', first_results)
+        record_results('retry', retry_results)
+        await self.notification_repo.update_log_results(log_results)
+        await self.outbox_repo.reschedule(rescheduled + deferred)
+        await self.outbox_repo.delete(finished_ids)
+        await self.adherence_repo.apply(deltas.rows())
+        await self.session.commit()
+        
+        sent = sum(1 for result in results if result.success)
+        logger.info(
+            f"Outbox: захвачено {len(rows)}, отправлено {sent}, "
+            f"перенесено на повторную попытку {len(rescheduled)}, отложено из-за 429 {len(deferred)}"
+        )
+        return len(rows)
@@ -0,0 +1,108 @@
+"""
+Развертывание расписаний в даты приема.
+
+Единая реализация правил daily/interval и дат начала/окончания для плана
+приема, быстрого плана, статистики и планировщика. Даты приема каждого
+расписания вычисляются арифметикой (первая дата в диапазоне и шаг), без
+перебора дней, а результат хранится в компактных массивах array.
+"""
+from array import array
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+from database.models import MedicationSchedule
+
+
+def step_days(schedule: MedicationSchedule) -> Optional[int]:
+    """Шаг между соседними датами приема в днях (None - расписание не срабатывает)."""
+    if schedule.frequency_type == 'daily':
+        return 1
+    if schedule.frequency_type == 'interval' and schedule.interval_days:
+        return schedule.interval_days
+    return None
+
+
+def first_occurrence_on_or_after(schedule: MedicationSchedule, from_date: date) -> Optional[date]:
+    """Найти первую дату приема не раньше from_date."""
+    step = step_days(schedule)
+    if step is None:
+        return None
+
+    candidate = max(from_date, schedule.start_date)
+    # Выравниваем дату по сетке интервала от даты начала
+    offset = (candidate - schedule.start_date).days % step
+    if offset:
+        candidate += timedelta(days=step - offset)
+
+    if schedule.end_date and candidate > schedule.end_date:
+        return None
+
+    return candidate
+
+
+class Occurrences:
+    """
+    Приемы набора расписаний в диапазоне дат.
+
+    Пара (schedule_indexes[i], day_offsets[i]) - прием расписания
+    schedules[schedule_indexes[i]] в день start + day_offsets[i].
+    Пары упорядочены по дню, внутри дня - в порядке исходных расписаний.
+    """
+
+    def __init__(self, schedules: Sequence[MedicationSchedule], start: date, days: int,
+                 schedule_indexes: array, day_offsets: array):
+        self.schedules = schedules
+        self.start = start
+        self.days = days
+        self.schedule_indexes = schedule_indexes
+        self.day_offsets = day_offsets
+
+    def by_day(self) -> List[List[int]]:
+        """Индексы расписаний, срабатывающих в каждый день диапазона (список длины days)."""
+        result: List[List[int]] = [[] for _ in range(self.days)]
+        for index, offset in zip(self.schedule_indexes, self.day_offsets):
+            result[offset].append(index)
+        return result
+
+
+def expand(schedules: Sequence[MedicationSchedule], start: date, days: int) -> Occurrences:
+    """
+    Развернуть расписания в даты приема на days дней начиная со start.
+
+    Args:
+        schedules: Расписания
+        start: Первый день диапазона
+        days: Длина диапазона в днях
+
+    Returns:
+        Occurrences: Приемы, упорядоченные по дню
+    """
+    end = start + timedelta(days=days - 1)
+    # Смещения дней приема каждого расписания: range считается без перебора дат
+    ranges = []
+    for index, schedule in enumerate(schedules):
+        first = first_occurrence_on_or_after(schedule, start)
+        if first is None or first > end:
+            continue
+        last = min(end, schedule.end_date) if schedule.end_date else end
+        ranges.append((index, range((first - start).days, (last - start).days + 1, step_days(schedule))))
+
+    # Раскладываем по дням подсчетом: сначала размеры дней, затем позиции
+    day_sizes = array('I', bytes(4 * (days + 1)))
+    for _, offsets in ranges:
+        for offset in offsets:
+            day_sizes[offset + 1] += 1
+    for day in range(days):
+        day_sizes[day + 1] += day_sizes[day]
+
+    total = day_sizes[days]
+    schedule_indexes = array('I', bytes(4 * total))
+    day_offsets = array('H', bytes(2 * total))
+    for index, offsets in ranges:
+        for offset in offsets:
+            position = day_sizes[offset]
+            schedule_indexes[position] = index
+            day_offsets[position] = offset
+            day_sizes[offset] += 1
+
+    return Occurrences(schedules, start, days, schedule_indexes, day_offsets)
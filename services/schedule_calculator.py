@@ -0,0 +1,45 @@
+"""Расчет времени следующего срабатывания расписаний."""
+from datetime import datetime, timedelta
+from typing import Optional
+import pytz
+
+from database.models import MedicationSchedule
+from services.occurrences import first_occurrence_on_or_after, step_days
+from services.timezones import get_timezone, localize
+
+
+def calculate_next_fire_at(
+    schedule: MedicationSchedule,
+    timezone_name: str,
+    after: datetime
+) -> Optional[datetime]:
+    """
+    Вычислить ближайший момент срабатывания расписания строго после after.
+
+    Args:
+        schedule: Расписание приема
+        timezone_name: Часовой пояс пользователя
+        after: Момент времени (aware), после которого ищется срабатывание
+
+    Returns:
+        Optional[datetime]: Момент срабатывания в UTC или None, если приемов больше нет
+    """
+    user_tz = get_timezone(timezone_name)
+    after_user_tz = after.astimezone(user_tz)
+
+    target_date = first_occurrence_on_or_after(schedule, after_user_tz.date())
+    if target_date is None:
+        return None
+
+    fire_at = localize(user_tz, datetime.combine(target_date, schedule.time))
+    if fire_at <= after:
+        # Сегодняшнее время приема уже прошло - переходим к следующей дате
+        target_date = first_occurrence_on_or_after(
+            schedule,
+            target_date + timedelta(days=step_days(schedule))
+        )
+        if target_date is None:
+            return None
+        fire_at = localize(user_tz, datetime.combine(target_date, schedule.time))
+
+    return fire_at.astimezone(pytz.UTC)
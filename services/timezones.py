@@ -0,0 +1,32 @@
+"""Часовые пояса пользователей и перевод локального времени с учетом DST."""
+from datetime import datetime
+import pytz
+
+
+def get_timezone(name: str) -> pytz.BaseTzInfo:
+    """
+    Получить объект часового пояса по имени.
+    
+    pytz сам кэширует разобранные зоны, поэтому объект зоны строится
+    один раз на процесс.
+    """
+    return pytz.timezone(name)
+
+
+def localize(user_tz: pytz.BaseTzInfo, local_time: datetime) -> datetime:
+    """
+    Привязать локальное время приема к часовому поясу.
+    
+    - Время попадает в "дыру" перехода на летнее время (например, 02:30,
+      когда часы переводятся с 02:00 на 03:00) - напоминание сдвигается
+      вперед на величину перехода и срабатывает один раз (в 03:30).
+    - Время повторяется при переходе на зимнее время - выбирается первое
+      из двух срабатываний, второе не происходит.
+    """
+    try:
+        return user_tz.localize(local_time, is_dst=None)
+    except pytz.NonExistentTimeError:
+        # Смещение до перехода: момент приходится на то же время после перевода часов
+        return user_tz.normalize(user_tz.localize(local_time, is_dst=False))
+    except pytz.AmbiguousTimeError:
+        return user_tz.localize(local_time, is_dst=True)